@@ -8,9 +8,14 @@ and operation counting — no hardware measurements required.
 Supported languages: Python, Java, C, C++, JavaScript
 Extensible architecture for adding more languages.
 
+Java/C/C++/JavaScript are analyzed with tree-sitter when the optional
+`tree_sitter` bindings and a grammar (a `tree_sitter_<lang>` package or a
+vendored library in ./parsers) are available, otherwise with regexes.
+
 Usage:
   python carbon_footprint_estimator.py                  # interactive text input
   python carbon_footprint_estimator.py --file mycode.py # analyze a file
+  python carbon_footprint_estimator.py --file nb.ipynb  # notebook, cost per cell
   python carbon_footprint_estimator.py --language java   # specify language
 
 Output is always saved to carbon_footprint_result.json
@@ -20,15 +25,24 @@ Date: 2026-02-18
 """
 
 import ast
+import asyncio
+import io
+import math
 import re
 import sys
 import os
 import json
+import weakref
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Set, Tuple, Union
 from enum import Enum
 
+try:
+    import tree_sitter  # optional: structural analysis for C-family languages
+except ImportError:
+    tree_sitter = None
+
 
 # =============================================================================
 # CONSTANTS & CONFIGURATION
@@ -75,36 +89,95 @@ CARBON_INTENSITY_G_PER_KWH  = 475           # Global average gCO2/kWh
 DEFAULT_LOOP_ITERATIONS      = 100
 DEFAULT_RECURSION_DEPTH       = 10
 
+# Upper bound on estimated activations of a single recursive function
+# (keeps exponential recursion estimates finite)
+MAX_RECURSION_ACTIVATIONS     = 1_000_000
+
+# Operation counts saturate here (int64 max) instead of growing into huge
+# integers under deep loop nests; results that reach it are flagged unbounded
+MAX_OPERATION_COUNT           = 2 ** 63 - 1
+
+# Memory model (Python): CPython 64-bit container sizes as (header bytes,
+# bytes per element). Only container storage is counted; the element objects
+# are counted where they are allocated (or are shared, e.g. small ints).
+CONTAINER_BYTES: Dict[str, Tuple[int, int]] = {
+    "list": (56, 8), "tuple": (40, 8), "deque": (624, 8),
+    "set": (216, 32), "frozenset": (216, 32), "dict": (64, 40),
+    "str": (49, 1), "bytes": (33, 1), "bytearray": (57, 1),
+    "generator": (208, 0), "ndarray": (112, 8),
+}
+# Element bytes of array dtypes other than the 8-byte default (float64/int64)
+DTYPE_BYTES: Dict[str, int] = {
+    "bool": 1, "bool_": 1, "int8": 1, "uint8": 1,
+    "int16": 2, "uint16": 2, "float16": 2, "half": 2,
+    "int32": 4, "uint32": 4, "float32": 4, "single": 4,
+    "complex128": 16, "cdouble": 16,
+}
+
 # Output JSON file path
 OUTPUT_JSON_PATH = "carbon_footprint_result.json"
 
+# Source file extension -> language
+LANGUAGE_EXTENSIONS: Dict[str, str] = {
+    ".py": "python",
+    ".java": "java",
+    ".c": "c",
+    ".cpp": "cpp", ".cc": "cpp", ".cxx": "cpp", ".hpp": "cpp",
+    ".js": "javascript", ".mjs": "javascript",
+    ".ts": "javascript",  # TypeScript parsed similarly
+    ".ipynb": "python",   # code cells of Jupyter notebooks (see read_notebook)
+}
+
 
 # =============================================================================
 # DATA MODELS
 # =============================================================================
 
+def saturating_mul(a: int, b: int) -> int:
+    """a * b clamped to MAX_OPERATION_COUNT (for multiplying loop counts)."""
+    product = a * b
+    return product if product < MAX_OPERATION_COUNT else MAX_OPERATION_COUNT
+
+
 @dataclass
 class OperationCount:
-    """Tracks counts of each operation type."""
+    """
+    Tracks counts of each operation type. Counts saturate at
+    MAX_OPERATION_COUNT; `saturated` records that one did.
+    """
     counts: Dict[OpType, int] = field(default_factory=lambda: {op: 0 for op in OpType})
+    saturated: bool = False
 
     def add(self, op_type: OpType, count: int = 1):
-        self.counts[op_type] = self.counts.get(op_type, 0) + count
+        total = self.counts.get(op_type, 0) + count
+        if total >= MAX_OPERATION_COUNT:
+            total = MAX_OPERATION_COUNT
+            self.saturated = True
+        self.counts[op_type] = total
 
     def merge(self, other: "OperationCount"):
         for op_type, count in other.counts.items():
-            self.counts[op_type] = self.counts.get(op_type, 0) + count
+            if count:
+                self.add(op_type, count)
+        if other.saturated:
+            self.saturated = True
 
     def scale(self, factor: int) -> "OperationCount":
         """Return a new OperationCount scaled by factor (for loops)."""
-        scaled = OperationCount()
+        scaled = OperationCount(saturated=self.saturated)
         for op_type, count in self.counts.items():
-            scaled.counts[op_type] = count * factor
+            scaled.add(op_type, saturating_mul(count, factor))
         return scaled
 
     @property
     def total_weighted(self) -> int:
-        return sum(count * OPERATION_WEIGHTS[op] for op, count in self.counts.items())
+        total = sum(count * OPERATION_WEIGHTS[op] for op, count in self.counts.items())
+        return total if total < MAX_OPERATION_COUNT else MAX_OPERATION_COUNT
+
+    @property
+    def unbounded(self) -> bool:
+        """True when the counts are a saturated lower bound rather than an estimate."""
+        return self.saturated or self.total_weighted >= MAX_OPERATION_COUNT
 
     @property
     def total_raw(self) -> int:
@@ -114,6 +187,65 @@ class OperationCount:
         return {op.value: count for op, count in self.counts.items() if count > 0}
 
 
+@dataclass(frozen=True, order=True)
+class Complexity:
+    """
+    Asymptotic complexity class in the input size n: O(n^degree * log^log_power n),
+    or exponential. Field order makes comparison follow growth rate.
+    """
+    exponential: bool = False
+    degree: int = 0
+    log_power: int = 0
+
+    def __mul__(self, other: "Complexity") -> "Complexity":
+        """Nesting: a loop of class `self` around a body of class `other`."""
+        return Complexity(self.exponential or other.exponential,
+                          self.degree + other.degree, self.log_power + other.log_power)
+
+    def __str__(self) -> str:
+        if self.exponential:
+            return "O(2^n)"
+        terms = []
+        if self.degree:
+            terms.append("n" if self.degree == 1 else f"n^{self.degree}")
+        if self.log_power:
+            terms.append("log n" if self.log_power == 1 else f"log^{self.log_power} n")
+        return f"O({' '.join(terms) or '1'})"
+
+    @classmethod
+    def parse(cls, text: str) -> "Complexity":
+        """Parse '1', 'log n', 'n', 'n log n', 'n^2', 'O(n^3)', '2^n', 'exp', ..."""
+        spec = text.strip().lower().replace(" ", "").replace("**", "^")
+        if spec.startswith("o(") and spec.endswith(")"):
+            spec = spec[2:-1]
+        if spec in ("exp", "exponential", "2^n"):
+            return cls(exponential=True)
+        if spec == "1":
+            return cls()
+        match = re.fullmatch(r'(n(?:\^(\d+))?)?(log(?:\^(\d+))?n)?', spec)
+        if not spec or match is None:
+            raise ValueError(f"Unrecognized complexity class: {text!r}")
+        degree = int(match.group(2) or 1) if match.group(1) else 0
+        log_power = int(match.group(4) or 1) if match.group(3) else 0
+        return cls(degree=degree, log_power=log_power)
+
+
+COMPLEXITY_CONSTANT    = Complexity()
+COMPLEXITY_LOGARITHMIC = Complexity(log_power=1)
+COMPLEXITY_LINEAR      = Complexity(degree=1)
+COMPLEXITY_EXPONENTIAL = Complexity(exponential=True)
+
+
+@dataclass
+class MemoryEstimate:
+    """Estimated heap use: total bytes allocated over a run and peak live bytes."""
+    allocated_bytes: int = 0
+    peak_bytes: int = 0
+
+    def to_dict(self) -> dict:
+        return {"allocated_bytes": self.allocated_bytes, "peak_bytes": self.peak_bytes}
+
+
 @dataclass
 class FunctionAnalysis:
     """Analysis result for a single function/method."""
@@ -124,6 +256,10 @@ class FunctionAnalysis:
     max_nesting: int = 0
     is_recursive: bool = False
     calls: List[str] = field(default_factory=list)
+    recursion: Optional["RecursionProfile"] = None
+    complexity: Complexity = COMPLEXITY_CONSTANT
+    # Only analyzers with a memory model (PythonAnalyzer) fill this in
+    memory: Optional[MemoryEstimate] = None
 
     @property
     def weighted_ops(self) -> int:
@@ -142,6 +278,57 @@ class FunctionAnalysis:
         return self.energy_kwh * CARBON_INTENSITY_G_PER_KWH
 
 
+@dataclass
+class EnergyFinding:
+    """A known-wasteful code pattern and the weighted ops fixing it would save."""
+    rule: str
+    line: int
+    function: Optional[str]
+    message: str
+    suggestion: str
+    # How many times the flagged code runs (its loop multiplier)
+    executions: int
+    estimated_savings: int
+
+    @property
+    def savings_joules(self) -> float:
+        return self.estimated_savings * ENERGY_PER_OPERATION_JOULES
+
+    def to_dict(self) -> dict:
+        return {
+            "rule": self.rule,
+            "line": self.line,
+            "function": self.function,
+            "message": self.message,
+            "suggestion": self.suggestion,
+            "executions": self.executions,
+            "estimated_savings_weighted_ops": self.estimated_savings,
+            "estimated_savings_joules": self.savings_joules,
+        }
+
+
+@dataclass
+class NotebookCell:
+    """A notebook code cell and the lines it occupies in the concatenated source."""
+    index: int                          # position in the notebook, markdown cells included
+    first_line: int
+    line_count: int
+    execution_count: Optional[int] = None
+    weighted_ops: int = 0
+    # Why the cell's code was left out of the analysis (non-Python magic, syntax error)
+    skipped: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "index": self.index,
+            "first_line": self.first_line,
+            "line_count": self.line_count,
+            "execution_count": self.execution_count,
+            "weighted_ops": self.weighted_ops,
+            **({"skipped": self.skipped} if self.skipped else {}),
+        }
+
+
 @dataclass
 class AnalysisResult:
     """Complete analysis result for a source file."""
@@ -150,6 +337,21 @@ class AnalysisResult:
     functions: List[FunctionAnalysis] = field(default_factory=list)
     global_operations: OperationCount = field(default_factory=OperationCount)
     assumptions: List[str] = field(default_factory=list)
+    # Sparse line -> weighted ops map, only populated when line tracking is on
+    line_costs: Optional[Dict[int, int]] = None
+    # Frame stack (class, function, loop@line, ...) -> own weighted ops, same condition
+    stack_costs: Optional[Dict[Tuple[str, ...], int]] = None
+    # Energy profiles reported alongside the default model
+    energy_profiles: Optional[Dict[str, "EnergyProfile"]] = None
+    # Op counts for profiles whose loop/recursion heuristics differ from this analysis
+    profile_operations: Dict[str, OperationCount] = field(default_factory=dict)
+    # Energy anti-patterns, largest estimated saving first
+    findings: List[EnergyFinding] = field(default_factory=list)
+    # Module-level memory estimate, when the analyzer has a memory model
+    global_memory: Optional[MemoryEstimate] = None
+    # Code cells of a notebook with their weighted ops; line numbers refer
+    # to the cells concatenated in notebook order
+    cells: Optional[List[NotebookCell]] = None
 
     @property
     def total_operations(self) -> OperationCount:
@@ -175,12 +377,53 @@ class AnalysisResult:
     def carbon_grams(self) -> float:
         return self.energy_kwh * CARBON_INTENSITY_G_PER_KWH
 
+    @property
+    def unbounded(self) -> bool:
+        """True when some operation count saturated at MAX_OPERATION_COUNT."""
+        return self.total_operations.unbounded
+
+    @property
+    def memory(self) -> Optional[MemoryEstimate]:
+        """
+        Bytes allocated by the module and all functions; the peak assumes
+        module-level data stays live while the hungriest function runs.
+        """
+        if self.global_memory is None:
+            return None
+        function_memory = [f.memory for f in self.functions if f.memory is not None]
+        allocated = self.global_memory.allocated_bytes
+        for memory in function_memory:
+            allocated = min(allocated + memory.allocated_bytes, MAX_OPERATION_COUNT)
+        peak = self.global_memory.peak_bytes + max((m.peak_bytes for m in function_memory), default=0)
+        return MemoryEstimate(allocated, min(peak, MAX_OPERATION_COUNT))
+
     @property
     def hotspots(self) -> List[FunctionAnalysis]:
         """Top 5 functions by weighted operations."""
         return sorted(self.functions, key=lambda f: f.weighted_ops, reverse=True)[:5]
 
+    def profile_report(self) -> Dict[str, dict]:
+        """Energy and carbon under each attached energy profile."""
+        if not self.energy_profiles:
+            return {}
+        totals = self.total_operations
+        return {
+            name: profile.report(self.profile_operations.get(name, totals))
+            for name, profile in self.energy_profiles.items()
+        }
+
+    def cell_at(self, line: int) -> Optional[NotebookCell]:
+        """The notebook cell containing a line of the concatenated source."""
+        for cell in self.cells or []:
+            if cell.first_line <= line < cell.first_line + cell.line_count:
+                return cell
+        return None
+
     def to_dict(self) -> dict:
+        def cell_of(line: int) -> dict:
+            cell = self.cell_at(line) if self.cells is not None else None
+            return {"cell": cell.index} if cell is not None else {}
+
         return {
             "language": self.language,
             "file_path": self.file_path,
@@ -189,15 +432,22 @@ class AnalysisResult:
             "energy_joules": self.energy_joules,
             "energy_kWh": self.energy_kwh,
             "carbon_grams_CO2": self.carbon_grams,
+            "unbounded": self.unbounded,
+            **({"memory": self.memory.to_dict()} if self.global_memory is not None else {}),
             "functions": [
                 {
                     "name": f.name,
                     "line": f.line_number,
+                    **cell_of(f.line_number),
                     "weighted_ops": f.weighted_ops,
                     "energy_joules": f.energy_joules,
                     "carbon_grams_CO2": f.carbon_grams,
                     "is_recursive": f.is_recursive,
+                    **({"recursion": f.recursion.to_dict()} if f.recursion else {}),
                     "max_loop_nesting": f.max_nesting,
+                    "complexity": str(f.complexity),
+                    **({"unbounded": True} if f.operations.unbounded else {}),
+                    **({"memory": f.memory.to_dict()} if f.memory is not None else {}),
                     "operations": f.operations.summary_dict(),
                 }
                 for f in self.functions
@@ -213,10 +463,133 @@ class AnalysisResult:
                 }
                 for f in self.hotspots
             ],
+            "findings": [{**finding.to_dict(), **cell_of(finding.line)} for finding in self.findings],
+            **({"cells": [cell.to_dict() for cell in self.cells]} if self.cells is not None else {}),
             "assumptions": self.assumptions,
+            **({"line_costs": {str(line): cost for line, cost in sorted(self.line_costs.items())}}
+               if self.line_costs is not None else {}),
+            **({"energy_profiles": self.profile_report()} if self.energy_profiles else {}),
+        }
+
+
+# =============================================================================
+# ENERGY MODEL PROFILES
+# =============================================================================
+
+# Settings an energy profile may override (everything else comes from the defaults)
+ENERGY_PROFILE_KEYS = {
+    "operation_weights", "energy_per_operation_joules", "carbon_intensity_g_per_kwh",
+    "default_loop_iterations", "default_recursion_depth", "extends",
+}
+
+
+@dataclass
+class EnergyProfile:
+    """
+    Named hardware/region cost model. Weights, energy per operation and
+    carbon intensity are applied to op counts at report time; the loop and
+    recursion defaults are analysis heuristics, so profiles that change
+    them need their own op counts (see estimate_carbon_footprint).
+    """
+    name: str
+    operation_weights: Dict[OpType, float] = field(default_factory=lambda: dict(OPERATION_WEIGHTS))
+    energy_per_operation_joules: float = ENERGY_PER_OPERATION_JOULES
+    carbon_intensity_g_per_kwh: float = CARBON_INTENSITY_G_PER_KWH
+    default_loop_iterations: int = DEFAULT_LOOP_ITERATIONS
+    default_recursion_depth: int = DEFAULT_RECURSION_DEPTH
+
+    @property
+    def heuristics(self) -> Tuple[int, int]:
+        return self.default_loop_iterations, self.default_recursion_depth
+
+    def weighted_ops(self, operations: OperationCount) -> float:
+        return sum(count * self.operation_weights.get(op, 0) for op, count in operations.counts.items())
+
+    def report(self, operations: OperationCount) -> dict:
+        weighted = self.weighted_ops(operations)
+        energy_joules = weighted * self.energy_per_operation_joules
+        energy_kwh = energy_joules / JOULES_PER_KWH
+        return {
+            "total_weighted_operations": weighted,
+            "energy_joules": energy_joules,
+            "energy_kWh": energy_kwh,
+            "carbon_grams_CO2": energy_kwh * self.carbon_intensity_g_per_kwh,
+            "carbon_intensity_g_per_kWh": self.carbon_intensity_g_per_kwh,
         }
 
 
+DEFAULT_ENERGY_PROFILE = EnergyProfile(name="default")
+
+
+def load_energy_profiles(path: str) -> Dict[str, EnergyProfile]:
+    """
+    Load named profiles from a TOML (.toml) or JSON file:
+
+        [profiles.arm-laptop]
+        energy_per_operation_joules = 1.5e-9
+        carbon_intensity_g_per_kwh = 30
+        [profiles.arm-laptop.operation_weights]
+        io_operation = 40
+
+    Unspecified settings fall back to the module defaults, or to the
+    profile named by `extends`. A top-level "profiles" table is optional.
+    """
+    if path.endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ValueError("Reading TOML energy profiles requires Python 3.11+ or the 'tomli' package")
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+    specs = data.get("profiles", data) if isinstance(data, dict) else None
+    if not isinstance(specs, dict) or not all(isinstance(v, dict) for v in specs.values()):
+        raise ValueError(f"{path}: expected a table of named energy profiles")
+
+    op_types = {op.value: op for op in OpType}
+    profiles: Dict[str, EnergyProfile] = {}
+
+    def build(name: str, resolving: Tuple[str, ...] = ()) -> EnergyProfile:
+        if name in profiles:
+            return profiles[name]
+        if name not in specs:
+            raise ValueError(f"{path}: unknown energy profile '{name}'")
+        if name in resolving:
+            raise ValueError(f"{path}: circular 'extends' through profile '{name}'")
+        spec = specs[name]
+        unknown = set(spec) - ENERGY_PROFILE_KEYS
+        if unknown:
+            raise ValueError(f"{path}: profile '{name}' has unknown settings: {', '.join(sorted(unknown))}")
+        base = build(spec["extends"], resolving + (name,)) if "extends" in spec else DEFAULT_ENERGY_PROFILE
+        weights = dict(base.operation_weights)
+        for op_name, weight in spec.get("operation_weights", {}).items():
+            if op_name not in op_types:
+                raise ValueError(f"{path}: profile '{name}' weights unknown operation '{op_name}'")
+            weights[op_types[op_name]] = float(weight)
+        profile = EnergyProfile(
+            name=name,
+            operation_weights=weights,
+            energy_per_operation_joules=float(spec.get("energy_per_operation_joules", base.energy_per_operation_joules)),
+            carbon_intensity_g_per_kwh=float(spec.get("carbon_intensity_g_per_kwh", base.carbon_intensity_g_per_kwh)),
+            default_loop_iterations=int(spec.get("default_loop_iterations", base.default_loop_iterations)),
+            default_recursion_depth=int(spec.get("default_recursion_depth", base.default_recursion_depth)),
+        )
+        if profile.default_loop_iterations < 1 or profile.default_recursion_depth < 1:
+            raise ValueError(f"{path}: profile '{name}' loop/recursion defaults must be >= 1")
+        profiles[name] = profile
+        return profile
+
+    for name in specs:
+        build(name)
+    return profiles
+
+
 # =============================================================================
 # LANGUAGE DETECTION
 # =============================================================================
@@ -228,16 +601,8 @@ def detect_language(file_path: Optional[str] = None, code: Optional[str] = None)
     """
     if file_path:
         ext = os.path.splitext(file_path)[1].lower()
-        ext_map = {
-            ".py": "python",
-            ".java": "java",
-            ".c": "c",
-            ".cpp": "cpp", ".cc": "cpp", ".cxx": "cpp", ".hpp": "cpp",
-            ".js": "javascript", ".mjs": "javascript",
-            ".ts": "javascript",  # TypeScript parsed similarly
-        }
-        if ext in ext_map:
-            return ext_map[ext]
+        if ext in LANGUAGE_EXTENSIONS:
+            return LANGUAGE_EXTENSIONS[ext]
 
     if code:
         # Heuristic detection based on keywords / patterns
@@ -255,6 +620,846 @@ def detect_language(file_path: Optional[str] = None, code: Optional[str] = None)
     return "python"  # default fallback
 
 
+# =============================================================================
+# RECURSION COST MODEL
+# =============================================================================
+
+class ArgShrink(Enum):
+    """How a recursive call shrinks its input relative to the caller."""
+    DECREMENT = "decrement"   # n - 1, xs[1:]
+    HALVING   = "halving"     # n // 2, n >> 1, xs[:mid]
+    UNKNOWN   = "unknown"
+
+
+@dataclass
+class RecursionProfile:
+    """Call structure of a recursive function and its estimated activation count."""
+    calls_per_activation: int
+    shrink: ArgShrink
+    growth: str           # 'linear', 'logarithmic', 'exponential', 'polynomial'
+    depth: int
+    activations: int
+
+    def to_dict(self) -> dict:
+        return {
+            "calls_per_activation": self.calls_per_activation,
+            "argument_shrink": self.shrink.value,
+            "growth": self.growth,
+            "depth": self.depth,
+            "estimated_activations": self.activations,
+        }
+
+
+def estimate_recursion(calls_per_activation: int, shrink: ArgShrink,
+                       depth_bound: int = DEFAULT_RECURSION_DEPTH) -> RecursionProfile:
+    """
+    Classify recursive growth and estimate the total number of activations.
+
+    depth_bound is the assumed input size n:
+    - 1 call,  n-1        -> linear:      n activations
+    - 1 call,  n//2       -> logarithmic: log2(n) activations
+    - k calls, n-1        -> exponential: k^n activations (fib-style)
+    - k calls, n//2       -> polynomial:  k^log2(n) = n^log2(k) (divide & conquer)
+    - unknown shrinkage   -> linear over the depth bound (previous behaviour)
+    """
+    calls = max(1, calls_per_activation)
+    log_depth = max(1, math.ceil(math.log2(max(2, depth_bound))))
+
+    if shrink == ArgShrink.HALVING:
+        depth = log_depth
+        if calls == 1:
+            growth, activations = "logarithmic", depth
+        else:
+            growth, activations = "polynomial", calls ** depth
+    elif shrink == ArgShrink.DECREMENT and calls > 1:
+        depth = depth_bound
+        growth = "exponential"
+        # Avoid building huge ints: cap before exponentiating
+        if depth * math.log2(calls) >= math.log2(MAX_RECURSION_ACTIVATIONS):
+            activations = MAX_RECURSION_ACTIVATIONS
+        else:
+            activations = calls ** depth
+    else:
+        depth = depth_bound
+        growth, activations = "linear", depth_bound
+
+    return RecursionProfile(
+        calls_per_activation=calls,
+        shrink=shrink,
+        growth=growth,
+        depth=depth,
+        activations=min(activations, MAX_RECURSION_ACTIVATIONS),
+    )
+
+
+def infer_recursion_depth(profile: RecursionProfile, activations: float) -> float:
+    """
+    Inverse of estimate_recursion: the depth bound (input size n) under which
+    this call structure yields the given number of activations.
+    """
+    activations = max(1.0, activations)
+    calls = profile.calls_per_activation
+    if profile.shrink == ArgShrink.HALVING:
+        levels = activations if calls == 1 else math.log(activations, calls)
+        return 2.0 ** min(levels, 62)
+    if profile.shrink == ArgShrink.DECREMENT and calls > 1:
+        return math.log(activations, calls)
+    return activations
+
+
+def recursive_complexity(profile: RecursionProfile, body: Complexity) -> Complexity:
+    """
+    Complexity of a recursive function given the complexity of one activation:
+    - k calls, n-1  -> exponential
+    - k calls, n//2 -> master theorem, T(n) = k*T(n/2) + body
+    - otherwise     -> n activations of the body
+    """
+    if profile.growth == "exponential" or body.exponential:
+        return COMPLEXITY_EXPONENTIAL
+    if profile.shrink == ArgShrink.HALVING:
+        critical = math.log2(profile.calls_per_activation)
+        if body.degree > critical:
+            return body
+        if body.degree == critical:
+            return body * COMPLEXITY_LOGARITHMIC
+        return Complexity(degree=math.ceil(critical))
+    return COMPLEXITY_LINEAR * body
+
+
+def dominant_shrink(shrinks) -> ArgShrink:
+    """The slowest-shrinking call dominates the recursion depth."""
+    if ArgShrink.DECREMENT in shrinks:
+        return ArgShrink.DECREMENT
+    if ArgShrink.HALVING in shrinks:
+        return ArgShrink.HALVING
+    return ArgShrink.UNKNOWN
+
+
+def find_halved_names(code: str) -> set:
+    """Names assigned from halving expressions in C-family code, e.g. mid = (lo + hi) / 2;"""
+    return {
+        m.group(1) for m in re.finditer(r'\b(\w+)\s*=[^=;]*(?:/\s*2\b|>>\s*1\b)[^;]*;', code)
+    }
+
+
+def classify_shrink_text(args: str, halved_names: set) -> ArgShrink:
+    """Classify the argument text of a C-family recursive call."""
+    if re.search(r'/\s*2\b|>>\s*1\b', args) or any(
+        re.search(rf'\b{re.escape(h)}\b', args) for h in halved_names
+    ):
+        return ArgShrink.HALVING
+    if re.search(r'\w\s*-\s*\d+|\+\s*1\b', args):
+        return ArgShrink.DECREMENT
+    return ArgShrink.UNKNOWN
+
+
+# =============================================================================
+# CALL COST DATABASE
+# =============================================================================
+
+# Built-in cost entries: fully qualified callable -> {op type: formula}.
+# Formulas are Python expressions over n (size of the receiver for methods,
+# or of the first argument for functions) and m (size of the second argument).
+# "*.name" entries match a method call whose receiver type is unknown.
+DEFAULT_CALL_COSTS: Dict[str, Dict[str, str]] = {
+    # Builtins
+    "len":              {"function_call": "1"},
+    "sorted":           {"comparison": "n * log2(n)", "assignment": "n * log2(n)", "memory_allocation": "1"},
+    "sum":              {"addition": "n"},
+    "min":              {"comparison": "n"},
+    "max":              {"comparison": "n"},
+    "any":              {"comparison": "n"},
+    "all":              {"comparison": "n"},
+    "reversed":         {"function_call": "1"},
+    "list":             {"memory_allocation": "1", "assignment": "n"},
+    "tuple":            {"memory_allocation": "1", "assignment": "n"},
+    "set":              {"memory_allocation": "1", "assignment": "n"},
+    "dict":             {"memory_allocation": "1", "assignment": "n"},
+    # list
+    "list.sort":        {"comparison": "n * log2(n)", "assignment": "n * log2(n)"},
+    "*.sort":           {"comparison": "n * log2(n)", "assignment": "n * log2(n)"},
+    "list.index":       {"comparison": "n"},
+    "*.index":          {"comparison": "n"},
+    "list.count":       {"comparison": "n"},
+    "*.count":          {"comparison": "n"},
+    "list.remove":      {"comparison": "n", "assignment": "n"},
+    "list.insert":      {"assignment": "n"},
+    "list.append":      {"memory_allocation": "1"},
+    "*.append":         {"memory_allocation": "1"},
+    "list.extend":      {"memory_allocation": "1", "assignment": "m"},
+    "list.pop":         {"assignment": "1"},
+    "list.copy":        {"memory_allocation": "1", "assignment": "n"},
+    "list.reverse":     {"assignment": "n"},
+    # dict / set
+    "dict.get":         {"array_access": "1"},
+    "*.get":            {"array_access": "1"},
+    "dict.items":       {"function_call": "1"},
+    "dict.keys":        {"function_call": "1"},
+    "dict.values":      {"function_call": "1"},
+    "dict.update":      {"assignment": "m"},
+    "dict.copy":        {"memory_allocation": "1", "assignment": "n"},
+    "set.add":          {"array_access": "1"},
+    "set.union":        {"memory_allocation": "1", "assignment": "n + m"},
+    "set.intersection": {"comparison": "min(n, m)"},
+    # str
+    "str.join":         {"addition": "m", "memory_allocation": "1"},
+    "str.split":        {"comparison": "n", "memory_allocation": "1"},
+    "str.replace":      {"comparison": "n", "memory_allocation": "1"},
+    "str.find":         {"comparison": "n"},
+    "str.index":        {"comparison": "n"},
+    "str.count":        {"comparison": "n"},
+    # Standard library
+    "copy.deepcopy":    {"memory_allocation": "n", "assignment": "n"},
+    "copy.copy":        {"memory_allocation": "1", "assignment": "n"},
+    "json.loads":       {"function_call": "n", "memory_allocation": "n"},
+    "json.dumps":       {"function_call": "n", "memory_allocation": "1"},
+    "re.findall":       {"comparison": "n"},
+    "re.sub":           {"comparison": "n", "memory_allocation": "1"},
+    "heapq.heappush":   {"comparison": "log2(n)"},
+    "heapq.heappop":    {"comparison": "log2(n)"},
+    "heapq.heapify":    {"comparison": "n"},
+    "bisect.bisect":    {"comparison": "log2(n)"},
+    "bisect.bisect_left": {"comparison": "log2(n)"},
+    "bisect.insort":    {"comparison": "log2(n)", "assignment": "n"},
+    "collections.deque.appendleft": {"memory_allocation": "1"},
+    "time.sleep":       {"function_call": "1"},
+    "os.listdir":       {"io_operation": "1"},
+    "os.walk":          {"io_operation": "1"},
+    "subprocess.run":   {"io_operation": "1"},
+    "urllib.request.urlopen": {"network_operation": "1"},
+    "socket.socket":    {"network_operation": "1"},
+    # Third-party
+    "requests.get":     {"network_operation": "1"},
+    "requests.post":    {"network_operation": "1"},
+    "requests.put":     {"network_operation": "1"},
+    "requests.delete":  {"network_operation": "1"},
+    "requests.request": {"network_operation": "1"},
+    "requests.Session.get":  {"network_operation": "1"},
+    "requests.Session.post": {"network_operation": "1"},
+    "numpy.zeros":      {"memory_allocation": "1", "assignment": "n"},
+    "numpy.ones":       {"memory_allocation": "1", "assignment": "n"},
+    "numpy.empty":      {"memory_allocation": "1"},
+    "numpy.array":      {"memory_allocation": "1", "assignment": "n"},
+    "numpy.dot":        {"multiplication": "n", "addition": "n"},
+    "numpy.matmul":     {"multiplication": "n * sqrt(n)", "addition": "n * sqrt(n)"},
+    "numpy.sort":       {"comparison": "n * log2(n)", "assignment": "n"},
+    "numpy.sum":        {"addition": "n"},
+    "pandas.read_csv":  {"io_operation": "n", "memory_allocation": "1"},
+    "pandas.DataFrame": {"memory_allocation": "1", "assignment": "n"},
+}
+
+# Functions a cost formula may call
+_COST_FORMULA_FUNCS = {
+    "log2": lambda x: math.log2(max(x, 2)),
+    "log": lambda x: math.log(max(x, 2)),
+    "sqrt": lambda x: math.sqrt(max(x, 0)),
+    "min": min,
+    "max": max,
+}
+# No ast.Pow: 2 ** n with a large n would build enormous integers
+_COST_FORMULA_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Name, ast.Load, ast.Call,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.USub,
+)
+
+
+@dataclass
+class CallCost:
+    """A compiled cost entry: per-op-type formulas over n and m."""
+    name: str
+    formulas: List[Tuple[OpType, object]]   # (op type, compiled code object)
+
+    def evaluate(self, n: int, m: int = 1) -> List[Tuple[OpType, int]]:
+        env = {"__builtins__": {}, "n": n, "m": m, **_COST_FORMULA_FUNCS}
+        return [(op, max(0, min(int(round(eval(code, env))), MAX_OPERATION_COUNT))) for op, code in self.formulas]
+
+
+class CostDatabase:
+    """
+    Maps fully qualified callables to cost formulas.
+
+    All formulas are validated and compiled once at load time into a flat
+    dict, so a lookup during the AST walk is a single hash probe.
+    """
+
+    def __init__(self, entries: Optional[Dict[str, Dict[str, str]]] = None):
+        self._index: Dict[str, CallCost] = {}
+        self._entries: Dict[str, Dict[str, str]] = {}
+        self.add_entries(DEFAULT_CALL_COSTS if entries is None else entries)
+
+    def __getstate__(self):
+        # Code objects don't pickle; ship the formulas and recompile on arrival
+        return {"entries": self._entries}
+
+    def __setstate__(self, state):
+        self._index = {}
+        self._entries = {}
+        self.add_entries(state["entries"])
+
+    @classmethod
+    def load(cls, path: str, include_defaults: bool = True) -> "CostDatabase":
+        """Load entries from a JSON file ({"callable": {"op_type": "formula"}})."""
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        db = cls() if include_defaults else cls(entries={})
+        db.add_entries(entries)
+        return db
+
+    def add_entries(self, entries: Dict[str, Dict[str, str]]):
+        op_types = {op.value: op for op in OpType}
+        for name, costs in entries.items():
+            formulas = []
+            for op_name, formula in costs.items():
+                if op_name not in op_types:
+                    raise ValueError(f"Cost entry '{name}': unknown operation type '{op_name}'")
+                formulas.append((op_types[op_name], self._compile_formula(name, str(formula))))
+            self._index[name] = CallCost(name=name, formulas=formulas)
+            self._entries[name] = dict(costs)
+
+    @staticmethod
+    def _compile_formula(name: str, formula: str):
+        tree = ast.parse(formula, mode="eval")
+        for node in ast.walk(tree):
+            if not isinstance(node, _COST_FORMULA_NODES):
+                raise ValueError(f"Cost entry '{name}': unsupported syntax in formula '{formula}'")
+            if isinstance(node, ast.Name) and node.id not in ("n", "m") and node.id not in _COST_FORMULA_FUNCS:
+                raise ValueError(f"Cost entry '{name}': unknown name '{node.id}' in formula '{formula}'")
+            if isinstance(node, ast.Call) and not (
+                isinstance(node.func, ast.Name) and node.func.id in _COST_FORMULA_FUNCS
+            ):
+                raise ValueError(f"Cost entry '{name}': unsupported call in formula '{formula}'")
+        return compile(tree, f"<cost:{name}>", "eval")
+
+    def lookup(self, qualified_name: str) -> Optional[CallCost]:
+        return self._index.get(qualified_name)
+
+    def __contains__(self, qualified_name: str) -> bool:
+        return qualified_name in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+_default_cost_database: Optional[CostDatabase] = None
+
+
+def get_default_cost_database() -> CostDatabase:
+    """Return the shared database built from DEFAULT_CALL_COSTS (compiled once)."""
+    global _default_cost_database
+    if _default_cost_database is None:
+        _default_cost_database = CostDatabase()
+    return _default_cost_database
+
+
+# =============================================================================
+# PARSE CACHE
+# =============================================================================
+
+# Memory budget of the in-process parse cache (approximate bytes of AST)
+PARSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Measured footprint of a CPython AST relative to its source text
+AST_BYTES_PER_SOURCE_BYTE = 40
+
+
+class ParseCache:
+    """
+    LRU cache of parsed Python modules keyed by a hash of the source text.
+
+    Re-analyzing the same source (e.g. a parameter sweep over weights or
+    carbon intensities) reuses the tree instead of calling ast.parse again.
+    Entry sizes are estimated from the source length; least recently used
+    trees are evicted once the estimate exceeds max_bytes (0 disables caching).
+    Cached trees are shared, so analyzers must treat them as read-only.
+    """
+
+    def __init__(self, max_bytes: int = PARSE_CACHE_MAX_BYTES):
+        import threading
+        from collections import OrderedDict
+        if max_bytes < 0:
+            raise ValueError("max_bytes must be >= 0")
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[bytes, Tuple[ast.Module, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(code: str) -> bytes:
+        import hashlib
+        return hashlib.blake2b(code.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    def parse(self, code: str) -> ast.Module:
+        """ast.parse(code), served from the cache when the same source was parsed before."""
+        key = self._key(code)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        tree = ast.parse(code)
+        size = len(code) * AST_BYTES_PER_SOURCE_BYTE
+        if size > self.max_bytes:
+            return tree
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (tree, size)
+                self.current_bytes += size
+                while self.current_bytes > self.max_bytes:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self.current_bytes -= evicted
+        return tree
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_default_parse_cache = ParseCache()
+
+
+def get_parse_cache() -> ParseCache:
+    """The process-wide parse cache used by PythonAnalyzer by default."""
+    return _default_parse_cache
+
+
+# =============================================================================
+# PROJECT CONSTANT INDEX
+# =============================================================================
+
+class ProjectConstantIndex:
+    """
+    Module-level integer constants of every Python module below a project
+    root, for resolving loop bounds such as `range(config.BATCH_SIZE)` or an
+    imported `MAX_ITEMS`.
+
+    Building the index only lists the files; a module is parsed (through
+    the parse cache) the first time one of its names is looked up, and
+    resolved values are memoized. Modules are registered under their dotted
+    path relative to root and under every dotted suffix of it that is
+    unique, so `src/app/config.py` answers to `app.config` as well.
+    """
+
+    def __init__(self, root: str, parse_cache: Optional[ParseCache] = None):
+        self.root = os.path.abspath(root)
+        self.parse_cache = parse_cache if parse_cache is not None else get_parse_cache()
+        self._paths: Dict[str, str] = {}              # module -> file
+        self._suffixes: Dict[str, Optional[str]] = {}  # dotted suffix -> module (None if ambiguous)
+        # module -> (constant name -> expression, local name -> qualified import)
+        self._modules: Dict[str, Tuple[Dict[str, ast.expr], Dict[str, str]]] = {}
+        self._resolved: Dict[str, Optional[int]] = {}
+
+    @classmethod
+    def build(cls, root: str, parse_cache: Optional[ParseCache] = None) -> "ProjectConstantIndex":
+        index = cls(root, parse_cache)
+        for path in iter_source_files(root):
+            if path.endswith(".py"):
+                index._register(path)
+        return index
+
+    def module_name(self, path: str) -> Optional[str]:
+        """Dotted module name of a file below root (None outside the project)."""
+        rel = os.path.relpath(os.path.abspath(path), self.root)
+        if rel.startswith(os.pardir) or not rel.endswith(".py"):
+            return None
+        parts = rel[:-3].split(os.sep)
+        if parts[-1] == "__init__":
+            parts.pop()
+        return ".".join(parts) or None
+
+    def _register(self, path: str):
+        module = self.module_name(path)
+        if module is None or module in self._paths:
+            return
+        self._paths[module] = path
+        parts = module.split(".")
+        for i in range(1, len(parts)):
+            suffix = ".".join(parts[i:])
+            self._suffixes[suffix] = None if suffix in self._suffixes else module
+
+    def invalidate(self, path: str):
+        """Forget a changed, added or deleted file (watch mode)."""
+        module = self.module_name(path)
+        if module is None:
+            return
+        self._modules.pop(module, None)
+        self._resolved.clear()
+        if os.path.isfile(path):
+            self._register(path)
+
+    def _find_module(self, module: str) -> Optional[str]:
+        if module in self._paths:
+            return module
+        return self._suffixes.get(module)
+
+    def _load(self, module: str) -> Tuple[Dict[str, ast.expr], Dict[str, str]]:
+        if module in self._modules:
+            return self._modules[module]
+        constants: Dict[str, ast.expr] = {}
+        imports: Dict[str, str] = {}
+        reassigned = set()
+        path = self._paths[module]
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                tree = self.parse_cache.parse(f.read())
+        except (SyntaxError, ValueError, OSError):
+            tree = ast.Module(body=[], type_ignores=[])
+        is_package = os.path.basename(path) == "__init__.py"
+        for node in tree.body:
+            if isinstance(node, (ast.Assign, ast.AnnAssign)) and node.value is not None:
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    if isinstance(target, ast.Name):
+                        if target.id in constants:
+                            reassigned.add(target.id)
+                        constants[target.id] = node.value
+            elif isinstance(node, ast.AugAssign) and isinstance(node.target, ast.Name):
+                reassigned.add(node.target.id)
+            elif isinstance(node, ast.ImportFrom):
+                base = resolve_import_module(module, is_package, node.module, node.level)
+                for alias in node.names:
+                    if base and alias.name != "*":
+                        imports[alias.asname or alias.name] = f"{base}.{alias.name}"
+            elif isinstance(node, ast.Import):
+                for alias in node.names:
+                    if alias.asname:
+                        imports[alias.asname] = alias.name
+        for name in reassigned:
+            constants.pop(name, None)   # only single-assignment globals count as constants
+        self._modules[module] = (constants, imports)
+        return self._modules[module]
+
+    def lookup(self, qualified: str) -> Optional[int]:
+        """Integer value of a qualified name like `app.config.BATCH_SIZE`, if known."""
+        if qualified in self._resolved:
+            return self._resolved[qualified]
+        self._resolved[qualified] = None   # cycle guard
+        module_name, _, attr = qualified.rpartition(".")
+        module = self._find_module(module_name) if module_name else None
+        value = None
+        if module is not None:
+            constants, imports = self._load(module)
+            if attr in constants:
+                value = self._evaluate(constants[attr], module)
+            elif attr in imports:
+                value = self.lookup(imports[attr])
+        self._resolved[qualified] = value
+        return value
+
+    def _evaluate(self, node: ast.expr, module: str) -> Optional[int]:
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) \
+                and not isinstance(node.value, bool):
+            return int(node.value)
+        if isinstance(node, ast.Name):
+            return self.lookup(f"{module}.{node.id}")
+        if isinstance(node, ast.Attribute):
+            parts = []
+            current = node
+            while isinstance(current, ast.Attribute):
+                parts.append(current.attr)
+                current = current.value
+            if isinstance(current, ast.Name):
+                _, imports = self._load(module)
+                head = imports.get(current.id, current.id)
+                return self.lookup(".".join([head] + parts[::-1]))
+            return None
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            value = self._evaluate(node.operand, module)
+            return -value if value is not None else None
+        if isinstance(node, ast.BinOp):
+            left = self._evaluate(node.left, module)
+            right = self._evaluate(node.right, module)
+            if left is None or right is None:
+                return None
+            if isinstance(node.op, ast.Add): return left + right
+            if isinstance(node.op, ast.Sub): return left - right
+            if isinstance(node.op, ast.Mult): return left * right
+            if isinstance(node.op, ast.FloorDiv) and right != 0: return left // right
+            if isinstance(node.op, ast.Mod) and right != 0: return left % right
+            if isinstance(node.op, ast.LShift) and 0 <= right < 64: return left << right
+            if isinstance(node.op, ast.Pow) and 0 <= right < 64 and abs(left) < 2 ** 16: return left ** right
+        return None
+
+
+def resolve_import_module(module: Optional[str], is_package: bool,
+                          target: Optional[str], level: int) -> Optional[str]:
+    """Absolute module named by `from <level dots><target> import ...` inside module."""
+    if not level:
+        return target
+    if module is None:
+        return None
+    parts = module.split(".") if is_package else module.split(".")[:-1]
+    if level - 1 > len(parts):
+        return None
+    parts = parts[:len(parts) - (level - 1)]
+    if target:
+        parts.append(target)
+    return ".".join(parts) or None
+
+
+# Indexes are built once per project root and reused by later analyses
+_project_constant_indexes: Dict[str, ProjectConstantIndex] = {}
+
+
+def get_project_constant_index(root: str) -> ProjectConstantIndex:
+    """Cached ProjectConstantIndex for root (built on first use)."""
+    key = os.path.abspath(root)
+    index = _project_constant_indexes.get(key)
+    if index is None:
+        index = _project_constant_indexes[key] = ProjectConstantIndex.build(key)
+    return index
+
+
+# =============================================================================
+# PROFILE INDEX (PROFILE-GUIDED ESTIMATION)
+# =============================================================================
+
+# cProfile's names for builtins, e.g. "<built-in method builtins.len>" or
+# "<method 'append' of 'list' objects>"
+_PROFILE_BUILTIN_RE = re.compile(r"<built-in method (?:[\w.]+\.)?(\w+)>|<method '(\w+)' of ")
+
+
+class ProfileIndex:
+    """
+    Execution counts observed in profiling artifacts of a real workload,
+    used by PythonAnalyzer in place of its loop-bound and recursion-depth
+    heuristics:
+
+    - cProfile / pstats files: total and primitive (non-recursive) calls per
+      function, and calls along every caller -> callee edge
+    - line coverage: lcov tracefiles, Cobertura XML (`coverage xml`),
+      `coverage json` reports and coverage.py `.coverage` databases
+
+    Counts are keyed by (file, line) so the analyzer looks them up in O(1);
+    several artifacts add up. coverage.py records only whether a line ran:
+    a file whose hits are all 0 or 1 is kept as executed/not-executed data,
+    which can only show that a loop body never ran.
+
+    Profiles usually come from another machine, so an analyzed file is
+    matched by real path or else by its longest unique trailing path
+    (see resolve).
+    """
+
+    def __init__(self):
+        self.line_hits: Dict[Tuple[str, int], int] = {}
+        # (file, first line of the def) -> (primitive calls, total calls)
+        self.function_calls: Dict[Tuple[str, int], Tuple[int, int]] = {}
+        # (file, first line of the caller) -> callee name -> calls
+        self.call_edges: Dict[Tuple[str, int], Dict[str, int]] = {}
+        self.line_files: Set[str] = set()
+        # Files with real hit counts rather than executed/not-executed flags
+        self.counted_files: Set[str] = set()
+        self.sources: List[str] = []
+        self._paths: Set[str] = set()
+        self._by_basename: Dict[str, List[str]] = {}
+        self._resolved: Dict[str, Optional[str]] = {}
+
+    @classmethod
+    def load(cls, paths: Union[str, List[str]]) -> "ProfileIndex":
+        """Index one artifact or a list of them (see add)."""
+        index = cls()
+        for path in [paths] if isinstance(paths, str) else paths:
+            index.add(path)
+        return index
+
+    def add(self, path: str):
+        """Add a profiling artifact, detecting its format from content and extension."""
+        with open(path, "rb") as f:
+            head = f.read(16).lstrip()
+        ext = os.path.splitext(path)[1].lower()
+        if head.startswith(b"SQLite format 3"):
+            self.add_coverage_db(path)
+        elif ext in (".info", ".lcov") or head.startswith((b"TN:", b"SF:")):
+            self.add_lcov(path)
+        elif ext == ".xml" or head.startswith(b"<"):
+            self.add_cobertura(path)
+        elif ext == ".json" or head.startswith(b"{"):
+            self.add_coverage_json(path)
+        else:
+            self.add_cprofile(path)
+        self.sources.append(path)
+
+    def add_cprofile(self, path: str):
+        """Function and call-edge counts from a cProfile/profile stats dump."""
+        import pstats
+        try:
+            stats = pstats.Stats(path).stats
+        except (TypeError, ValueError, EOFError) as exc:
+            raise ValueError(f"{path}: not a cProfile stats file ({exc})")
+
+        for (filename, line, name), (primitive, total, _, _, callers) in stats.items():
+            match = _PROFILE_BUILTIN_RE.match(name)
+            callee = next(filter(None, match.groups())) if match else name
+            for (caller_file, caller_line, _), edge in callers.items():
+                if caller_file == "~" or caller_file.startswith("<"):
+                    continue
+                # cProfile stores (calls, primitive calls, ...); the pure-Python profiler a count
+                calls = edge[0] if isinstance(edge, tuple) else edge
+                edges = self.call_edges.setdefault((self._add_path(caller_file), caller_line), {})
+                edges[callee] = edges.get(callee, 0) + calls
+            if filename == "~" or filename.startswith("<"):
+                continue
+            key = (self._add_path(filename), line)
+            seen_primitive, seen_total = self.function_calls.get(key, (0, 0))
+            self.function_calls[key] = (seen_primitive + primitive, seen_total + total)
+
+    def add_lcov(self, path: str):
+        """Line hits from an lcov tracefile (SF:/DA: records)."""
+        filename, hits = None, {}
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for number, record in enumerate(f, 1):
+                record = record.strip()
+                if record.startswith("SF:"):
+                    filename, hits = record[3:], {}
+                elif record.startswith("DA:") and filename:
+                    fields = record[3:].split(",")
+                    try:
+                        hits[int(fields[0])] = int(float(fields[1]))
+                    except (IndexError, ValueError):
+                        raise ValueError(f"{path}:{number}: malformed DA record {record!r}")
+                elif record == "end_of_record" and filename:
+                    self._add_line_hits(filename, hits)
+                    filename = None
+
+    def add_cobertura(self, path: str):
+        """Line hits from Cobertura XML; class filenames are relative to a <source>."""
+        import xml.etree.ElementTree as ElementTree
+        try:
+            root = ElementTree.parse(path).getroot()
+        except ElementTree.ParseError as exc:
+            raise ValueError(f"{path}: invalid Cobertura XML ({exc})")
+
+        sources = [s.text.strip() for s in root.iter("source") if s.text and s.text.strip()]
+        by_file: Dict[str, Dict[int, int]] = {}
+        for cls in root.iter("class"):
+            filename = cls.get("filename")
+            lines = cls.find("lines")
+            if not filename or lines is None:
+                continue
+            candidates = [os.path.join(source, filename) for source in sources]
+            filename = next((c for c in candidates if os.path.exists(c)), candidates[0] if candidates else filename)
+            hits = by_file.setdefault(filename, {})
+            for line in lines.iter("line"):
+                try:
+                    hits[int(line.get("number"))] = int(line.get("hits", 0))
+                except (TypeError, ValueError):
+                    raise ValueError(f"{path}: malformed <line> in {filename}")
+        for filename, hits in by_file.items():
+            self._add_line_hits(filename, hits)
+
+    def add_coverage_json(self, path: str):
+        """Executed and missing lines of a `coverage json` report."""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        files = data.get("files") if isinstance(data, dict) else None
+        if not isinstance(files, dict):
+            raise ValueError(f"{path}: expected a coverage.py JSON report with a 'files' table")
+        for filename, entry in files.items():
+            hits = {line: 0 for line in entry.get("missing_lines", [])}
+            hits.update((line, 1) for line in entry.get("executed_lines", []))
+            self._add_line_hits(filename, hits)
+
+    def add_coverage_db(self, path: str):
+        """Executed lines of a coverage.py data file (SQLite, schema 5+)."""
+        import sqlite3
+        executed: Dict[str, Dict[int, int]] = {}
+        try:
+            with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as db:
+                # numbits: bit k of byte i set <=> line 8*i + k ran (any context)
+                for filename, numbits in db.execute(
+                        "SELECT file.path, line_bits.numbits FROM line_bits JOIN file ON file.id = line_bits.file_id"):
+                    hits = executed.setdefault(filename, {})
+                    for i, byte in enumerate(numbits):
+                        for k in range(8):
+                            if byte & (1 << k):
+                                hits[8 * i + k] = 1
+                # Branch-coverage runs store arcs instead of lines
+                for filename, start, end in db.execute(
+                        "SELECT file.path, arc.fromno, arc.tono FROM arc JOIN file ON file.id = arc.file_id"):
+                    hits = executed.setdefault(filename, {})
+                    for line in (start, end):
+                        if line > 0:
+                            hits[line] = 1
+        except sqlite3.DatabaseError as exc:
+            raise ValueError(f"{path}: not a coverage.py data file ({exc})")
+        for filename, hits in executed.items():
+            self._add_line_hits(filename, hits)
+
+    def _add_path(self, filename: str) -> str:
+        path = os.path.realpath(filename)
+        if path not in self._paths:
+            self._paths.add(path)
+            self._by_basename.setdefault(os.path.basename(path), []).append(path)
+            self._resolved.clear()
+        return path
+
+    def _add_line_hits(self, filename: str, hits: Dict[int, int]):
+        path = self._add_path(filename)
+        counted = any(h > 1 for h in hits.values())
+        for line, h in hits.items():
+            key = (path, line)
+            # Executed flags of several runs do not add up to counts
+            self.line_hits[key] = self.line_hits.get(key, 0) + h if counted else max(self.line_hits.get(key, 0), h)
+        self.line_files.add(path)
+        if counted:
+            self.counted_files.add(path)
+
+    def resolve(self, file_path: str) -> Optional[str]:
+        """
+        The profiled file corresponding to file_path: the same real path, or
+        else the profiled file sharing the longest trailing path with it
+        (None when that is ambiguous, e.g. two `pkg/__init__.py`).
+        """
+        if file_path in self._resolved:
+            return self._resolved[file_path]
+        path = os.path.realpath(file_path)
+        best = None
+        if path in self._paths:
+            best = path
+        else:
+            parts = path.split(os.sep)
+            best_length, tied = 0, False
+            for candidate in self._by_basename.get(parts[-1], []):
+                candidate_parts = candidate.split(os.sep)
+                length = 0
+                while (length < min(len(parts), len(candidate_parts))
+                       and parts[-1 - length] == candidate_parts[-1 - length]):
+                    length += 1
+                if length > best_length:
+                    best, best_length, tied = candidate, length, False
+                elif length == best_length:
+                    tied = True
+            if tied:
+                best = None
+        self._resolved[file_path] = best
+        return best
+
+    def line_count(self, path: str, line: int) -> Optional[int]:
+        """Executions of a line of a resolved file (0 if it never ran), None without line data."""
+        if path not in self.line_files:
+            return None
+        return self.line_hits.get((path, line), 0)
+
+    def has_counts(self, path: str) -> bool:
+        return path in self.counted_files
+
+
 # =============================================================================
 # ABSTRACT BASE ANALYZER
 # =============================================================================
@@ -262,19 +1467,106 @@ def detect_language(file_path: Optional[str] = None, code: Optional[str] = None)
 class LanguageAnalyzer(ABC):
     """Base class for language-specific code analyzers."""
 
-    def __init__(self):
+    def __init__(self, track_lines: bool = False, energy_profile: Optional["EnergyProfile"] = None):
         self.result: Optional[AnalysisResult] = None
+        # When enabled, weighted cost is accumulated per source line into a
+        # flat list indexed by line number (see _line_costs_to_map)
+        self.track_lines = track_lines
+        self._line_costs: Optional[List[int]] = None
+        # Alongside the line costs, weighted cost per frame stack
+        # (class -> function -> loop@line), for flamegraph/trace export
+        self._frames: List[str] = []
+        self._stack_costs: Optional[Dict[Tuple[str, ...], int]] = None
+        # Heuristics for bounds static analysis cannot resolve
+        profile = energy_profile or DEFAULT_ENERGY_PROFILE
+        self.default_loop_iterations = profile.default_loop_iterations
+        self.default_recursion_depth = profile.default_recursion_depth
 
     @abstractmethod
     def analyze(self, code: str, file_path: Optional[str] = None) -> AnalysisResult:
         """Parse and analyze the given source code."""
         pass
 
+    def _init_line_costs(self, code: str):
+        """Allocate the flat per-line accumulator (index 0 is unused)."""
+        self._line_costs = [0] * (code.count('\n') + 2) if self.track_lines else None
+        self._frames = []
+        self._stack_costs = {} if self.track_lines else None
+
+    def _add_line_cost(self, line: int, cost: int):
+        if 0 < line < len(self._line_costs):
+            self._line_costs[line] = min(self._line_costs[line] + cost, MAX_OPERATION_COUNT)
+        if cost:
+            stack = tuple(self._frames)
+            self._stack_costs[stack] = min(self._stack_costs.get(stack, 0) + cost, MAX_OPERATION_COUNT)
+
+    def _scale_line_costs(self, first_line: int, last_line: int, factor: int):
+        """Scale the accumulated cost of a line range (e.g. a recursive function).
+
+        Stacks under the current frame are scaled with it, so this must be
+        called before the function's frame is popped.
+        """
+        for i in range(max(1, first_line), min(last_line, len(self._line_costs) - 1) + 1):
+            self._line_costs[i] = saturating_mul(self._line_costs[i], factor)
+        prefix = tuple(self._frames)
+        for stack, cost in self._stack_costs.items():
+            if stack[:len(prefix)] == prefix:
+                self._stack_costs[stack] = saturating_mul(cost, factor)
+
+    def _line_costs_to_map(self) -> Optional[Dict[int, int]]:
+        """Export the flat accumulator as a sparse line -> cost map."""
+        if self._line_costs is None:
+            return None
+        return {line: cost for line, cost in enumerate(self._line_costs) if cost}
+
 
 # =============================================================================
 # PYTHON ANALYZER (AST-based, most accurate)
 # =============================================================================
 
+# Arithmetic operator -> operation type for BinOp / AugAssign nodes
+ARITHMETIC_OP_TYPES = {
+    ast.Add: OpType.ADDITION,
+    ast.Sub: OpType.SUBTRACTION,
+    ast.Mult: OpType.MULTIPLICATION, ast.MatMult: OpType.MULTIPLICATION,
+    ast.Div: OpType.DIVISION, ast.FloorDiv: OpType.DIVISION, ast.Mod: OpType.DIVISION,
+}
+
+# Operators that shrink (or grow) a loop variable geometrically: O(log n) loops
+HALVING_OPS = (ast.FloorDiv, ast.Div, ast.RShift, ast.Mult, ast.LShift)
+
+
+def _handles(*node_types):
+    """Mark a PythonAnalyzer method as the handler for the given AST node classes."""
+    def mark(method):
+        method._handles = tuple(t for t in node_types if t is not None)
+        return method
+    return mark
+
+
+def _detects(*node_types):
+    """Mark a PythonAnalyzer method as an energy anti-pattern rule for the given AST node classes."""
+    def mark(method):
+        method._detects = node_types
+        return method
+    return mark
+
+
+class _MemoryScope:
+    """Memory-model state of the function (or module) being analyzed."""
+
+    def __init__(self):
+        self.allocated = 0
+        # Name -> bytes it keeps live: its largest allocation plus appended growth
+        self.live: Dict[str, int] = {}
+        # Allocation node id -> bytes, for allocations not bound to a name
+        self.temporaries: Dict[int, int] = {}
+
+    def estimate(self) -> MemoryEstimate:
+        peak = sum(self.live.values()) + max(self.temporaries.values(), default=0)
+        return MemoryEstimate(self.allocated, min(peak, MAX_OPERATION_COUNT))
+
+
 class PythonAnalyzer(LanguageAnalyzer):
     """
     Analyzes Python source code using the built-in `ast` module.
@@ -307,14 +1599,111 @@ class PythonAnalyzer(LanguageAnalyzer):
         "DataFrame", "Series", "ndarray", "deepcopy", "copy",
     }
 
+    # Top-level modules whose calls go over the network (network-in-loop rule)
+    NETWORK_MODULES = {"requests", "urllib", "urllib3", "http", "httpx", "aiohttp", "socket"}
+
+    # Executions from which a loop counts as hot for the lookup-hoisting rules
+    HOT_LOOP_EXECUTIONS = 1000
+
+    # Builtins that never mutate their arguments (loop-invariance checks)
+    NON_MUTATING_CALLS = {
+        "len", "isinstance", "issubclass", "repr", "str", "int", "float", "bool", "abs",
+        "min", "max", "sum", "any", "all", "sorted", "hash", "id", "type", "range",
+        "enumerate", "zip", "print", "tuple", "frozenset",
+    }
+
+    # Qualified constructor -> container kind for the memory model
+    CONTAINER_CALLS = {
+        "list": "list", "tuple": "tuple", "set": "set", "frozenset": "frozenset",
+        "dict": "dict", "sorted": "list", "bytearray": "bytearray", "bytes": "bytes",
+        "collections.deque": "deque",
+        "list.copy": "list", "dict.copy": "dict", "set.copy": "set", "copy.copy": "list",
+        "copy.deepcopy": "list",
+    }
+    # Array constructors whose first argument is a shape
+    ARRAY_CONSTRUCTORS = {
+        "numpy.zeros", "numpy.ones", "numpy.empty", "numpy.full",
+        "torch.zeros", "torch.ones", "torch.empty", "torch.full",
+    }
+    # In-place growth methods -> receiver kind whose per-element size they add
+    # (add() only counts on names known to hold a set; it is too common otherwise)
+    GROWTH_METHODS = {"append": "list", "appendleft": "deque", "insert": "list", "add": "set"}
+
+    # Literal node -> builtin type name, used to qualify method calls
+    LITERAL_TYPES = {
+        ast.List: "list", ast.ListComp: "list",
+        ast.Dict: "dict", ast.DictComp: "dict",
+        ast.Set: "set", ast.SetComp: "set",
+        ast.Tuple: "tuple", ast.JoinedStr: "str",
+    }
+
+    def __init__(self, track_lines: bool = False, cost_database: Optional[CostDatabase] = None,
+                 parse_cache: Optional[ParseCache] = None, energy_profile: Optional[EnergyProfile] = None,
+                 constant_index: Optional[ProjectConstantIndex] = None,
+                 profile_index: Optional[ProfileIndex] = None):
+        super().__init__(track_lines=track_lines, energy_profile=energy_profile)
+        self.cost_database = cost_database or get_default_cost_database()
+        self.parse_cache = parse_cache if parse_cache is not None else get_parse_cache()
+        # Project-wide module constants for names imported from other files
+        self.constant_index = constant_index
+        # Observed counts that replace the loop/recursion heuristics
+        self.profile_index = profile_index
+
     def analyze(self, code: str, file_path: Optional[str] = None) -> AnalysisResult:
-        tree = ast.parse(code)
+        tree = self.parse_cache.parse(code)
         self.result = AnalysisResult(language="python", file_path=file_path)
+        self._init_line_costs(code)
+        # Running total of weighted ops already attributed to lines; lets each
+        # node subtract what its child statements attributed themselves
+        self._attributed_total = 0
 
         # Build a scope-level variable table for resolving loop bounds
         # This maps variable names to constant integer values found in assignments
         self._variable_constants: Dict[str, int] = {}
+        # Names whose constant is only the len() heuristic, i.e. grows with the input
+        self._symbolic_names: Set[str] = set()
+        # Local name -> qualified type name (e.g. 'list', 'requests.Session')
+        self._variable_types: Dict[str, str] = {}
+        # Local alias -> fully qualified module/callable from import statements
+        self._import_aliases: Dict[str, str] = {}
+        # This file's dotted module name, needed to resolve relative imports
+        self._module_name = (
+            self.constant_index.module_name(file_path) if self.constant_index and file_path else None
+        )
+        self._is_package = bool(file_path) and os.path.basename(file_path) == "__init__.py"
+        self._extract_imports(tree)
+        self._all_function_names = {
+            node.name for node in ast.walk(tree) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+        }
+        # Node id -> inferred element count (see _infer_container_lengths)
+        self._expr_lengths: Dict[int, int] = {}
+        # Loop line -> (assumed iterations, whether that is the default heuristic);
+        # statement line -> enclosing loop multiplier (line tracking only).
+        # Runtime calibration compares both against measured counts.
+        self._loop_bounds: Dict[int, Tuple[int, bool]] = {}
+        self._line_multipliers: Dict[int, int] = {}
+        # Anti-pattern rules (see _detects) run only inside loops: the
+        # enclosing (loop node, iterations) stack, the function being
+        # analyzed, and findings merged per (rule, line, message)
+        self._loop_stack: List[Tuple[ast.AST, int]] = []
+        self._current_function: Optional[str] = None
+        self._findings: Dict[Tuple[str, int, str], EnergyFinding] = {}
+        # (finding key, savings) reported by the rules of the node being
+        # analyzed, capped once its handler has counted it (see _run_rules)
+        self._rule_reports: Optional[List[Tuple[Tuple[str, int, str], int]]] = None
+        self._loop_mutations_cache: Dict[int, Set[str]] = {}
+        self._covered_attributes: Set[int] = set()
+        # Memory model state of the scope being analyzed (see _allocate)
+        self._memory = _MemoryScope()
+        # This file in the profile index, and the function whose profiled
+        # calls apply (see _observed_iterations)
+        self._profile_path = (
+            self.profile_index.resolve(file_path) if self.profile_index is not None and file_path else None
+        )
+        self._function_node: Optional[ast.AST] = None
+        self._function_callees: Dict[str, int] = {}
         self._extract_constant_assignments(tree)
+        self._module_lengths = self._infer_container_lengths(tree.body, {})
 
         self.result.assumptions.append(
             f"Energy per operation: {ENERGY_PER_OPERATION_JOULES} J"
@@ -322,11 +1711,11 @@ class PythonAnalyzer(LanguageAnalyzer):
         self.result.assumptions.append(
             f"Carbon intensity: {CARBON_INTENSITY_G_PER_KWH} gCO2/kWh (global average)"
         )
-
-        # Collect all function names for recursion detection
-        self._all_function_names = {
-            node.name for node in ast.walk(tree) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
-        }
+        if self._profile_path is not None:
+            self.result.assumptions.append(
+                f"Profile-guided: counts observed in {', '.join(self.profile_index.sources)} "
+                f"replace heuristic loop bounds and recursion depths"
+            )
 
         # Analyze top-level statements (global scope)
         for node in ast.iter_child_nodes(tree):
@@ -342,13 +1731,37 @@ class PythonAnalyzer(LanguageAnalyzer):
                 ops = self._analyze_node(node, loop_multiplier=1)
                 self.result.global_operations.merge(ops)
 
+        self.result.findings = sorted(self._findings.values(), key=lambda f: (-f.estimated_savings, f.line))
+        self.result.global_memory = self._memory.estimate()
+        self.result.line_costs = self._line_costs_to_map()
+        self.result.stack_costs = self._stack_costs
         return self.result
 
+    def _extract_imports(self, tree: ast.AST):
+        """Record import aliases so calls can be resolved to qualified names."""
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    if alias.asname:
+                        self._import_aliases[alias.asname] = alias.name
+                    else:
+                        top = alias.name.split(".")[0]
+                        self._import_aliases[top] = top
+            elif isinstance(node, ast.ImportFrom):
+                base = resolve_import_module(self._module_name, self._is_package, node.module, node.level)
+                if not base:
+                    continue
+                for alias in node.names:
+                    if alias.name != "*":
+                        self._import_aliases[alias.asname or alias.name] = f"{base}.{alias.name}"
+
     def _extract_constant_assignments(self, tree: ast.AST):
         """
         Walk the entire AST once and record variable = constant_int assignments.
         e.g. `n = 100` or `size = 50` — so we can resolve `range(n)` later.
         Also handles `n = len(arr)` as a heuristic (DEFAULT_LOOP_ITERATIONS).
+        The same walk records the type of variables bound to literals or
+        constructor calls, e.g. `d = {}` or `s = requests.Session()`.
         """
         for node in ast.walk(tree):
             if isinstance(node, ast.Assign) and len(node.targets) == 1:
@@ -357,9 +1770,31 @@ class PythonAnalyzer(LanguageAnalyzer):
                     val = self._resolve_constant_expr(node.value)
                     if val is not None:
                         self._variable_constants[target.id] = val
+                        if self._is_symbolic(node.value):
+                            self._symbolic_names.add(target.id)
+                        else:
+                            self._symbolic_names.discard(target.id)
+                    var_type = self._infer_value_type(node.value)
+                    if var_type is not None:
+                        self._variable_types[target.id] = var_type
             elif isinstance(node, ast.AugAssign):
                 pass  # Ignore augmented assignments for constant tracking
 
+    def _infer_value_type(self, node: ast.expr) -> Optional[str]:
+        """Qualified type of a literal or constructor-call expression, if known."""
+        literal_type = self.LITERAL_TYPES.get(type(node))
+        if literal_type:
+            return literal_type
+        if isinstance(node, ast.Constant) and isinstance(node.value, (str, bytes)):
+            return type(node.value).__name__
+        if isinstance(node, ast.Call):
+            qualified = self._qualify_call_name(node, self._get_full_call_name(node))
+            if qualified in ("list", "dict", "set", "tuple", "str", "bytes"):
+                return qualified
+            if qualified and "." in qualified and qualified.split(".")[0] in self._import_aliases.values():
+                return qualified
+        return None
+
     def _resolve_constant_expr(self, node: ast.expr) -> Optional[int]:
         """
         Try to resolve an expression node to a constant integer.
@@ -369,6 +1804,11 @@ class PythonAnalyzer(LanguageAnalyzer):
             return int(node.value)
         if isinstance(node, ast.Name) and node.id in self._variable_constants:
             return self._variable_constants[node.id]
+        if self.constant_index is not None and isinstance(node, (ast.Name, ast.Attribute)):
+            # Constant defined in another project module: `BATCH_SIZE` or `config.BATCH_SIZE`
+            qualified = self._qualify_reference(node)
+            if qualified is not None:
+                return self.constant_index.lookup(qualified)
         if isinstance(node, ast.BinOp):
             left = self._resolve_constant_expr(node.left)
             right = self._resolve_constant_expr(node.right)
@@ -378,21 +1818,63 @@ class PythonAnalyzer(LanguageAnalyzer):
                 if isinstance(node.op, ast.Mult): return left * right
                 if isinstance(node.op, ast.FloorDiv) and right != 0: return left // right
                 if isinstance(node.op, ast.Mod) and right != 0: return left % right
+                if isinstance(node.op, ast.Pow) and right >= 0:
+                    # Clamp before evaluating: 10 ** 10 ** 6 must not build a huge integer
+                    if abs(left) > 1 and right * math.log2(abs(left)) >= math.log2(MAX_OPERATION_COUNT):
+                        return MAX_OPERATION_COUNT if left > 0 or right % 2 == 0 else -MAX_OPERATION_COUNT
+                    return left ** right
         # len(something) — we can't know the size, use heuristic
         if isinstance(node, ast.Call):
             call_name = self._get_call_name(node)
             if call_name == "len":
-                return DEFAULT_LOOP_ITERATIONS  # heuristic
+                known = self._expr_lengths.get(id(node.args[0])) if node.args else None
+                return known if known is not None else self.default_loop_iterations  # heuristic
         return None
 
+    def _is_symbolic(self, node: ast.expr) -> bool:
+        """True when node's value depends on the input size (len() of an unknown collection)."""
+        for child in ast.walk(node):
+            if isinstance(child, ast.Name) and child.id in self._symbolic_names:
+                return True
+            if (isinstance(child, ast.Call) and self._get_call_name(child) == "len"
+                    and child.args and id(child.args[0]) not in self._expr_lengths):
+                return True
+        return False
+
+    def _qualify_reference(self, node: ast.expr) -> Optional[str]:
+        """Qualified name of an imported name or `module.ATTR` reference."""
+        parts = []
+        while isinstance(node, ast.Attribute):
+            parts.append(node.attr)
+            node = node.value
+        if not isinstance(node, ast.Name) or node.id not in self._import_aliases:
+            return None
+        return ".".join([self._import_aliases[node.id]] + parts[::-1])
+
     def _analyze_function(self, node: ast.FunctionDef, class_name: str = None) -> FunctionAnalysis:
         name = f"{class_name}.{node.name}" if class_name else node.name
         func = FunctionAnalysis(name=name, line_number=node.lineno)
+        frame_depth = len(self._frames)
+        self._frames.extend(name.split("."))
+        saved_function, self._current_function = self._current_function, name
+        saved_node, self._function_node = self._function_node, node
+        saved_callees = self._function_callees
+        saved_memory, self._memory = self._memory, _MemoryScope()
+        first_finding = len(self._findings)
 
         # Scan for local variable assignments within this function for loop bound resolution
         saved_vars = dict(self._variable_constants)
+        saved_symbolic = set(self._symbolic_names)
+        saved_types = dict(self._variable_types)
         self._extract_constant_assignments(node)
 
+        # Infer collection lengths through the body (parameters shadow globals)
+        lengths = dict(self._module_lengths)
+        for arg in ast.walk(node.args):
+            if isinstance(arg, ast.arg):
+                lengths.pop(arg.arg, None)
+        self._infer_container_lengths(node.body, lengths)
+
         # Detect recursion: does the function call itself?
         for child in ast.walk(node):
             if isinstance(child, ast.Call):
@@ -401,6 +1883,9 @@ class PythonAnalyzer(LanguageAnalyzer):
                     func.calls.append(call_name)
                     if call_name == node.name:
                         func.is_recursive = True
+        self._function_callees = {}
+        for call_name in func.calls:
+            self._function_callees[call_name] = self._function_callees.get(call_name, 0) + 1
 
         # Analyze every statement in the function body individually.
         # Each statement gets its own operation count, properly multiplied
@@ -409,309 +1894,1391 @@ class PythonAnalyzer(LanguageAnalyzer):
             ops = self._analyze_node(stmt, loop_multiplier=1)
             func.operations.merge(ops)
 
-        # If recursive, scale by estimated recursion depth
+        # If recursive, scale by the estimated number of activations
         if func.is_recursive:
-            func.operations = func.operations.scale(DEFAULT_RECURSION_DEPTH)
+            func.recursion = self._analyze_recursion(node)
+            observed = self._observed_recursion(node, func.recursion)
+            if observed is not None:
+                func.recursion = observed
+            activations = func.recursion.activations
+            func.operations = func.operations.scale(activations)
             self.result.assumptions.append(
-                f"Function '{name}' is recursive — assumed {DEFAULT_RECURSION_DEPTH} recursive calls"
+                f"Function '{name}' is recursive ({func.recursion.growth}, "
+                f"{func.recursion.calls_per_activation} self-call(s) per activation, "
+                f"{func.recursion.shrink.value} argument) — "
+                + (f"observed {activations} activations per call (cProfile)" if observed is not None
+                   else f"assumed {activations} activations")
             )
+            if self._line_costs is not None:
+                self._scale_line_costs(node.lineno, getattr(node, "end_lineno", node.lineno),
+                                       activations)
+            for finding in list(self._findings.values())[first_finding:]:
+                finding.executions = saturating_mul(finding.executions, activations)
+                finding.estimated_savings = saturating_mul(finding.estimated_savings, activations)
+
+        # Asymptotic class of one activation, then of the whole recursion
+        func.complexity = max(map(self._estimate_complexity, node.body))
+        if func.recursion is not None:
+            func.complexity = recursive_complexity(func.recursion, func.complexity)
+
+        # Every activation allocates; a recursion chain's frames are live together
+        func.memory = self._memory.estimate()
+        if func.recursion is not None:
+            func.memory = MemoryEstimate(
+                saturating_mul(func.memory.allocated_bytes, func.recursion.activations),
+                saturating_mul(func.memory.peak_bytes, func.recursion.depth),
+            )
+        self._memory = saved_memory
 
         # Track max loop nesting
         func.max_nesting = self._get_max_loop_depth(node)
 
         # Restore variable scope
         self._variable_constants = saved_vars
+        self._symbolic_names = saved_symbolic
+        self._variable_types = saved_types
+        self._current_function = saved_function
+        self._function_node = saved_node
+        self._function_callees = saved_callees
+        del self._frames[frame_depth:]
 
         return func
 
-    def _analyze_node(self, node: ast.AST, loop_multiplier: int = 1) -> OperationCount:
-        """
-        Recursively analyze an AST node and count operations.
+    def _analyze_recursion(self, node: ast.FunctionDef) -> RecursionProfile:
+        """Count self-call sites per activation and classify argument shrinkage."""
+        self_calls: List[ast.Call] = []
+        for child in ast.walk(node):
+            if isinstance(child, ast.Call) and self._get_call_name(child) == node.name:
+                self_calls.append(child)
+
+        # Names assigned from halving expressions, e.g. mid = (lo + hi) // 2
+        halved_names = set()
+        for child in ast.walk(node):
+            if isinstance(child, ast.Assign) and self._is_halving_expr(child.value):
+                for target in child.targets:
+                    if isinstance(target, ast.Name):
+                        halved_names.add(target.id)
+
+        shrinks = {self._classify_call_shrink(call, halved_names) for call in self_calls}
+        calls = max(1, self._max_self_calls(node.body, node.name))
+        return estimate_recursion(calls, dominant_shrink(shrinks), self.default_recursion_depth)
+
+    def _max_self_calls(self, stmts: List[ast.stmt], name: str) -> int:
+        """
+        Maximum number of self-calls along any single path through stmts.
+        Branches of an if/try are alternatives (max), sequences add up; a
+        branch ending in return/raise is an alternative to the statements
+        after the if, as in an early-return binary search.
+        """
+        total = 0
+        for index, stmt in enumerate(stmts):
+            if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                continue
+            if isinstance(stmt, ast.If):
+                total += self._count_self_calls(stmt.test, name)
+                branches = [stmt.body, stmt.orelse]
+                if any(self._ends_path(branch) for branch in branches):
+                    rest = self._max_self_calls(stmts[index + 1:], name)
+                    return total + max(
+                        self._max_self_calls(branch, name) + (0 if self._ends_path(branch) else rest)
+                        for branch in branches
+                    )
+                total += max(self._max_self_calls(branch, name) for branch in branches)
+            elif isinstance(stmt, ast.Try):
+                total += self._max_self_calls(stmt.body, name)
+                total += max([self._max_self_calls(h.body, name) for h in stmt.handlers] or [0])
+                total += self._max_self_calls(stmt.finalbody, name)
+            elif isinstance(stmt, (ast.For, ast.While, ast.With)):
+                for child in ast.iter_child_nodes(stmt):
+                    if not isinstance(child, ast.stmt):
+                        total += self._count_self_calls(child, name)
+                total += self._max_self_calls(stmt.body, name)
+                total += self._max_self_calls(getattr(stmt, "orelse", []), name)
+            else:
+                total += self._count_self_calls(stmt, name)
+                if isinstance(stmt, (ast.Return, ast.Raise)):
+                    break   # anything after is unreachable
+        return total
+
+    @staticmethod
+    def _ends_path(stmts: List[ast.stmt]) -> bool:
+        """True when stmts always leave the function (end in return/raise on every branch)."""
+        if not stmts:
+            return False
+        last = stmts[-1]
+        if isinstance(last, (ast.Return, ast.Raise)):
+            return True
+        if isinstance(last, ast.If):
+            return PythonAnalyzer._ends_path(last.body) and PythonAnalyzer._ends_path(last.orelse)
+        return False
+
+    def _count_self_calls(self, node: ast.AST, name: str) -> int:
+        return sum(
+            1 for child in ast.walk(node)
+            if isinstance(child, ast.Call) and self._get_call_name(child) == name
+        )
+
+    def _is_halving_expr(self, node: ast.AST) -> bool:
+        """True for expressions like n // 2, n / 2, n >> 1, (lo + hi) // 2."""
+        for child in ast.walk(node):
+            if isinstance(child, ast.BinOp):
+                if isinstance(child.op, (ast.FloorDiv, ast.Div)):
+                    divisor = self._resolve_constant_expr(child.right)
+                    if divisor is not None and divisor >= 2:
+                        return True
+                if isinstance(child.op, ast.RShift):
+                    return True
+        return False
+
+    def _classify_call_shrink(self, call: ast.Call, halved_names: set) -> ArgShrink:
+        """Classify how a recursive call shrinks its arguments."""
+        def mentions_halving(expr: ast.AST) -> bool:
+            return self._is_halving_expr(expr) or any(
+                isinstance(n, ast.Name) and n.id in halved_names for n in ast.walk(expr)
+            )
+
+        result = ArgShrink.UNKNOWN
+        for arg in list(call.args) + [kw.value for kw in call.keywords]:
+            if mentions_halving(arg):
+                result = ArgShrink.HALVING
+            elif isinstance(arg, ast.BinOp) and isinstance(arg.op, ast.Sub):
+                return ArgShrink.DECREMENT
+            elif isinstance(arg, ast.Subscript) and isinstance(arg.slice, ast.Slice):
+                return ArgShrink.DECREMENT
+        return result
+
+    def _analyze_node(self, node: ast.AST, loop_multiplier: int = 1) -> OperationCount:
+        """
+        Recursively analyze an AST node and count operations.
 
         CRITICAL: loop_multiplier is passed down into every child statement
         inside a loop body. This means if a loop runs N times and contains
         5 print statements + 3 additions, we count N*5 IO ops + N*3 additions.
         For nested loops, multipliers cascade: outer_N * inner_M * ops_in_body.
-        """
-        ops = OperationCount()
 
+        The work for each statement type is done by the handler registered
+        for its node class in the statement dispatch table.
+        """
         if node is None:
-            return ops
+            return OperationCount()
+
+        loop_frame = False
+        if self._line_costs is not None:
+            attributed_before = self._attributed_total
+            # Loops open a frame holding their header and body costs
+            loop_frame = isinstance(node, (ast.For, ast.AsyncFor, ast.While))
+            if loop_frame:
+                self._frames.append(f"{'while' if isinstance(node, ast.While) else 'for'}@{node.lineno}")
+
+        reports = self._run_rules(node, loop_multiplier) if self._loop_stack else None
+
+        handler = self._statement_handlers.get(type(node)) or self._resolve_handler(type(node))
+        ops = handler(self, node, loop_multiplier)
+        if reports:
+            self._cap_savings(reports, ops.total_weighted)
+
+        # Attribute this statement's own cost (excluding nested statements,
+        # which attributed themselves) to its source line
+        if self._line_costs is not None:
+            own = max(0, ops.total_weighted - (self._attributed_total - attributed_before))
+            self._add_line_cost(getattr(node, "lineno", 0), own)
+            self._attributed_total += own
+            self._line_multipliers[getattr(node, "lineno", 0)] = loop_multiplier
+            if loop_frame:
+                self._frames.pop()
 
-        # --- Assignments ---
-        if isinstance(node, (ast.Assign, ast.AugAssign, ast.AnnAssign)):
-            ops.add(OpType.ASSIGNMENT, loop_multiplier)
-            if hasattr(node, 'value') and node.value:
-                ops.merge(self._analyze_expression(node.value, loop_multiplier))
-            # For AugAssign (+=, -=, etc.) also count the arithmetic op
-            if isinstance(node, ast.AugAssign):
-                if isinstance(node.op, ast.Add):
-                    ops.add(OpType.ADDITION, loop_multiplier)
-                elif isinstance(node.op, ast.Sub):
-                    ops.add(OpType.SUBTRACTION, loop_multiplier)
-                elif isinstance(node.op, (ast.Mult, ast.MatMult)):
-                    ops.add(OpType.MULTIPLICATION, loop_multiplier)
-                elif isinstance(node.op, (ast.Div, ast.FloorDiv, ast.Mod)):
-                    ops.add(OpType.DIVISION, loop_multiplier)
-
-        # --- For loops ---
-        elif isinstance(node, ast.For):
-            iterations = self._estimate_for_iterations(node)
-            inner_multiplier = loop_multiplier * iterations
+        return ops
 
-            if iterations != DEFAULT_LOOP_ITERATIONS:
-                self.result.assumptions.append(
-                    f"Line {node.lineno}: for-loop resolved to {iterations} iterations"
-                )
-            else:
-                self.result.assumptions.append(
-                    f"Line {node.lineno}: for-loop iterations unknown, assumed {DEFAULT_LOOP_ITERATIONS}"
-                )
+    def _analyze_expression(self, node: ast.expr, multiplier: int = 1,
+                            ops: Optional[OperationCount] = None) -> OperationCount:
+        """
+        Analyze an expression node for operations.
 
-            # The loop condition is checked once per iteration
-            ops.add(OpType.COMPARISON, loop_multiplier * iterations)
+        Counts are added into `ops` when given (sub-expressions share their
+        parent's accumulator instead of allocating and merging their own).
+        """
+        if ops is None:
+            ops = OperationCount()
+        if node is not None:
+            reports = self._run_rules(node, multiplier) if self._loop_stack else None
+            if reports:
+                counted_before = ops.total_weighted
+            handler = self._expression_handlers.get(type(node)) or self._resolve_handler(type(node))
+            handler(self, node, multiplier, ops)
+            if reports:
+                self._cap_savings(reports, ops.total_weighted - counted_before)
+        return ops
 
-            # EACH statement in the loop body is analyzed with inner_multiplier
-            # so 10 print() calls inside a range(50) loop = 500 IO ops
-            for stmt in node.body:
-                ops.merge(self._analyze_node(stmt, inner_multiplier))
-            for stmt in node.orelse:
-                ops.merge(self._analyze_node(stmt, loop_multiplier))
+    # -------------------------------------------------------------------------
+    # Dispatch tables
+    # -------------------------------------------------------------------------
 
-        # --- While loops ---
-        elif isinstance(node, ast.While):
-            iterations = self._estimate_while_iterations(node)
-            inner_multiplier = loop_multiplier * iterations
+    @classmethod
+    def _build_dispatch_tables(cls):
+        """
+        Build the node class -> handler tables from @_handles methods (the most
+        derived override of each wins) plus handlers added with register_handler(),
+        and the node class -> rules table from @_detects methods.
+        """
+        names: Dict[type, str] = {}
+        registered: Dict[type, object] = {}
+        rule_types: Dict[str, tuple] = {}
+        for klass in reversed(cls.__mro__):
+            for attr, value in vars(klass).items():
+                for node_type in getattr(value, "_handles", ()):
+                    names[node_type] = attr
+                if hasattr(value, "_detects"):
+                    rule_types[attr] = value._detects
+            registered.update(vars(klass).get("_registered_handlers", {}))
+
+        cls._rule_table = {}
+        for attr, node_types in rule_types.items():
+            for node_type in node_types:
+                cls._rule_table.setdefault(node_type, []).append(getattr(cls, attr))
+
+        cls._statement_handlers = {}
+        cls._expression_handlers = {}
+        handlers = {node_type: getattr(cls, attr) for node_type, attr in names.items()}
+        handlers.update(registered)
+        for node_type, handler in handlers.items():
+            table = cls._statement_handlers if issubclass(node_type, ast.stmt) else cls._expression_handlers
+            table[node_type] = handler
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._build_dispatch_tables()
+
+    @classmethod
+    def register_handler(cls, node_type: type, handler):
+        """
+        Register a handler for an AST node type, replacing any built-in one.
+
+        Statement handlers are called as handler(analyzer, node, multiplier)
+        and return an OperationCount; expression handlers are called as
+        handler(analyzer, node, multiplier, ops) and add into ops. Use
+        analyzer._analyze_node / analyzer._analyze_expression for children.
+        Applies to cls and all of its subclasses.
+        """
+        if not (isinstance(node_type, type) and issubclass(node_type, ast.AST)):
+            raise ValueError(f"Expected an ast node class, got {node_type!r}")
+        if "_registered_handlers" not in vars(cls):
+            cls._registered_handlers = {}
+        cls._registered_handlers[node_type] = handler
+        pending = [cls]
+        while pending:
+            klass = pending.pop()
+            klass._build_dispatch_tables()
+            pending.extend(klass.__subclasses__())
+
+    @classmethod
+    def _resolve_handler(cls, node_type: type):
+        """Handler for a node class missing from the tables (cached on first use)."""
+        is_statement = issubclass(node_type, ast.stmt)
+        table = cls._statement_handlers if is_statement else cls._expression_handlers
+        handler = next((table[base] for base in node_type.__mro__[1:] if base in table), None)
+        if handler is None:
+            handler = cls._generic_statement if is_statement else cls._generic_expression
+        table[node_type] = handler
+        return handler
+
+    # -------------------------------------------------------------------------
+    # Statement handlers
+    # -------------------------------------------------------------------------
+
+    def _generic_statement(self, node: ast.stmt, loop_multiplier: int) -> OperationCount:
+        # Fallback: walk children for any other compound statement
+        ops = OperationCount()
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.stmt):
+                ops.merge(self._analyze_node(child, loop_multiplier))
+        return ops
+
+    def _analyze_block(self, body: List[ast.stmt], loop_multiplier: int, ops: OperationCount):
+        for stmt in body:
+            ops.merge(self._analyze_node(stmt, loop_multiplier))
+
+    @_handles(ast.Assign, ast.AugAssign, ast.AnnAssign)
+    def _handle_assign(self, node, loop_multiplier: int) -> OperationCount:
+        ops = OperationCount()
+        ops.add(OpType.ASSIGNMENT, loop_multiplier)
+        if node.value:
+            self._analyze_expression(node.value, loop_multiplier, ops)
+            self._bind_allocation(node, loop_multiplier)
+        # For AugAssign (+=, -=, etc.) also count the arithmetic op
+        if isinstance(node, ast.AugAssign):
+            op_type = ARITHMETIC_OP_TYPES.get(type(node.op))
+            if op_type is not None:
+                ops.add(op_type, loop_multiplier)
+        # Growing a string in a loop allocates and copies it every time
+        copied = self._string_concat_copies(node) if not isinstance(node, ast.AnnAssign) else None
+        if copied:
+            ops.add(OpType.MEMORY_ALLOC, loop_multiplier)
+            ops.add(OpType.ASSIGNMENT, saturating_mul(loop_multiplier, copied))
+        return ops
 
+    @_handles(ast.For, ast.AsyncFor)
+    def _handle_for(self, node, loop_multiplier: int) -> OperationCount:
+        ops = OperationCount()
+        resolved = self._resolve_for_iterations(node)
+        defaulted = resolved is None or self._is_symbolic(node.iter)
+        iterations = self.default_loop_iterations if resolved is None else resolved
+        # Observed counts win even over resolved bounds, which may rest on inferred lengths
+        observed = self._observed_iterations(node)
+        if observed is not None:
+            iterations, source = observed
+            defaulted = False
+        inner_multiplier = saturating_mul(loop_multiplier, iterations)
+        self._loop_bounds[node.lineno] = (iterations, defaulted)
+
+        if observed is not None:
             self.result.assumptions.append(
-                f"Line {node.lineno}: while-loop estimated {iterations} iterations"
+                f"Line {node.lineno}: for-loop observed {iterations} iterations per entry ({source})"
+            )
+        elif not defaulted:
+            self.result.assumptions.append(
+                f"Line {node.lineno}: for-loop resolved to {iterations} iterations"
+            )
+        else:
+            self.result.assumptions.append(
+                f"Line {node.lineno}: for-loop iterations unknown, assumed {self.default_loop_iterations}"
             )
 
-            ops.add(OpType.COMPARISON, loop_multiplier * iterations)
-            ops.merge(self._analyze_expression(node.test, loop_multiplier))
+        # The loop condition is checked once per iteration
+        ops.add(OpType.COMPARISON, saturating_mul(loop_multiplier, iterations))
 
-            # Each body statement gets the full multiplier
-            for stmt in node.body:
-                ops.merge(self._analyze_node(stmt, inner_multiplier))
-            for stmt in node.orelse:
-                ops.merge(self._analyze_node(stmt, loop_multiplier))
+        # EACH statement in the loop body is analyzed with inner_multiplier
+        # so 10 print() calls inside a range(50) loop = 500 IO ops
+        self._loop_stack.append((node, iterations))
+        self._analyze_block(node.body, inner_multiplier, ops)
+        self._loop_stack.pop()
+        self._analyze_block(node.orelse, loop_multiplier, ops)
+        return ops
 
-        # --- Conditionals ---
-        elif isinstance(node, ast.If):
-            ops.add(OpType.CONDITIONAL, loop_multiplier)
-            ops.merge(self._analyze_expression(node.test, loop_multiplier))
-            for stmt in node.body:
-                ops.merge(self._analyze_node(stmt, loop_multiplier))
-            for stmt in node.orelse:
-                ops.merge(self._analyze_node(stmt, loop_multiplier))
+    @_handles(ast.While)
+    def _handle_while(self, node: ast.While, loop_multiplier: int) -> OperationCount:
+        ops = OperationCount()
+        iterations = self._estimate_while_iterations(node)
+        defaulted = not self._is_halving_loop(node) and (
+            self._resolve_while_iterations(node) is None or self._is_symbolic(node.test))
+        # Observed counts win even over resolved bounds, which may rest on inferred lengths
+        observed = self._observed_iterations(node)
+        if observed is not None:
+            iterations, source = observed
+            defaulted = False
+        inner_multiplier = saturating_mul(loop_multiplier, iterations)
+        self._loop_bounds[node.lineno] = (iterations, defaulted)
+
+        if observed is not None:
+            self.result.assumptions.append(
+                f"Line {node.lineno}: while-loop observed {iterations} iterations per entry ({source})"
+            )
+        else:
+            self.result.assumptions.append(
+                f"Line {node.lineno}: while-loop estimated {iterations} iterations"
+            )
 
-        # --- Expression statements (function calls, etc.) ---
-        elif isinstance(node, ast.Expr):
-            ops.merge(self._analyze_expression(node.value, loop_multiplier))
+        ops.add(OpType.COMPARISON, saturating_mul(loop_multiplier, iterations))
+        self._analyze_expression(node.test, loop_multiplier, ops)
 
-        # --- Return ---
-        elif isinstance(node, ast.Return):
-            if node.value:
-                ops.merge(self._analyze_expression(node.value, loop_multiplier))
+        # Each body statement gets the full multiplier
+        self._loop_stack.append((node, iterations))
+        self._analyze_block(node.body, inner_multiplier, ops)
+        self._loop_stack.pop()
+        self._analyze_block(node.orelse, loop_multiplier, ops)
+        return ops
 
-        # --- Try/Except ---
-        elif isinstance(node, ast.Try):
-            for stmt in node.body:
-                ops.merge(self._analyze_node(stmt, loop_multiplier))
-            for handler in node.handlers:
-                for stmt in handler.body:
-                    ops.merge(self._analyze_node(stmt, loop_multiplier))
-            for stmt in node.finalbody:
-                ops.merge(self._analyze_node(stmt, loop_multiplier))
+    @_handles(ast.If)
+    def _handle_if(self, node: ast.If, loop_multiplier: int) -> OperationCount:
+        ops = OperationCount()
+        ops.add(OpType.CONDITIONAL, loop_multiplier)
+        self._analyze_expression(node.test, loop_multiplier, ops)
+        self._analyze_block(node.body, loop_multiplier, ops)
+        self._analyze_block(node.orelse, loop_multiplier, ops)
+        return ops
 
-        # --- With ---
-        elif isinstance(node, ast.With):
-            # with statements often involve I/O (file open)
-            for item in node.items:
-                ops.merge(self._analyze_expression(item.context_expr, loop_multiplier))
-            for stmt in node.body:
-                ops.merge(self._analyze_node(stmt, loop_multiplier))
+    @_handles(getattr(ast, "Match", None))
+    def _handle_match(self, node, loop_multiplier: int) -> OperationCount:
+        # Like an if/elif chain: one pattern test per case, every body counted
+        ops = OperationCount()
+        self._analyze_expression(node.subject, loop_multiplier, ops)
+        for case in node.cases:
+            ops.add(OpType.COMPARISON, loop_multiplier)
+            if case.guard is not None:
+                ops.add(OpType.CONDITIONAL, loop_multiplier)
+                self._analyze_expression(case.guard, loop_multiplier, ops)
+            self._analyze_block(case.body, loop_multiplier, ops)
+        return ops
 
-        # --- Delete ---
-        elif isinstance(node, ast.Delete):
-            ops.add(OpType.MEMORY_ALLOC, loop_multiplier)  # deallocation cost
+    @_handles(ast.Expr)
+    def _handle_expr_statement(self, node: ast.Expr, loop_multiplier: int) -> OperationCount:
+        return self._analyze_expression(node.value, loop_multiplier)
 
-        # --- Global/Nonlocal/Pass/Break/Continue — negligible cost ---
-        elif isinstance(node, (ast.Global, ast.Nonlocal, ast.Pass, ast.Break, ast.Continue)):
-            pass
+    @_handles(ast.Return)
+    def _handle_return(self, node: ast.Return, loop_multiplier: int) -> OperationCount:
+        return self._analyze_expression(node.value, loop_multiplier)
 
-        # --- Raise ---
-        elif isinstance(node, ast.Raise):
-            ops.add(OpType.FUNCTION_CALL, loop_multiplier)  # exception overhead
+    @_handles(ast.Try, getattr(ast, "TryStar", None))
+    def _handle_try(self, node, loop_multiplier: int) -> OperationCount:
+        ops = OperationCount()
+        self._analyze_block(node.body, loop_multiplier, ops)
+        for handler in node.handlers:
+            self._analyze_block(handler.body, loop_multiplier, ops)
+        self._analyze_block(node.finalbody, loop_multiplier, ops)
+        return ops
 
-        # Fallback: walk children for any other compound statement
-        else:
-            for child in ast.iter_child_nodes(node):
-                if isinstance(child, ast.stmt):
-                    ops.merge(self._analyze_node(child, loop_multiplier))
+    @_handles(ast.With, ast.AsyncWith)
+    def _handle_with(self, node, loop_multiplier: int) -> OperationCount:
+        # with statements often involve I/O (file open)
+        ops = OperationCount()
+        for item in node.items:
+            self._analyze_expression(item.context_expr, loop_multiplier, ops)
+        self._analyze_block(node.body, loop_multiplier, ops)
+        return ops
 
+    @_handles(ast.Delete)
+    def _handle_delete(self, node: ast.Delete, loop_multiplier: int) -> OperationCount:
+        ops = OperationCount()
+        ops.add(OpType.MEMORY_ALLOC, loop_multiplier)  # deallocation cost
         return ops
 
-    def _analyze_expression(self, node: ast.expr, multiplier: int = 1) -> OperationCount:
-        """Analyze an expression node for operations."""
+    # Global/Nonlocal/Pass/Break/Continue — negligible cost
+    @_handles(ast.Global, ast.Nonlocal, ast.Pass, ast.Break, ast.Continue)
+    def _handle_noop_statement(self, node: ast.stmt, loop_multiplier: int) -> OperationCount:
+        return OperationCount()
+
+    @_handles(ast.Raise)
+    def _handle_raise(self, node: ast.Raise, loop_multiplier: int) -> OperationCount:
         ops = OperationCount()
+        ops.add(OpType.FUNCTION_CALL, loop_multiplier)  # exception overhead
+        return ops
 
-        if node is None:
-            return ops
+    # -------------------------------------------------------------------------
+    # Expression handlers
+    # -------------------------------------------------------------------------
 
-        # --- Binary operations ---
-        if isinstance(node, ast.BinOp):
-            if isinstance(node.op, ast.Add):
-                ops.add(OpType.ADDITION, multiplier)
-            elif isinstance(node.op, ast.Sub):
-                ops.add(OpType.SUBTRACTION, multiplier)
-            elif isinstance(node.op, (ast.Mult, ast.MatMult)):
-                ops.add(OpType.MULTIPLICATION, multiplier)
-            elif isinstance(node.op, (ast.Div, ast.FloorDiv, ast.Mod)):
-                ops.add(OpType.DIVISION, multiplier)
-            elif isinstance(node.op, ast.Pow):
-                # Exponentiation is expensive — roughly equivalent to multiple multiplications
-                ops.add(OpType.MULTIPLICATION, multiplier * 10)
-            else:
-                ops.add(OpType.ADDITION, multiplier)  # bitwise ops ~ addition cost
-            ops.merge(self._analyze_expression(node.left, multiplier))
-            ops.merge(self._analyze_expression(node.right, multiplier))
-
-        # --- Comparisons ---
-        elif isinstance(node, ast.Compare):
-            ops.add(OpType.COMPARISON, multiplier * len(node.ops))
-            ops.merge(self._analyze_expression(node.left, multiplier))
-            for comp in node.comparators:
-                ops.merge(self._analyze_expression(comp, multiplier))
-
-        # --- Boolean operations ---
-        elif isinstance(node, ast.BoolOp):
-            ops.add(OpType.COMPARISON, multiplier * (len(node.values) - 1))
-            for val in node.values:
-                ops.merge(self._analyze_expression(val, multiplier))
-
-        # --- Function calls ---
-        elif isinstance(node, ast.Call):
-            call_name = self._get_call_name(node)
-            full_call = self._get_full_call_name(node)
-            if call_name:
-                if call_name in self.IO_FUNCTIONS or (full_call and any(
-                    io in full_call for io in ["print", "write", "read", "input", "open"]
-                )):
-                    ops.add(OpType.IO_OPERATION, multiplier)
-                elif call_name in self.NETWORK_FUNCTIONS or (full_call and any(
-                    net in full_call for net in ["request", "urlopen", "socket", "fetch"]
-                )):
-                    ops.add(OpType.NETWORK_OP, multiplier)
-                elif call_name in self.ALLOC_FUNCTIONS:
-                    ops.add(OpType.MEMORY_ALLOC, multiplier)
-                elif call_name in ("sorted", "sort"):
-                    # Sorting is O(n log n) — estimate based on what we know
-                    ops.add(OpType.COMPARISON, multiplier * DEFAULT_LOOP_ITERATIONS * 7)  # ~n*log(n)
-                    ops.add(OpType.ASSIGNMENT, multiplier * DEFAULT_LOOP_ITERATIONS * 7)
-                elif call_name in ("sum", "min", "max", "any", "all"):
-                    # These iterate over their argument — O(n)
-                    ops.add(OpType.ADDITION, multiplier * DEFAULT_LOOP_ITERATIONS)
-                    ops.add(OpType.COMPARISON, multiplier * DEFAULT_LOOP_ITERATIONS)
-                elif call_name in ("enumerate", "zip", "map", "filter", "reversed"):
-                    # Iterator wrappers — cost realized when iterated, minimal direct cost
-                    ops.add(OpType.FUNCTION_CALL, multiplier)
-                elif call_name == "range":
-                    # range() itself is cheap, cost is in the for loop that uses it
-                    ops.add(OpType.FUNCTION_CALL, multiplier)
-                elif call_name == "len":
-                    ops.add(OpType.FUNCTION_CALL, multiplier)
-                elif call_name == "append":
-                    ops.add(OpType.MEMORY_ALLOC, multiplier)
-                else:
-                    ops.add(OpType.FUNCTION_CALL, multiplier)
+    def _generic_expression(self, node: ast.expr, multiplier: int, ops: OperationCount):
+        # Names, constants and other leaves cost nothing by themselves
+        pass
+
+    @_handles(ast.BinOp)
+    def _handle_binop(self, node: ast.BinOp, multiplier: int, ops: OperationCount):
+        op_type = type(node.op)
+        if op_type is ast.Pow:
+            # Exponentiation is expensive — roughly equivalent to multiple multiplications
+            ops.add(OpType.MULTIPLICATION, multiplier * 10)
+        else:
+            # bitwise ops ~ addition cost
+            ops.add(ARITHMETIC_OP_TYPES.get(op_type, OpType.ADDITION), multiplier)
+        self._analyze_expression(node.left, multiplier, ops)
+        self._analyze_expression(node.right, multiplier, ops)
+        if op_type is ast.Mult:
+            # [0] * n builds a list of n copies
+            for seq, count in ((node.left, node.right), (node.right, node.left)):
+                if isinstance(seq, ast.List):
+                    repeat = self._resolve_constant_expr(count)
+                    if repeat is None:
+                        repeat = self.default_loop_iterations
+                    self._memory.temporaries.pop(id(seq), None)
+                    self._allocate(node, "list", saturating_mul(len(seq.elts), max(0, repeat)), multiplier)
+                    break
+
+    @_handles(ast.Compare)
+    def _handle_compare(self, node: ast.Compare, multiplier: int, ops: OperationCount):
+        ops.add(OpType.COMPARISON, multiplier * len(node.ops))
+        self._analyze_expression(node.left, multiplier, ops)
+        for comp in node.comparators:
+            self._analyze_expression(comp, multiplier, ops)
+
+    @_handles(ast.BoolOp)
+    def _handle_boolop(self, node: ast.BoolOp, multiplier: int, ops: OperationCount):
+        ops.add(OpType.COMPARISON, multiplier * (len(node.values) - 1))
+        for val in node.values:
+            self._analyze_expression(val, multiplier, ops)
+
+    @_handles(ast.Call)
+    def _handle_call(self, node: ast.Call, multiplier: int, ops: OperationCount):
+        call_name = self._get_call_name(node)
+        full_call = self._get_full_call_name(node)
+        call_cost = self._lookup_call_cost(node, full_call)
+        if call_cost is not None:
+            # Known callable: cost formula over the argument/receiver sizes
+            n, m = self._call_sizes(node)
+            for op_type, count in call_cost.evaluate(n, m):
+                ops.add(op_type, multiplier * count)
+        elif call_name:
+            if call_name in self.IO_FUNCTIONS or (full_call and any(
+                io in full_call for io in ["print", "write", "read", "input", "open"]
+            )):
+                ops.add(OpType.IO_OPERATION, multiplier)
+            elif self._is_network_call(node, full_call, call_name):
+                ops.add(OpType.NETWORK_OP, multiplier)
+            elif call_name in self.ALLOC_FUNCTIONS:
+                ops.add(OpType.MEMORY_ALLOC, multiplier)
+            elif call_name in ("enumerate", "zip", "map", "filter", "reversed"):
+                # Iterator wrappers — cost realized when iterated, minimal direct cost
+                ops.add(OpType.FUNCTION_CALL, multiplier)
+            elif call_name == "range":
+                # range() itself is cheap, cost is in the for loop that uses it
+                ops.add(OpType.FUNCTION_CALL, multiplier)
+            elif call_name == "len":
+                ops.add(OpType.FUNCTION_CALL, multiplier)
+            elif call_name == "append":
+                ops.add(OpType.MEMORY_ALLOC, multiplier)
             else:
                 ops.add(OpType.FUNCTION_CALL, multiplier)
+        else:
+            ops.add(OpType.FUNCTION_CALL, multiplier)
+
+        # Analyze arguments
+        for arg in node.args:
+            self._analyze_expression(arg, multiplier, ops)
+        for kw in node.keywords:
+            self._analyze_expression(kw.value, multiplier, ops)
+        self._call_allocation(node, full_call, multiplier)
+
+    @_handles(ast.Subscript)
+    def _handle_subscript(self, node: ast.Subscript, multiplier: int, ops: OperationCount):
+        # Array/dict access
+        ops.add(OpType.ARRAY_ACCESS, multiplier)
+        self._analyze_expression(node.value, multiplier, ops)
+        self._analyze_expression(node.slice, multiplier, ops)
+
+    @_handles(ast.ListComp, ast.SetComp, ast.GeneratorExp)
+    def _handle_comprehension(self, node, multiplier: int, ops: OperationCount):
+        # Comprehensions are implicit loops; estimate iterations from the generator
+        comp_iterations = self._estimate_comprehension_iterations(node)
+        inner_mult = saturating_mul(multiplier, comp_iterations)
+        ops.add(OpType.MEMORY_ALLOC, multiplier)  # creating the collection
+        # The element expression runs once per iteration
+        self._analyze_expression(node.elt, inner_mult, ops)
+        for gen in node.generators:
+            ops.add(OpType.COMPARISON, inner_mult)
+            self._analyze_expression(gen.iter, multiplier, ops)
+            for if_clause in gen.ifs:
+                ops.add(OpType.CONDITIONAL, inner_mult)
+                self._analyze_expression(if_clause, inner_mult, ops)
+        kind = "list" if isinstance(node, ast.ListComp) else "set" if isinstance(node, ast.SetComp) else "generator"
+        self._allocate(node, kind, comp_iterations, multiplier)
+
+    @_handles(ast.DictComp)
+    def _handle_dictcomp(self, node: ast.DictComp, multiplier: int, ops: OperationCount):
+        comp_iterations = self._estimate_comprehension_iterations(node)
+        inner_mult = saturating_mul(multiplier, comp_iterations)
+        ops.add(OpType.MEMORY_ALLOC, multiplier)
+        self._analyze_expression(node.key, inner_mult, ops)
+        self._analyze_expression(node.value, inner_mult, ops)
+        for gen in node.generators:
+            self._analyze_expression(gen.iter, multiplier, ops)
+        self._allocate(node, "dict", comp_iterations, multiplier)
+
+    @_handles(ast.UnaryOp)
+    def _handle_unaryop(self, node: ast.UnaryOp, multiplier: int, ops: OperationCount):
+        ops.add(OpType.ADDITION, multiplier)
+        self._analyze_expression(node.operand, multiplier, ops)
+
+    @_handles(ast.Attribute, ast.Starred)
+    def _handle_attribute(self, node, multiplier: int, ops: OperationCount):
+        self._analyze_expression(node.value, multiplier, ops)
+
+    @_handles(ast.IfExp)
+    def _handle_ifexp(self, node: ast.IfExp, multiplier: int, ops: OperationCount):
+        # Ternary if-expression
+        ops.add(OpType.CONDITIONAL, multiplier)
+        self._analyze_expression(node.test, multiplier, ops)
+        self._analyze_expression(node.body, multiplier, ops)
+        self._analyze_expression(node.orelse, multiplier, ops)
+
+    @_handles(ast.List, ast.Tuple, ast.Set)
+    def _handle_sequence_literal(self, node, multiplier: int, ops: OperationCount):
+        # Allocating a collection has a cost proportional to its size
+        if len(node.elts) > 0:
+            ops.add(OpType.MEMORY_ALLOC, multiplier)
+            ops.add(OpType.ASSIGNMENT, multiplier * len(node.elts))
+        for elt in node.elts:
+            self._analyze_expression(elt, multiplier, ops)
+        # Tuples of constants are folded into the code object at compile time
+        if not (isinstance(node, ast.Tuple) and all(isinstance(e, ast.Constant) for e in node.elts)):
+            self._allocate(node, self.LITERAL_TYPES[type(node)], len(node.elts), multiplier)
+
+    @_handles(ast.Dict)
+    def _handle_dict_literal(self, node: ast.Dict, multiplier: int, ops: OperationCount):
+        if len(node.keys) > 0:
+            ops.add(OpType.MEMORY_ALLOC, multiplier)
+            ops.add(OpType.ASSIGNMENT, multiplier * len(node.keys))
+        for k in node.keys:
+            if k:
+                self._analyze_expression(k, multiplier, ops)
+        for v in node.values:
+            self._analyze_expression(v, multiplier, ops)
+        self._allocate(node, "dict", len(node.keys), multiplier)
+
+    @_handles(ast.JoinedStr)
+    def _handle_fstring(self, node: ast.JoinedStr, multiplier: int, ops: OperationCount):
+        # f-string formatting — each value is an expression
+        length = 0
+        for val in node.values:
+            if isinstance(val, ast.FormattedValue):
+                self._analyze_expression(val.value, multiplier, ops)
+                ops.add(OpType.FUNCTION_CALL, multiplier)  # string formatting cost
+                length += 8  # typical width of a formatted number or short name
+            elif isinstance(val, ast.Constant) and isinstance(val.value, str):
+                length += len(val.value)
+        self._allocate(node, "str", length, multiplier)
+
+    @_handles(ast.Await)
+    def _handle_await(self, node: ast.Await, multiplier: int, ops: OperationCount):
+        ops.add(OpType.FUNCTION_CALL, multiplier)  # suspend/resume of the coroutine
+        self._analyze_expression(node.value, multiplier, ops)
+
+    @_handles(ast.NamedExpr)
+    def _handle_walrus(self, node: ast.NamedExpr, multiplier: int, ops: OperationCount):
+        ops.add(OpType.ASSIGNMENT, multiplier)
+        self._analyze_expression(node.value, multiplier, ops)
+
+    # -------------------------------------------------------------------------
+    # Memory model
+    # -------------------------------------------------------------------------
+    # Allocation sites record bytes per execution; allocated bytes are
+    # multiplied by the loop multiplier, live bytes are not (a name rebound
+    # on every iteration keeps one instance alive) except for in-place growth.
+
+    def _allocate(self, node: ast.AST, kind: str, elements: int, multiplier: int,
+                  element_bytes: Optional[int] = None):
+        header, per_element = CONTAINER_BYTES[kind]
+        per_element = per_element if element_bytes is None else element_bytes
+        size = min(header + saturating_mul(max(0, elements), per_element), MAX_OPERATION_COUNT)
+        memory = self._memory
+        memory.allocated = min(memory.allocated + saturating_mul(size, multiplier), MAX_OPERATION_COUNT)
+        memory.temporaries[id(node)] = size
+
+    def _grow(self, name: Optional[str], size: int, multiplier: int, retained: int = 0):
+        """
+        In-place growth of a container (append, +=): every execution allocates
+        size bytes and keeps them live, plus `retained` bytes of the element
+        itself, which were allocated where it was built.
+        """
+        memory = self._memory
+        memory.allocated = min(memory.allocated + saturating_mul(size, multiplier), MAX_OPERATION_COUNT)
+        if name is not None:
+            grown = saturating_mul(min(size + retained, MAX_OPERATION_COUNT), multiplier)
+            memory.live[name] = min(memory.live.get(name, 0) + grown, MAX_OPERATION_COUNT)
+
+    def _bind_allocation(self, node, multiplier: int):
+        """Move an allocation assigned to a name from the temporaries to the live set."""
+        size = self._memory.temporaries.pop(id(node.value), None)
+        if size is None:
+            return
+        targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+        names = [self._dotted_name(t) for t in targets if self._dotted_name(t)]
+        stored_in = [self._dotted_name(t.value) for t in targets if isinstance(t, ast.Subscript)]
+        if not names and stored_in:
+            # d[k] = [...]: the new object lives on inside the container
+            self._grow(stored_in[0], size, multiplier)
+        elif not names:
+            self._memory.temporaries[id(node.value)] = size
+        elif isinstance(node, ast.AugAssign):
+            # xs += [...] extends xs in place; the right-hand side was a temporary
+            self._grow(names[0], size, multiplier, self._element_bytes(node.value))
+        else:
+            live = self._memory.live
+            for name in names:
+                live[name] = max(live.get(name, 0), size)
+
+    def _call_allocation(self, node: ast.Call, full_call: Optional[str], multiplier: int):
+        """Memory allocated by constructor, array and in-place growth calls."""
+        qualified = self._qualify_call_name(node, full_call)
+        func = node.func
+        if qualified in self.ARRAY_CONSTRUCTORS:
+            shape = node.args[0] if node.args else next(
+                (kw.value for kw in node.keywords if kw.arg in ("shape", "size")), None)
+            dims = shape.elts if isinstance(shape, (ast.Tuple, ast.List)) else [shape] if shape else []
+            elements = 1
+            for dim in dims:
+                value = self._resolve_constant_expr(dim)
+                elements = saturating_mul(elements, self.default_loop_iterations if value is None else max(0, value))
+            dtype = next((kw.value for kw in node.keywords if kw.arg == "dtype"), None)
+            if dtype is None and len(node.args) > 1 and not qualified.endswith(".full"):
+                dtype = node.args[1]
+            dtype_name = dtype.attr if isinstance(dtype, ast.Attribute) else \
+                dtype.id if isinstance(dtype, ast.Name) else \
+                dtype.value if isinstance(dtype, ast.Constant) else None
+            item_bytes = DTYPE_BYTES.get(dtype_name, 8)
+            if qualified.startswith("torch.") and dtype is None:
+                item_bytes = 4  # torch defaults to float32
+            self._allocate(node, "ndarray", elements, multiplier, element_bytes=item_bytes)
+        elif qualified in self.CONTAINER_CALLS:
+            operands = node.args or ([func.value] if isinstance(func, ast.Attribute) and "." in qualified
+                                     and not qualified.startswith("copy.") else [])
+            elements = self._estimate_size(operands[0]) if operands else 0
+            self._allocate(node, self.CONTAINER_CALLS[qualified], elements, multiplier)
+        elif isinstance(func, ast.Attribute) and func.attr in self.GROWTH_METHODS:
+            receiver = self._dotted_name(func.value)
+            kind = self.GROWTH_METHODS[func.attr]
+            receiver_type = self._variable_types.get(receiver) if receiver is not None else None
+            if kind == "set" and receiver_type not in ("set", "frozenset"):
+                return
+            if receiver_type in CONTAINER_BYTES:
+                kind = receiver_type
+            # The container keeps the element alive too, not just a slot for it:
+            # a fresh object, or every instance of a name rebound in the loop
+            element = node.args[-1] if node.args else None
+            retained = self._memory.temporaries.pop(id(element), 0)
+            if isinstance(element, ast.Name) and multiplier > 1:
+                retained = self._memory.live.get(element.id, 0)
+            self._grow(receiver, CONTAINER_BYTES[kind][1], multiplier, retained)
+        elif isinstance(func, ast.Attribute) and func.attr == "extend" and node.args:
+            self._grow(self._dotted_name(func.value),
+                       saturating_mul(self._estimate_size(node.args[0]), CONTAINER_BYTES["list"][1]), multiplier,
+                       self._element_bytes(node.args[0]))
+
+    def _element_bytes(self, node: ast.expr) -> int:
+        """Bytes of the objects built for the elements of a list/tuple/set display."""
+        if not isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            return 0
+        temporaries = self._memory.temporaries
+        return min(sum(temporaries.pop(id(elt), 0) for elt in node.elts), MAX_OPERATION_COUNT)
+
+    # -------------------------------------------------------------------------
+    # Energy anti-pattern rules
+    # -------------------------------------------------------------------------
+    # Called as rule(analyzer, node, multiplier) for nodes inside a loop body,
+    # from the same walk that counts operations. Savings are weighted ops
+    # over all executions of the node, i.e. priced with its loop multiplier.
+
+    def _report(self, rule: str, node: ast.AST, multiplier: int, savings: int,
+                message: str, suggestion: str):
+        if savings <= 0:
+            return
+        key = (rule, node.lineno, message)
+        finding = self._findings.get(key)
+        if finding is None:
+            self._findings[key] = EnergyFinding(rule, node.lineno, self._current_function, message,
+                                                suggestion, multiplier, savings)
+        else:
+            # Same pattern repeated on one line, e.g. len(xs) twice
+            finding.executions = min(finding.executions + multiplier, MAX_OPERATION_COUNT)
+            finding.estimated_savings = min(finding.estimated_savings + savings, MAX_OPERATION_COUNT)
+        if self._rule_reports is not None:
+            self._rule_reports.append((key, savings))
+
+    def _run_rules(self, node: ast.AST, multiplier: int) -> list:
+        """Run the rules registered for a node; returns what they reported."""
+        rules = self._rule_table.get(type(node))
+        if not rules:
+            return []
+        self._rule_reports = reports = []
+        for rule in rules:
+            rule(self, node, multiplier)
+        self._rule_reports = None
+        return reports
+
+    def _cap_savings(self, reports: list, counted: int):
+        """
+        Trim the savings reported for one node to the weighted ops its handler
+        counted: a finding cannot save work the estimate never included.
+        """
+        for key, savings in reports:
+            allowed = min(savings, max(0, counted))
+            counted -= allowed
+            finding = self._findings.get(key)
+            if finding is None or allowed == savings:
+                continue
+            finding.estimated_savings -= min(savings - allowed, finding.estimated_savings)
+            if finding.estimated_savings <= 0:
+                del self._findings[key]
+
+    def _hoisting_savings(self, multiplier: int, cost: int) -> int:
+        """Ops saved by running a cost-per-execution step once per entry to the innermost loop."""
+        iterations = self._loop_stack[-1][1]
+        return saturating_mul(multiplier - max(1, multiplier // max(1, iterations)), cost)
+
+    @staticmethod
+    def _dotted_name(node: Optional[ast.expr]) -> Optional[str]:
+        """'a.b.c' for a Name/Attribute chain, else None."""
+        parts = []
+        while isinstance(node, ast.Attribute):
+            parts.append(node.attr)
+            node = node.value
+        if not isinstance(node, ast.Name):
+            return None
+        return ".".join([node.id] + parts[::-1])
+
+    def _loop_mutations(self, loop: ast.AST) -> Tuple[Set[str], Set[str]]:
+        """
+        Dotted names a loop may change: (rebound, touched). Rebound are
+        assignment/del targets (subscript stores rebind the container's
+        contents); touched are method-call receivers and call arguments,
+        whose contents and attributes a call may change. Computed lazily,
+        once per loop, only when a rule needs an invariance check.
+        """
+        cached = self._loop_mutations_cache.get(id(loop))
+        if cached is None:
+            rebound, touched = set(), set()
+            for node in ast.walk(loop):
+                if isinstance(node, (ast.Name, ast.Attribute, ast.Subscript)) and \
+                        isinstance(node.ctx, (ast.Store, ast.Del)):
+                    name = self._dotted_name(node.value if isinstance(node, ast.Subscript) else node)
+                    if name:
+                        rebound.add(name)
+                elif isinstance(node, ast.Call):
+                    if isinstance(node.func, ast.Attribute):
+                        candidates = [node.func.value] + list(node.args)
+                    elif self._get_call_name(node) in self.NON_MUTATING_CALLS:
+                        continue
+                    else:
+                        candidates = list(node.args)
+                    candidates.extend(kw.value for kw in node.keywords)
+                    touched.update(name for name in map(self._dotted_name, candidates) if name)
+            cached = self._loop_mutations_cache[id(loop)] = (rebound, touched)
+        return cached
+
+    def _is_loop_invariant(self, dotted: str, contents: bool = True) -> bool:
+        """
+        Whether the innermost loop leaves `dotted` alone. With contents=False
+        only the binding matters (attribute lookups), so touching the object
+        itself is fine but touching or rebinding any prefix of it is not.
+        """
+        rebound, touched = self._loop_mutations(self._loop_stack[-1][0])
+        if any(dotted == name or dotted.startswith(name + ".") for name in rebound):
+            return False
+        return not any(
+            dotted.startswith(name + ".") or (contents and dotted == name) for name in touched
+        )
+
+    def _string_concat_target(self, node: Union[ast.AugAssign, ast.Assign]) -> Optional[str]:
+        """The name grown by `s += <str>` or `s = s + <str>` in a loop, else None."""
+        if not self._loop_stack:
+            return None
+        if isinstance(node, ast.AugAssign):
+            target, op, piece = node.target, node.op, node.value
+        elif len(node.targets) == 1 and isinstance(node.value, ast.BinOp):
+            target, op, piece = node.targets[0], node.value.op, node.value.right
+            if not (isinstance(node.value.left, ast.Name) and isinstance(target, ast.Name)
+                    and node.value.left.id == target.id):
+                return None
+        else:
+            return None
+        if not isinstance(op, ast.Add) or not isinstance(target, ast.Name):
+            return None
+        if self._variable_types.get(target.id) != "str" and self._infer_value_type(piece) != "str":
+            return None
+        return target.id
+
+    def _string_concat_copies(self, node: Union[ast.AugAssign, ast.Assign]) -> Optional[int]:
+        """
+        Pieces copied by one execution of `s += <str>` in a loop (each += copies
+        the string built so far: about half the pieces on average), else None.
+        """
+        if self._string_concat_target(node) is None:
+            return None
+        return self._loop_stack[-1][1] // 2
+
+    @_detects(ast.AugAssign, ast.Assign)
+    def _rule_string_concat(self, node: Union[ast.AugAssign, ast.Assign], multiplier: int):
+        name = self._string_concat_target(node)
+        if name is None:
+            return
+        copied = self._loop_stack[-1][1] // 2
+        form = "+=" if isinstance(node, ast.AugAssign) else f"{name} = {name} + ..."
+        self._report(
+            "string-concat-in-loop", node, multiplier,
+            saturating_mul(multiplier, OPERATION_WEIGHTS[OpType.MEMORY_ALLOC] + copied),
+            f"string '{name}' built with {form} in a loop (quadratic copying)",
+            "append the pieces to a list and ''.join() them after the loop",
+        )
 
-            # Analyze arguments
-            for arg in node.args:
-                ops.merge(self._analyze_expression(arg, multiplier))
-            for kw in node.keywords:
-                ops.merge(self._analyze_expression(kw.value, multiplier))
+    @_detects(ast.Compare)
+    def _rule_list_membership(self, node: ast.Compare, multiplier: int):
+        for op, container in zip(node.ops, node.comparators):
+            if not isinstance(op, (ast.In, ast.NotIn)):
+                continue
+            if isinstance(container, ast.List):
+                length = len(container.elts)
+            elif isinstance(container, ast.Name) and self._variable_types.get(container.id) == "list":
+                length = self._expr_lengths.get(id(container), self.default_loop_iterations)
+            else:
+                continue
+            # A list scan compares half the elements on average; a set probes once
+            self._report(
+                "list-membership-in-loop", node, multiplier,
+                saturating_mul(multiplier, (length // 2 - 1) * OPERATION_WEIGHTS[OpType.COMPARISON]),
+                f"membership test against a list of ~{length} elements in a loop",
+                "build a set (or frozenset) once before the loop and test against it",
+            )
 
-        # --- Subscript (array/dict access) ---
-        elif isinstance(node, ast.Subscript):
-            ops.add(OpType.ARRAY_ACCESS, multiplier)
-            ops.merge(self._analyze_expression(node.value, multiplier))
-            ops.merge(self._analyze_expression(node.slice, multiplier))
-
-        # --- List/Set/Dict comprehensions (implicit loop) ---
-        elif isinstance(node, (ast.ListComp, ast.SetComp, ast.GeneratorExp)):
-            # Estimate iterations from the generator
-            comp_iterations = self._estimate_comprehension_iterations(node)
-            inner_mult = multiplier * comp_iterations
-            ops.add(OpType.MEMORY_ALLOC, multiplier)  # creating the collection
-            # The element expression runs once per iteration
-            ops.merge(self._analyze_expression(node.elt, inner_mult))
-            for gen in node.generators:
-                ops.add(OpType.COMPARISON, inner_mult)
-                ops.merge(self._analyze_expression(gen.iter, multiplier))
-                for if_clause in gen.ifs:
-                    ops.add(OpType.CONDITIONAL, inner_mult)
-                    ops.merge(self._analyze_expression(if_clause, inner_mult))
-
-        elif isinstance(node, ast.DictComp):
-            comp_iterations = self._estimate_comprehension_iterations(node)
-            inner_mult = multiplier * comp_iterations
-            ops.add(OpType.MEMORY_ALLOC, multiplier)
-            ops.merge(self._analyze_expression(node.key, inner_mult))
-            ops.merge(self._analyze_expression(node.value, inner_mult))
-            for gen in node.generators:
-                ops.merge(self._analyze_expression(gen.iter, multiplier))
+    @_detects(ast.Call)
+    def _rule_invariant_len(self, node: ast.Call, multiplier: int):
+        if multiplier < self.HOT_LOOP_EXECUTIONS or len(node.args) != 1:
+            return
+        if self._qualify_call_name(node, self._get_full_call_name(node)) != "len":
+            return
+        target = self._dotted_name(node.args[0])
+        if target is None or not self._is_loop_invariant(target):
+            return
+        self._report(
+            "loop-invariant-len", node, multiplier,
+            self._hoisting_savings(multiplier, OPERATION_WEIGHTS[OpType.FUNCTION_CALL]),
+            f"len({target}) recomputed on every iteration of a hot loop",
+            "compute it once before the loop",
+        )
 
-        # --- Unary operations ---
-        elif isinstance(node, ast.UnaryOp):
-            ops.add(OpType.ADDITION, multiplier)
-            ops.merge(self._analyze_expression(node.operand, multiplier))
+    @_detects(ast.Attribute)
+    def _rule_attribute_lookup(self, node: ast.Attribute, multiplier: int):
+        if multiplier < self.HOT_LOOP_EXECUTIONS or not isinstance(node.ctx, ast.Load):
+            return
+        if id(node) in self._covered_attributes:
+            return
+        dotted = self._dotted_name(node)
+        hops = dotted.count(".") if dotted else 0
+        if hops < 2:
+            return
+        # Only the outermost link of a chain is judged
+        inner = node.value
+        while isinstance(inner, ast.Attribute):
+            self._covered_attributes.add(id(inner))
+            inner = inner.value
+        if not self._is_loop_invariant(dotted, contents=False):
+            return
+        self._report(
+            "attribute-lookup-in-loop", node, multiplier,
+            self._hoisting_savings(multiplier, hops * OPERATION_WEIGHTS[OpType.ARRAY_ACCESS]),
+            f"attribute chain {dotted} looked up on every iteration of a hot loop",
+            "bind it to a local variable before the loop",
+        )
 
-        # --- Attribute access ---
-        elif isinstance(node, ast.Attribute):
-            ops.merge(self._analyze_expression(node.value, multiplier))
+    @_detects(ast.Call)
+    def _rule_io_in_loop(self, node: ast.Call, multiplier: int):
+        qualified = self._qualify_call_name(node, self._get_full_call_name(node))
+        if qualified == "open":
+            # Opening a different file per iteration is not hoistable
+            path = node.args[0] if node.args else None
+            if path is None or not all(
+                self._is_loop_invariant(name.id) for name in ast.walk(path) if isinstance(name, ast.Name)
+            ):
+                return
+            self._report(
+                "io-in-loop", node, multiplier,
+                self._hoisting_savings(multiplier, OPERATION_WEIGHTS[OpType.IO_OPERATION]),
+                "open() called inside a loop",
+                "open the file once outside the loop (or batch the writes)",
+            )
+        elif (qualified and qualified.split(".")[0] in self.NETWORK_MODULES) or \
+                self._get_call_name(node) == "urlopen":
+            self._report(
+                "network-in-loop", node, multiplier,
+                self._hoisting_savings(multiplier, OPERATION_WEIGHTS[OpType.NETWORK_OP]),
+                f"network call {qualified or 'urlopen'}() inside a loop",
+                "batch the requests into one call, or reuse a session opened outside the loop",
+            )
 
-        # --- Ternary if-expression ---
-        elif isinstance(node, ast.IfExp):
-            ops.add(OpType.CONDITIONAL, multiplier)
-            ops.merge(self._analyze_expression(node.test, multiplier))
-            ops.merge(self._analyze_expression(node.body, multiplier))
-            ops.merge(self._analyze_expression(node.orelse, multiplier))
-
-        # --- Collection literals ---
-        elif isinstance(node, (ast.List, ast.Tuple, ast.Set)):
-            # Allocating a collection has a cost proportional to its size
-            if len(node.elts) > 0:
-                ops.add(OpType.MEMORY_ALLOC, multiplier)
-                ops.add(OpType.ASSIGNMENT, multiplier * len(node.elts))
-            for elt in node.elts:
-                ops.merge(self._analyze_expression(elt, multiplier))
+    @_detects(ast.Call)
+    def _rule_list_front_insert(self, node: ast.Call, multiplier: int):
+        func = node.func
+        if not isinstance(func, ast.Attribute) or not node.args:
+            return
+        first = node.args[0]
+        if not (isinstance(first, ast.Constant) and first.value == 0 and not isinstance(first.value, bool)):
+            return
+        receiver_type = self._variable_types.get(func.value.id) if isinstance(func.value, ast.Name) else None
+        if func.attr == "insert" and len(node.args) == 2 and receiver_type in (None, "list"):
+            operation = "insert(0, ...)"
+        elif func.attr == "pop" and len(node.args) == 1 and receiver_type == "list":
+            operation = "pop(0)"
+        else:
+            return
+        # Every element shifts by one; the list holds about half the loop's items on average
+        length = self._expr_lengths.get(id(func.value)) or self._loop_stack[-1][1]
+        self._report(
+            "list-front-insert", node, multiplier,
+            saturating_mul(multiplier, (length // 2) * OPERATION_WEIGHTS[OpType.ASSIGNMENT]),
+            f"list.{operation} on {self._dotted_name(func.value) or 'a list'} in a loop (quadratic shifting)",
+            "use collections.deque (appendleft/popleft) or append and reverse once",
+        )
 
-        elif isinstance(node, ast.Dict):
-            if len(node.keys) > 0:
-                ops.add(OpType.MEMORY_ALLOC, multiplier)
-                ops.add(OpType.ASSIGNMENT, multiplier * len(node.keys))
-            for k in node.keys:
-                if k:
-                    ops.merge(self._analyze_expression(k, multiplier))
-            for v in node.values:
-                ops.merge(self._analyze_expression(v, multiplier))
-
-        # --- F-strings / JoinedStr ---
-        elif isinstance(node, ast.JoinedStr):
-            # f-string formatting — each value is an expression
-            for val in node.values:
-                if isinstance(val, ast.FormattedValue):
-                    ops.merge(self._analyze_expression(val.value, multiplier))
-                    ops.add(OpType.FUNCTION_CALL, multiplier)  # string formatting cost
-
-        # --- Starred expression ---
-        elif isinstance(node, ast.Starred):
-            ops.merge(self._analyze_expression(node.value, multiplier))
+    def _qualify_call_name(self, node: ast.Call, full_call: Optional[str]) -> Optional[str]:
+        """
+        Resolve a call to a fully qualified name through imports and known
+        variable types: `np.zeros` -> `numpy.zeros`, `d.get` -> `dict.get`.
+        """
+        func = node.func
+        if isinstance(func, ast.Attribute):
+            receiver_type = self.LITERAL_TYPES.get(type(func.value))
+            if receiver_type is None and isinstance(func.value, ast.Constant):
+                receiver_type = type(func.value.value).__name__
+            if receiver_type:
+                return f"{receiver_type}.{func.attr}"
+        if not full_call:
+            return None
+        head, _, rest = full_call.partition(".")
+        if head in self._import_aliases:
+            base = self._import_aliases[head]
+            return f"{base}.{rest}" if rest else base
+        if rest and head in self._variable_types:
+            return f"{self._variable_types[head]}.{rest}"
+        if not rest and head not in self._all_function_names:
+            return head  # builtin
+        return None
 
-        return ops
+    def _is_network_call(self, node: ast.Call, full_call: Optional[str], call_name: str) -> bool:
+        """
+        Functions named like network calls (`urlopen(url)`), but methods only
+        when the receiver resolves to a network client module: `requests.get`
+        is one, `d.get` on a receiver of unknown type is not.
+        """
+        if not isinstance(node.func, ast.Attribute):
+            return call_name in self.NETWORK_FUNCTIONS or any(
+                net in call_name for net in ["request", "urlopen", "socket", "fetch"]
+            )
+        qualified = self._qualify_call_name(node, full_call)
+        return qualified is not None and qualified.split(".")[0] in self.NETWORK_MODULES
+
+    def _lookup_call_cost(self, node: ast.Call, full_call: Optional[str]) -> Optional[CallCost]:
+        """O(1) cost-database lookup by qualified name, then by `*.method`."""
+        qualified = self._qualify_call_name(node, full_call)
+        if qualified is not None:
+            entry = self.cost_database.lookup(qualified)
+            if entry is not None or "." in qualified:
+                return entry
+        if isinstance(node.func, ast.Attribute):
+            return self.cost_database.lookup(f"*.{node.func.attr}")
+        return None
+
+    def _call_sizes(self, node: ast.Call) -> Tuple[int, int]:
+        """
+        Sizes fed to a cost formula: n is the receiver for method calls
+        (`xs.index(v)`) and the first argument otherwise; m is the next argument.
+        """
+        operands: List[ast.expr] = []
+        func = node.func
+        if isinstance(func, ast.Attribute):
+            root = func.value
+            while isinstance(root, ast.Attribute):
+                root = root.value
+            if not (isinstance(root, ast.Name) and root.id in self._import_aliases):
+                operands.append(func.value)  # method call on an object, not a module function
+        operands.extend(node.args)
+        n = self._estimate_size(operands[0]) if operands else 1
+        m = self._estimate_size(operands[1]) if len(operands) > 1 else 1
+        return n, m
+
+    def _estimate_size(self, node: ast.expr) -> int:
+        """Best-effort number of elements in a collection-valued expression."""
+        known = self._expr_lengths.get(id(node))
+        if known is not None:
+            return known
+        if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            return len(node.elts)
+        if isinstance(node, ast.Dict):
+            return len(node.keys)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (str, bytes)):
+            return len(node.value)
+        if isinstance(node, (ast.ListComp, ast.SetComp, ast.GeneratorExp, ast.DictComp)):
+            return self._estimate_comprehension_iterations(node)
+        if isinstance(node, ast.Call) and self._get_call_name(node) == "range":
+            return self._estimate_for_iterations(ast.For(iter=node, target=None, body=[], orelse=[]))
+        if not isinstance(node, ast.Name):
+            # Integer arguments are counts/shapes, e.g. np.zeros(1000)
+            value = self._resolve_constant_expr(node)
+            if value is not None:
+                return max(0, value)
+        return self.default_loop_iterations
+
+    # -------------------------------------------------------------------------
+    # Container length inference
+    # -------------------------------------------------------------------------
+
+    # Calls whose result has as many elements as their (first) argument
+    LENGTH_PRESERVING_CALLS = {
+        "list", "tuple", "set", "frozenset", "dict", "sorted", "reversed",
+        "enumerate", "iter", "map", "filter", "bytearray", "deque",
+    }
+    # Methods whose result has as many elements as the receiver
+    LENGTH_PRESERVING_METHODS = {"copy", "keys", "values", "items"}
+
+    def _infer_container_lengths(self, body: List[ast.stmt], lengths: Dict[str, int]) -> Dict[str, int]:
+        """
+        Abstract interpretation of known collection lengths over a block.
+
+        Tracks name -> element count through assignments, literals,
+        comprehensions, slicing, concatenation, append/extend/pop (scaled by
+        enclosing loop counts) and if/else merges (upper bound). At each
+        statement the lengths of loop iterables, comprehension sources,
+        len() arguments and collection names are recorded in
+        self._expr_lengths (by node id) for the cost pass to pick up.
+        Returns the state at the end of the block.
+        """
+        for stmt in body:
+            self._record_expression_lengths(stmt, lengths)
+
+            if isinstance(stmt, (ast.Assign, ast.AnnAssign)):
+                targets = stmt.targets if isinstance(stmt, ast.Assign) else [stmt.target]
+                value = self._length_of(stmt.value, lengths) if stmt.value is not None else None
+                for target in targets:
+                    if isinstance(target, ast.Name):
+                        if isinstance(stmt.value, ast.Call) and self._get_call_name(stmt.value) == "len":
+                            # n = len(xs): the count itself becomes a loop bound
+                            count = self._int_value(stmt.value, lengths)
+                            if count is not None:
+                                self._variable_constants[target.id] = count
+                                self._symbolic_names.discard(target.id)
+                        if value is None:
+                            lengths.pop(target.id, None)
+                        else:
+                            lengths[target.id] = value
+                    else:
+                        self._forget_targets(target, lengths)
+
+            elif isinstance(stmt, ast.AugAssign) and isinstance(stmt.target, ast.Name):
+                current = lengths.get(stmt.target.id)
+                if current is not None and isinstance(stmt.op, ast.Add):
+                    added = self._length_of(stmt.value, lengths)
+                    current = current + added if added is not None else None
+                elif current is not None and isinstance(stmt.op, ast.Mult):
+                    factor = self._resolve_constant_expr(stmt.value)
+                    current = current * max(0, factor) if factor is not None else None
+                else:
+                    current = None
+                if current is None:
+                    lengths.pop(stmt.target.id, None)
+                else:
+                    lengths[stmt.target.id] = current
+
+            elif isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call):
+                self._apply_mutating_call(stmt.value, lengths)
+
+            elif isinstance(stmt, ast.Delete):
+                for target in stmt.targets:
+                    if isinstance(target, ast.Subscript) and isinstance(target.value, ast.Name) \
+                            and target.value.id in lengths and not isinstance(target.slice, ast.Slice):
+                        lengths[target.value.id] = max(0, lengths[target.value.id] - 1)
+                    else:
+                        self._forget_targets(target, lengths)
+
+            elif isinstance(stmt, (ast.For, ast.AsyncFor, ast.While)):
+                if isinstance(stmt, ast.While):
+                    iterations = self._estimate_while_iterations(stmt)
+                else:
+                    self._forget_targets(stmt.target, lengths)
+                    iterations = self._estimate_for_iterations(stmt)
+                before = dict(lengths)
+                after = self._infer_container_lengths(stmt.body, dict(lengths))
+                # Names the body grows or shrinks have their loop-entry length on
+                # the first pass; re-record the body at the mean over the iterations
+                changed = {name: after[name] - length for name, length in before.items()
+                           if name in after and after[name] != length}
+                if changed and iterations > 1:
+                    mean = dict(before)
+                    for name, delta in changed.items():
+                        mean[name] = min(max(0, before[name] + delta * iterations // 2), MAX_OPERATION_COUNT)
+                    self._infer_container_lengths(stmt.body, mean)
+                lengths.clear()
+                for name, length in after.items():
+                    if name not in before:
+                        lengths[name] = length          # (re)bound inside the loop: last value
+                    else:
+                        lengths[name] = min(max(0, before[name] + (length - before[name]) * iterations),
+                                           MAX_OPERATION_COUNT)
+                self._infer_container_lengths(stmt.orelse, lengths)
+
+            elif isinstance(stmt, ast.If):
+                then = self._infer_container_lengths(stmt.body, dict(lengths))
+                otherwise = self._infer_container_lengths(stmt.orelse, dict(lengths))
+                self._merge_branch_lengths(lengths, [then, otherwise])
+
+            elif isinstance(stmt, getattr(ast, "Match", ())):
+                branches = [self._infer_container_lengths(case.body, dict(lengths)) for case in stmt.cases]
+                branches.append(dict(lengths))  # no case matched
+                self._merge_branch_lengths(lengths, branches)
+
+            elif isinstance(stmt, (ast.With, ast.AsyncWith)):
+                for item in stmt.items:
+                    if item.optional_vars is not None:
+                        self._forget_targets(item.optional_vars, lengths)
+                self._infer_container_lengths(stmt.body, lengths)
+
+            elif isinstance(stmt, (ast.Try, getattr(ast, "TryStar", ast.Try))):
+                self._infer_container_lengths(stmt.body, lengths)
+                handlers = [self._infer_container_lengths(h.body, dict(lengths)) for h in stmt.handlers]
+                self._merge_branch_lengths(lengths, [dict(lengths)] + handlers)
+                self._infer_container_lengths(stmt.orelse, lengths)
+                self._infer_container_lengths(stmt.finalbody, lengths)
+
+            elif isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                lengths.pop(stmt.name, None)
+
+            elif isinstance(stmt, (ast.Global, ast.Nonlocal)):
+                for name in stmt.names:
+                    lengths.pop(name, None)
+
+        return lengths
+
+    @staticmethod
+    def _merge_branch_lengths(lengths: Dict[str, int], branches: List[Dict[str, int]]):
+        """Join of alternative branches: a name stays known only if every branch knows it."""
+        lengths.clear()
+        for name in set(branches[0]).intersection(*branches[1:]):
+            lengths[name] = max(branch[name] for branch in branches)
+
+    @staticmethod
+    def _forget_targets(target: ast.expr, lengths: Dict[str, int]):
+        for node in ast.walk(target):
+            if isinstance(node, ast.Name):
+                lengths.pop(node.id, None)
+
+    def _apply_mutating_call(self, call: ast.Call, lengths: Dict[str, int]):
+        """Effect of `xs.append(v)`, `xs.extend(ys)`, `xs.pop()`, ... on a known length."""
+        func = call.func
+        if not (isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name)):
+            return
+        name = func.value.id
+        if name not in lengths:
+            return
+        method = func.attr
+        if method in ("append", "appendleft", "add", "insert"):
+            lengths[name] += 1
+        elif method in ("extend", "extendleft", "update") and call.args:
+            # set/dict updates may overlap existing keys, so this is an upper bound
+            added = self._length_of(call.args[0], lengths)
+            if added is None:
+                lengths.pop(name)
+            else:
+                lengths[name] += added
+        elif method in ("pop", "popleft", "popitem", "remove", "discard"):
+            lengths[name] = max(0, lengths[name] - 1)
+        elif method == "clear":
+            lengths[name] = 0
+
+    def _record_expression_lengths(self, stmt: ast.stmt, lengths: Dict[str, int]):
+        """Remember the lengths of interesting sub-expressions at this program point."""
+        if isinstance(stmt, (ast.For, ast.AsyncFor)):
+            self._store_length(stmt.iter, lengths)
+        for child in ast.iter_child_nodes(stmt):
+            if isinstance(child, ast.stmt):
+                continue
+            for node in ast.walk(child):
+                if isinstance(node, ast.Name):
+                    if node.id in lengths:
+                        self._expr_lengths[id(node)] = lengths[node.id]
+                elif isinstance(node, (ast.ListComp, ast.SetComp, ast.GeneratorExp, ast.DictComp)):
+                    for gen in node.generators:
+                        self._store_length(gen.iter, lengths)
+                elif isinstance(node, ast.Call) and node.args and self._get_call_name(node) == "len":
+                    self._store_length(node.args[0], lengths)
+
+    def _store_length(self, node: ast.expr, lengths: Dict[str, int]):
+        value = self._length_of(node, lengths)
+        if value is not None:
+            self._expr_lengths[id(node)] = value
+
+    def _length_of(self, node: ast.expr, lengths: Dict[str, int]) -> Optional[int]:
+        """Number of elements of a collection-valued expression, or None if unknown."""
+        if isinstance(node, ast.Name):
+            return lengths.get(node.id)
+        if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            total = 0
+            for elt in node.elts:
+                if isinstance(elt, ast.Starred):
+                    inner = self._length_of(elt.value, lengths)
+                    if inner is None:
+                        return None
+                    total += inner
+                else:
+                    total += 1
+            return total
+        if isinstance(node, ast.Dict):
+            total = 0
+            for key, value in zip(node.keys, node.values):
+                if key is None:   # {**other}
+                    inner = self._length_of(value, lengths)
+                    if inner is None:
+                        return None
+                    total += inner
+                else:
+                    total += 1
+            return total
+        if isinstance(node, ast.Constant) and isinstance(node.value, (str, bytes)):
+            return len(node.value)
+        if isinstance(node, (ast.ListComp, ast.SetComp, ast.GeneratorExp, ast.DictComp)):
+            total = 1
+            for gen in node.generators:
+                inner = self._length_of(gen.iter, lengths)
+                if inner is None:
+                    return None
+                total = saturating_mul(total, inner)
+            return total
+        if isinstance(node, ast.Subscript) and isinstance(node.slice, ast.Slice):
+            base = self._length_of(node.value, lengths)
+            if base is None:
+                return None
+            bounds = []
+            for part in (node.slice.lower, node.slice.upper, node.slice.step):
+                if part is None:
+                    bounds.append(None)
+                    continue
+                value = self._int_value(part, lengths)
+                if value is None:
+                    return None
+                bounds.append(value)
+            if bounds[2] == 0:
+                return None
+            return len(range(*slice(*bounds).indices(base)))
+        if isinstance(node, ast.BinOp):
+            if isinstance(node.op, ast.Add):
+                left = self._length_of(node.left, lengths)
+                right = self._length_of(node.right, lengths)
+                return left + right if left is not None and right is not None else None
+            if isinstance(node.op, ast.Mult):
+                for seq, count in ((node.left, node.right), (node.right, node.left)):
+                    size = self._length_of(seq, lengths)
+                    factor = self._int_value(count, lengths)
+                    if size is not None and factor is not None:
+                        return saturating_mul(size, max(0, factor))
+            return None
+        if isinstance(node, ast.IfExp):
+            body = self._length_of(node.body, lengths)
+            orelse = self._length_of(node.orelse, lengths)
+            return max(body, orelse) if body is not None and orelse is not None else None
+        if isinstance(node, ast.Call):
+            name = self._get_call_name(node)
+            func = node.func
+            if name == "range" and isinstance(func, ast.Name):
+                bounds = [self._int_value(arg, lengths) for arg in node.args]
+                if not bounds or None in bounds or len(bounds) > 3 or (len(bounds) == 3 and bounds[2] == 0):
+                    return None
+                return len(range(*bounds))
+            if isinstance(func, ast.Name):
+                if name in self.LENGTH_PRESERVING_CALLS:
+                    if name in ("map", "filter"):
+                        return self._length_of(node.args[1], lengths) if len(node.args) == 2 else None
+                    if not node.args:
+                        return 0
+                    return self._length_of(node.args[0], lengths)
+                if name == "zip" and node.args:
+                    sizes = [self._length_of(arg, lengths) for arg in node.args]
+                    return min(sizes) if None not in sizes else None
+            elif isinstance(func, ast.Attribute) and name in self.LENGTH_PRESERVING_METHODS and not node.args:
+                return self._length_of(func.value, lengths)
+        return None
+
+    def _int_value(self, node: ast.expr, lengths: Dict[str, int]) -> Optional[int]:
+        """Integer value of an expression, with len() of known collections resolved."""
+        if isinstance(node, ast.Call) and self._get_call_name(node) == "len" and len(node.args) == 1:
+            return self._length_of(node.args[0], lengths)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            value = self._int_value(node.operand, lengths)
+            return -value if value is not None else None
+        if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub, ast.Mult, ast.FloorDiv)):
+            left = self._int_value(node.left, lengths)
+            right = self._int_value(node.right, lengths)
+            if left is None or right is None:
+                return None
+            if isinstance(node.op, ast.Add): return left + right
+            if isinstance(node.op, ast.Sub): return left - right
+            if isinstance(node.op, ast.Mult): return left * right
+            return left // right if right else None
+        if isinstance(node, ast.Name) and node.id in lengths:
+            return None   # a collection, not a number
+        return self._resolve_constant_expr(node)
 
     def _get_call_name(self, node: ast.Call) -> Optional[str]:
         """Extract the simple function name from a Call node."""
@@ -735,17 +3302,27 @@ class PythonAnalyzer(LanguageAnalyzer):
         return None
 
     def _estimate_for_iterations(self, node: ast.For) -> int:
+        """Iterations of a for loop, or DEFAULT_LOOP_ITERATIONS when unresolved."""
+        iterations = self._resolve_for_iterations(node)
+        return self.default_loop_iterations if iterations is None else iterations
+
+    def _resolve_for_iterations(self, node: ast.For) -> Optional[int]:
         """
-        Try hard to estimate the number of iterations for a for loop.
+        Try hard to resolve the number of iterations for a for loop (or a
+        comprehension generator); None when it depends on unknown input.
 
         Handles:
         - range(N) where N is a literal
         - range(start, stop) / range(start, stop, step) with literals
         - range(n) where n was assigned a constant earlier
-        - range(len(x)) — heuristic default
         - for x in some_list — try to resolve list size
-        - Fallback to DEFAULT_LOOP_ITERATIONS
+        - any iterable whose length the container pass inferred
+          (e.g. zip/enumerate over known lists, slices, appended lists)
         """
+        known = self._expr_lengths.get(id(node.iter))
+        if known is not None:
+            return known
+
         if isinstance(node.iter, ast.Call):
             name = self._get_call_name(node.iter)
             if name == "range":
@@ -767,12 +3344,6 @@ class PythonAnalyzer(LanguageAnalyzer):
                     if var_name in self._variable_constants:
                         return self._variable_constants[var_name]
 
-                # range(len(...)) — use heuristic
-                if len(args) == 1 and isinstance(args[0], ast.Call):
-                    inner_name = self._get_call_name(args[0])
-                    if inner_name == "len":
-                        return DEFAULT_LOOP_ITERATIONS
-
             elif name == "enumerate":
                 # enumerate(iterable) — try to resolve the iterable length
                 if node.iter.args:
@@ -782,12 +3353,7 @@ class PythonAnalyzer(LanguageAnalyzer):
                         if inner_name == "range":
                             # Recursively estimate range
                             fake_for = ast.For(iter=inner, target=node.target, body=[], orelse=[])
-                            return self._estimate_for_iterations(fake_for)
-                return DEFAULT_LOOP_ITERATIONS
-
-            elif name == "zip":
-                # zip takes the minimum — we can try each argument
-                return DEFAULT_LOOP_ITERATIONS
+                            return self._resolve_for_iterations(fake_for)
 
         # Iterating over a variable — check if we know its size
         if isinstance(node.iter, ast.Name):
@@ -807,16 +3373,27 @@ class PythonAnalyzer(LanguageAnalyzer):
         if isinstance(node.iter, ast.Dict):
             return len(node.iter.keys)
 
-        return DEFAULT_LOOP_ITERATIONS
+        return None
 
     def _estimate_while_iterations(self, node: ast.While) -> int:
         """
-        Try to estimate while loop iterations by analyzing the condition.
+        Estimate while loop iterations: a resolved counter bound, ~log2(10^6)
+        for halving loops such as binary search, else DEFAULT_LOOP_ITERATIONS.
+        """
+        iterations = self._resolve_while_iterations(node)
+        if iterations is not None:
+            return iterations
+        if self._is_halving_loop(node):
+            return 20  # ~log2(1_000_000)
+        return self.default_loop_iterations
+
+    def _resolve_while_iterations(self, node: ast.While) -> Optional[int]:
+        """
+        Resolve while loop iterations from the condition, or None.
 
         Handles patterns:
         - while i < N: ... i += 1  (simple counter pattern)
-        - while condition: with a decrement (like binary search halving)
-        - Fallback to DEFAULT_LOOP_ITERATIONS
+        - while i > 0 where i has a known start value
         """
         # Pattern: while var < const or while var > 0
         if isinstance(node.test, ast.Compare) and len(node.test.ops) == 1:
@@ -844,17 +3421,135 @@ class PythonAnalyzer(LanguageAnalyzer):
                         if start is not None:
                             return max(1, abs(start - lower))
 
-            # while low <= high pattern (binary search — O(log n))
-            if isinstance(node.test.ops[0], ast.LtE):
-                # Likely a binary search or similar halving algorithm
-                return 20  # ~log2(1_000_000)
+        return None
+
+    def _is_halving_loop(self, node: ast.While) -> bool:
+        """
+        while low <= high (binary search), or a loop that divides its
+        condition variable each iteration (while n > 1: n //= 2).
+        """
+        test = node.test
+        if isinstance(test, ast.Compare) and len(test.ops) == 1 and isinstance(test.ops[0], ast.LtE):
+            return True
+        names = {n.id for n in ast.walk(test) if isinstance(n, ast.Name)}
+        for child in ast.walk(node):
+            if isinstance(child, ast.AugAssign) and isinstance(child.op, HALVING_OPS):
+                if isinstance(child.target, ast.Name) and child.target.id in names:
+                    return True
+            elif isinstance(child, ast.Assign) and isinstance(child.value, ast.BinOp):
+                if isinstance(child.value.op, HALVING_OPS) and any(
+                        isinstance(t, ast.Name) and t.id in names for t in child.targets):
+                    return True
+        return False
+
+    def _observed_iterations(self, loop) -> Optional[Tuple[int, str]]:
+        """
+        Iterations per entry of a loop as observed in the profile index, with
+        the kind of evidence, or None when the profile does not cover it.
+        """
+        if self._profile_path is None:
+            return None
+        iterations = self._observed_line_iterations(loop)
+        if iterations is not None:
+            return iterations, "line hits"
+        iterations = self._observed_call_iterations(loop)
+        if iterations is not None:
+            return iterations, "cProfile calls"
+        return None
+
+    def _observed_line_iterations(self, loop) -> Optional[int]:
+        """
+        From line hits: the header runs once per entry plus once per
+        iteration, the first body statement once per iteration (for a nested
+        loop there, its header minus its own iterations; as in calibrate).
+        Executed-only coverage can only tell that the body never ran.
+        """
+        index, path = self.profile_index, self._profile_path
+        if loop.body[0].lineno == loop.lineno:
+            return None   # single-line loop: header and body are indistinguishable
+        header = index.line_count(path, loop.lineno)
+        if not header:
+            return None   # no line data, or the workload never got here
+
+        def runs(node) -> int:
+            first = node.body[0]
+            if isinstance(first, (ast.For, ast.AsyncFor, ast.While)):
+                return index.line_count(path, first.lineno) - runs(first)
+            return index.line_count(path, first.lineno)
+
+        body = runs(loop)
+        if not index.has_counts(path):
+            return 0 if body == 0 else None
+        entries = header - body
+        if body < 0 or entries <= 0:
+            return None
+        return max(1, round(body / entries)) if body else 0
+
+    def _observed_call_iterations(self, loop) -> Optional[int]:
+        """
+        From cProfile: a loop entered once per call of its function (a
+        top-level statement of the body) iterates as often per call as a
+        callee that the function calls only there, unconditionally, once
+        per iteration.
+        """
+        index, function = self.profile_index, self._function_node
+        if function is None or self._loop_stack or not any(stmt is loop for stmt in function.body):
+            return None
+        first_line = min([function.lineno] + [d.lineno for d in function.decorator_list])
+        calls = index.function_calls.get((self._profile_path, first_line))
+        edges = index.call_edges.get((self._profile_path, first_line))
+        if not calls or not calls[1] or not edges:
+            return None
+
+        def direct_calls(node):
+            # Calls inside lambdas and comprehensions run any number of times
+            if isinstance(node, ast.Call):
+                yield node
+            for child in ast.iter_child_nodes(node):
+                if not isinstance(child, (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp,
+                                          ast.GeneratorExp, ast.IfExp, ast.BoolOp)):
+                    yield from direct_calls(child)
+
+        for stmt in loop.body:
+            if not isinstance(stmt, (ast.Expr, ast.Assign, ast.AugAssign, ast.AnnAssign)):
+                continue
+            for call in direct_calls(stmt):
+                name = self._get_call_name(call)
+                if name in edges and self._function_callees.get(name) == 1:
+                    return round(edges[name] / calls[1])
+        return None
 
-        return DEFAULT_LOOP_ITERATIONS
+    def _observed_recursion(self, node, profile: RecursionProfile) -> Optional[RecursionProfile]:
+        """
+        Recursion profile with the activations per external call that
+        cProfile observed (total / primitive calls), or None without data.
+        """
+        if self._profile_path is None:
+            return None
+        first_line = min([node.lineno] + [d.lineno for d in node.decorator_list])
+        calls = self.profile_index.function_calls.get((self._profile_path, first_line))
+        if not calls or not calls[0]:
+            return None
+        activations = min(max(1, round(calls[1] / calls[0])), MAX_RECURSION_ACTIVATIONS)
+        # A chain is as deep as its activations unless several self-calls branch
+        depth = activations
+        if profile.calls_per_activation > 1 and activations > 1:
+            depth = max(1, math.ceil(math.log(activations, profile.calls_per_activation)))
+        return RecursionProfile(
+            calls_per_activation=profile.calls_per_activation,
+            shrink=profile.shrink,
+            growth=profile.growth,
+            depth=depth,
+            activations=activations,
+        )
 
     def _estimate_comprehension_iterations(self, node) -> int:
         """Estimate iterations for a list/set/dict comprehension."""
         if hasattr(node, 'generators') and node.generators:
             gen = node.generators[0]
+            known = self._expr_lengths.get(id(gen.iter))
+            if known is not None:
+                return known
             # Try to resolve from the iterator
             if isinstance(gen.iter, ast.Call):
                 name = self._get_call_name(gen.iter)
@@ -869,23 +3564,219 @@ class PythonAnalyzer(LanguageAnalyzer):
                 return len(gen.iter.elts)
             elif isinstance(gen.iter, ast.Name) and gen.iter.id in self._variable_constants:
                 return self._variable_constants[gen.iter.id]
-        return DEFAULT_LOOP_ITERATIONS
+        return self.default_loop_iterations
 
     def _get_max_loop_depth(self, node: ast.AST, current_depth: int = 0) -> int:
         """Find the maximum loop nesting depth."""
         max_depth = current_depth
         for child in ast.iter_child_nodes(node):
-            if isinstance(child, (ast.For, ast.While)):
+            if isinstance(child, (ast.For, ast.AsyncFor, ast.While)):
                 max_depth = max(max_depth, self._get_max_loop_depth(child, current_depth + 1))
             else:
                 max_depth = max(max_depth, self._get_max_loop_depth(child, current_depth))
         return max_depth
 
+    # ----- Complexity class ------------------------------------------------
+
+    # Calls that sort their argument (or receiver): O(n log n) unless its length is known
+    SORTING_CALLS = {"sorted", "sort"}
+
+    def _estimate_complexity(self, node: ast.AST) -> Complexity:
+        """
+        Complexity class of the code under node. Loops whose bound resolves
+        to a constant are O(1), halving loops O(log n), any other loop O(n).
+        Nested function and class bodies do not run here and are skipped.
+        """
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+            return COMPLEXITY_CONSTANT
+
+        if isinstance(node, (ast.For, ast.AsyncFor, ast.While)):
+            if isinstance(node, ast.While):
+                resolved, header = self._resolve_while_iterations(node), node.test
+            else:
+                resolved, header = self._resolve_for_iterations(node), node.iter
+            if resolved is not None and not self._is_symbolic(header):
+                bound = COMPLEXITY_CONSTANT
+            elif isinstance(node, ast.While) and self._is_halving_loop(node):
+                bound = COMPLEXITY_LOGARITHMIC
+            else:
+                bound = COMPLEXITY_LINEAR
+            body = max(map(self._estimate_complexity, node.body), default=COMPLEXITY_CONSTANT)
+            return max([bound * body] + [self._estimate_complexity(n) for n in [header] + node.orelse])
+
+        if isinstance(node, (ast.ListComp, ast.SetComp, ast.GeneratorExp, ast.DictComp)):
+            bound = COMPLEXITY_CONSTANT
+            inner = [node.key, node.value] if isinstance(node, ast.DictComp) else [node.elt]
+            iterables = []
+            for gen in node.generators:
+                if self._resolve_for_iterations(gen) is None or self._is_symbolic(gen.iter):
+                    bound = bound * COMPLEXITY_LINEAR
+                inner.extend(gen.ifs)
+                iterables.append(gen.iter)
+            body = max(map(self._estimate_complexity, inner))
+            return max([bound * body] + [self._estimate_complexity(n) for n in iterables])
+
+        complexity = COMPLEXITY_CONSTANT
+        if isinstance(node, ast.Call) and self._get_call_name(node) in self.SORTING_CALLS:
+            if node.args:
+                target = node.args[0]
+            else:
+                target = node.func.value if isinstance(node.func, ast.Attribute) else None
+            if target is None or id(target) not in self._expr_lengths:
+                complexity = Complexity(degree=1, log_power=1)
+        for child in ast.iter_child_nodes(node):
+            complexity = max(complexity, self._estimate_complexity(child))
+        return complexity
+
+
+PythonAnalyzer._build_dispatch_tables()
+
 
 # =============================================================================
 # REGEX-BASED ANALYZER (for Java, C, C++, JavaScript)
 # =============================================================================
 
+# Token patterns for lex_c_family(); each is tried at the current position only
+_LEX_CODE = re.compile(r'[^/"\'`{}\n]+|\n+')
+_LEX_LINE_COMMENT = re.compile(r'//[^\n]*')
+_LEX_BLOCK_COMMENT = re.compile(r'/\*.*?(?:\*/|\Z)', re.DOTALL)
+_LEX_STRING = {
+    '"': re.compile(r'"(?:[^"\\\n]|\\.)*(?:"|(?=\n)|\Z)', re.DOTALL),
+    "'": re.compile(r"'(?:[^'\\\n]|\\.)*(?:'|(?=\n)|\Z)", re.DOTALL),
+}
+_LEX_TEMPLATE_TEXT = re.compile(r'(?:[^`\\$]|\\.|\$(?!\{))*', re.DOTALL)
+# JavaScript regex literal: one line, '/' allowed inside [...] classes, then flags
+_LEX_REGEX = re.compile(r'/(?![*/])(?:[^/\\\[\n]|\\[^\n]|\[(?:[^\]\\\n]|\\[^\n])*\])+/[A-Za-z]*')
+# A '/' after one of these characters or keywords starts a regex, not a division
+_LEX_REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^")
+_LEX_REGEX_KEYWORDS = {
+    "return", "typeof", "instanceof", "in", "of", "new", "delete", "void",
+    "throw", "case", "do", "else", "yield", "await",
+}
+_LEX_TRAILING_WORD = re.compile(r'[A-Za-z_$][\w$]*$')
+
+
+def lex_c_family(code: str, regex_literals: bool = False) -> Tuple[str, List[int]]:
+    """
+    Strip comments and mask string, char and template literals in one pass.
+
+    Returns (clean_text, line_map) where line_map[clean_line] is the
+    original 1-based line number of the first token on that cleaned line
+    (index 0 unused). Comments are removed, literals collapse to empty
+    quotes (""), and JS template substitutions `${...}` are kept as code,
+    including nested templates inside them. Newlines inside removed
+    comments/literals are dropped, which is what the line map accounts for.
+
+    With regex_literals (JavaScript), a '/' where an operand is expected,
+    i.e. after an operator, an opening bracket or a keyword such as
+    `return`, starts a regex literal, which is masked like a string so a
+    quote inside it opens nothing.
+    """
+    out: List[str] = []
+    line_map = [0, 1]
+    orig_line = 1
+    # True until the current cleaned line has received a non-blank token
+    line_open = True
+    pos, end = 0, len(code)
+    # One entry per open `${`: brace depth inside that substitution
+    template_stack: List[int] = []
+
+    def skip(text: str):
+        nonlocal orig_line
+        orig_line += text.count('\n')
+
+    def emit(text: str):
+        nonlocal line_open
+        if line_open:
+            line_map[-1] = orig_line
+            line_open = False
+        out.append(text)
+
+    def emit_code(text: str):
+        nonlocal orig_line, line_open
+        if text[0] == '\n':
+            out.append(text)
+            for _ in range(len(text)):
+                orig_line += 1
+                line_map.append(orig_line)
+            line_open = True
+        elif text.strip():
+            emit(text)
+        else:
+            out.append(text)
+
+    def regex_allowed() -> bool:
+        """True when the last significant token emitted expects an operand next."""
+        for piece in reversed(out):
+            text = piece.rstrip()
+            if text:
+                break
+        else:
+            return True
+        if text[-1] in _LEX_REGEX_PRECEDERS:
+            return not text.endswith(("++", "--"))   # postfix operand: `i++ / 2`
+        m = _LEX_TRAILING_WORD.search(text)
+        return m is not None and m.group(0) in _LEX_REGEX_KEYWORDS
+
+    def scan_template(start: int) -> int:
+        """Consume template text from start; returns position after '`' or '${'."""
+        m = _LEX_TEMPLATE_TEXT.match(code, start)
+        skip(m.group(0))
+        p = m.end()
+        if code.startswith('${', p):
+            emit('${')
+            template_stack.append(0)
+            return p + 2
+        emit('`')
+        return min(p + 1, end)
+
+    while pos < end:
+        ch = code[pos]
+        if ch == '/':
+            m = _LEX_LINE_COMMENT.match(code, pos) or _LEX_BLOCK_COMMENT.match(code, pos)
+            if m:
+                skip(m.group(0))
+                pos = m.end()
+                continue
+            m = _LEX_REGEX.match(code, pos) if regex_literals and regex_allowed() else None
+            if m:
+                emit('""')
+                pos = m.end()
+            else:
+                emit('/')
+                pos += 1
+        elif ch in _LEX_STRING:
+            m = _LEX_STRING[ch].match(code, pos)
+            emit(ch + ch)
+            skip(m.group(0))
+            pos = m.end()
+        elif ch == '`':
+            emit('`')
+            pos = scan_template(pos + 1)
+        elif ch == '{':
+            if template_stack:
+                template_stack[-1] += 1
+            emit('{')
+            pos += 1
+        elif ch == '}':
+            if template_stack and template_stack[-1] == 0:
+                # End of a `${...}` substitution: back to template text
+                template_stack.pop()
+                emit('}')
+                pos = scan_template(pos + 1)
+            else:
+                if template_stack:
+                    template_stack[-1] -= 1
+                emit('}')
+                pos += 1
+        else:
+            m = _LEX_CODE.match(code, pos)
+            emit_code(m.group(0))
+            pos = m.end()
+
+    return "".join(out), line_map
+
+
 class RegexAnalyzer(LanguageAnalyzer):
     """
     A regex/pattern-based analyzer for languages where we don't have
@@ -929,12 +3820,14 @@ class RegexAnalyzer(LanguageAnalyzer):
     WHILE_PATTERN = r'\bwhile\s*\('
     DO_WHILE_PATTERN = r'\bdo\s*\{'
 
-    def __init__(self, language: str):
-        super().__init__()
+    def __init__(self, language: str, track_lines: bool = False,
+                 energy_profile: Optional[EnergyProfile] = None):
+        super().__init__(track_lines=track_lines, energy_profile=energy_profile)
         self.language = language
 
     def analyze(self, code: str, file_path: Optional[str] = None) -> AnalysisResult:
         self.result = AnalysisResult(language=self.language, file_path=file_path)
+        self._init_line_costs(code)
         self.result.assumptions.append(
             "Regex-based analysis (no native AST) — less precise than AST-based"
         )
@@ -945,44 +3838,53 @@ class RegexAnalyzer(LanguageAnalyzer):
             f"Carbon intensity: {CARBON_INTENSITY_G_PER_KWH} gCO2/kWh (global average)"
         )
 
+        clean_code = self._remove_comments(code)
+
         # Extract all variable = number assignments for loop bound resolution
         self._variable_constants: Dict[str, int] = {}
-        for match in re.finditer(r'\b(\w+)\s*=\s*(\d+)\s*;', code):
+        for match in re.finditer(r'\b(\w+)\s*=\s*(\d+)\s*;', clean_code):
             self._variable_constants[match.group(1)] = int(match.group(2))
 
-        clean_code = self._remove_comments(code)
-
         functions = self._extract_functions(clean_code, code)
 
-        for func_name, func_body, line_num in functions:
-            func_analysis = self._analyze_function_body(func_name, func_body, line_num)
+        for func_name, func_body, line_num, body_line in functions:
+            func_analysis = self._analyze_function_body(func_name, func_body, line_num, body_line)
             self.result.functions.append(func_analysis)
 
-        # Global scope: analyze code outside functions
+        # Global scope: analyze code outside functions. Function bodies are cut
+        # out of it, so its line numbers no longer map to the source and it is
+        # not attributed to lines.
         global_code = self._extract_global_code(clean_code, functions)
         self.result.global_operations = self._analyze_code_by_depth(global_code)
 
+        self.result.line_costs = self._line_costs_to_map()
+        self.result.stack_costs = self._stack_costs
         return self.result
 
     def _remove_comments(self, code: str) -> str:
-        """Remove comments from C-family code."""
-        code = re.sub(r'//.*?$', '', code, flags=re.MULTILINE)
-        code = re.sub(r'/\*.*?\*/', '', code, flags=re.DOTALL)
-        code = re.sub(r'"(?:[^"\\]|\\.)*"', '""', code)
-        code = re.sub(r"'(?:[^'\\]|\\.)*'", "''", code)
-        code = re.sub(r'`(?:[^`\\]|\\.)*`', '``', code)
-        return code
-
+        """
+        Remove comments and mask literals from C-family code (see lex_c_family).
+        Keeps the clean-line -> original-line map for reporting line numbers.
+        """
+        clean_code, self._line_map = lex_c_family(code, regex_literals=self.language == "javascript")
+        return clean_code
+
+    def _original_line(self, clean_line: int) -> int:
+        """Map a line number in the cleaned code back to the source file."""
+        if 0 < clean_line < len(self._line_map):
+            return self._line_map[clean_line]
+        return clean_line
+
     def _extract_global_code(self, clean_code: str, functions: list) -> str:
         """Extract code outside of function bodies (rough approach)."""
         # Remove all function bodies to get global code
         result = clean_code
-        for _, func_body, _ in functions:
+        for _, func_body, _, _ in functions:
             result = result.replace(func_body, "", 1)
         return result
 
-    def _extract_functions(self, clean_code: str, original_code: str) -> List[Tuple[str, str, int]]:
-        """Extract function names and bodies from code."""
+    def _extract_functions(self, clean_code: str, original_code: str) -> List[Tuple[str, str, int, int]]:
+        """Extract function names, bodies, header lines and body start lines from code."""
         functions = []
         pattern = self.FUNC_PATTERNS.get(self.language, self.FUNC_PATTERNS["c"])
 
@@ -991,11 +3893,14 @@ class RegexAnalyzer(LanguageAnalyzer):
             if func_name in ("if", "for", "while", "switch", "return", "else"):
                 continue
 
-            start = match.start()
+            # The modifier group can swallow leading newlines; count from the first token
+            header = match.group(0)
+            start = match.start() + len(header) - len(header.lstrip())
             func_body = self._extract_brace_block(clean_code, match.end() - 1)
-            line_num = clean_code[:start].count('\n') + 1
+            line_num = self._original_line(clean_code.count('\n', 0, start) + 1)
+            body_line = clean_code.count('\n', 0, match.end() - 1) + 1
 
-            functions.append((func_name, func_body, line_num))
+            functions.append((func_name, func_body, line_num, body_line))
 
         return functions
 
@@ -1019,42 +3924,87 @@ class RegexAnalyzer(LanguageAnalyzer):
             i += 1
         return code[start_brace:]
 
-    def _analyze_function_body(self, name: str, body: str, line_num: int) -> FunctionAnalysis:
+    def _analyze_function_body(self, name: str, body: str, line_num: int,
+                               body_line: Optional[int] = None) -> FunctionAnalysis:
         """Analyze function body with depth-aware operation counting."""
         func = FunctionAnalysis(name=name, line_number=line_num)
+        self._frames.append(name)
 
         # Detect recursion
         if re.search(rf'\b{re.escape(name)}\s*\(', body):
             func.is_recursive = True
 
         # Analyze with depth-aware counting
-        func.operations = self._analyze_code_by_depth(body)
+        func.operations = self._analyze_code_by_depth(body, first_line=body_line)
 
         if func.is_recursive:
-            func.operations = func.operations.scale(DEFAULT_RECURSION_DEPTH)
+            func.recursion = self._analyze_recursion(name, body)
+            activations = func.recursion.activations
+            func.operations = func.operations.scale(activations)
             self.result.assumptions.append(
-                f"Function '{name}' is recursive — assumed {DEFAULT_RECURSION_DEPTH} recursive calls"
+                f"Function '{name}' is recursive ({func.recursion.growth}, "
+                f"{func.recursion.calls_per_activation} self-call(s) per activation, "
+                f"{func.recursion.shrink.value} argument) — assumed {activations} activations"
             )
-
+            if self._line_costs is not None and body_line is not None:
+                self._scale_line_costs(self._original_line(body_line),
+                                       self._original_line(body_line + body.count('\n')), activations)
+        self._frames.pop()
+
+        func.complexity = self._estimate_complexity(body)
+        if func.recursion is not None:
+            func.complexity = recursive_complexity(func.recursion, func.complexity)
         func.max_nesting = self._get_max_loop_nesting(body)
         return func
 
-    def _analyze_code_by_depth(self, code: str) -> OperationCount:
+    def _analyze_recursion(self, name: str, body: str) -> RecursionProfile:
+        """
+        Count self-call sites per activation and classify argument shrinkage.
+        Calls in separate return statements are treated as alternative
+        branches (only one runs per activation); all other calls add up.
+        """
+        call_re = re.compile(rf'\b{re.escape(name)}\s*\(([^()]*(?:\([^()]*\)[^()]*)*)\)')
+        halved_names = find_halved_names(body)
+
+        sequential, alternatives = 0, 0
+        shrinks = set()
+        for statement in body.split(';'):
+            calls = call_re.findall(statement)
+            if not calls:
+                continue
+            if re.search(r'\breturn\b', statement):
+                alternatives = max(alternatives, len(calls))
+            else:
+                sequential += len(calls)
+            for args in calls:
+                shrinks.add(classify_shrink_text(args, halved_names))
+
+        return estimate_recursion(max(1, sequential + alternatives), dominant_shrink(shrinks),
+                                  self.default_recursion_depth)
+
+    def _analyze_code_by_depth(self, code: str, first_line: Optional[int] = None) -> OperationCount:
         """
         Analyze code line-by-line, tracking loop nesting depth.
         Each line's operations are multiplied by the product of all enclosing
         loop iteration counts. This means 5 printf() calls inside a
         for(i=0;i<100;i++) loop correctly count as 500 IO operations.
+
+        If first_line (a line of the cleaned code) is given and line tracking
+        is enabled, each line's weighted cost is also accumulated at the
+        corresponding original source line.
         """
         ops = OperationCount()
         lines = code.split('\n')
+        track = self._line_costs is not None and first_line is not None
 
         # Stack of (loop_type, estimated_iterations) for nesting
         loop_stack: List[Tuple[str, int]] = []
         brace_depth_at_loop: List[int] = []  # brace depth when loop started
         brace_depth = 0
+        # When tracking, each open loop also has a loop@line frame
+        frame_depth = len(self._frames)
 
-        for line in lines:
+        for offset, line in enumerate(lines):
             stripped = line.strip()
             if not stripped:
                 continue
@@ -1083,18 +4033,26 @@ class RegexAnalyzer(LanguageAnalyzer):
                     f"while-loop estimated {iterations} iterations"
                 )
             elif do_match:
-                loop_stack.append(("do", DEFAULT_LOOP_ITERATIONS))
+                loop_stack.append(("do", self.default_loop_iterations))
                 brace_depth_at_loop.append(brace_depth)
+            if track and len(loop_stack) > len(self._frames) - frame_depth:
+                self._frames.append(f"{loop_stack[-1][0]}@{self._original_line(first_line + offset)}")
 
             brace_depth += open_braces
 
             # Calculate current multiplier from all enclosing loops
             current_multiplier = 1
             for _, iters in loop_stack:
-                current_multiplier *= iters
+                current_multiplier = saturating_mul(current_multiplier, iters)
 
             # Count operations on this line with the correct multiplier
-            self._count_line_operations(stripped, ops, current_multiplier)
+            if track:
+                weighted_before = ops.total_weighted
+                self._count_line_operations(stripped, ops, current_multiplier)
+                self._add_line_cost(self._original_line(first_line + offset),
+                                    ops.total_weighted - weighted_before)
+            else:
+                self._count_line_operations(stripped, ops, current_multiplier)
 
             brace_depth -= close_braces
 
@@ -1102,7 +4060,11 @@ class RegexAnalyzer(LanguageAnalyzer):
             while brace_depth_at_loop and brace_depth <= brace_depth_at_loop[-1]:
                 loop_stack.pop()
                 brace_depth_at_loop.pop()
+            if track:
+                del self._frames[frame_depth + len(loop_stack):]
 
+        if track:
+            del self._frames[frame_depth:]
         return ops
 
     def _count_line_operations(self, line: str, ops: OperationCount, multiplier: int):
@@ -1168,9 +4130,14 @@ class RegexAnalyzer(LanguageAnalyzer):
         ops.add(OpType.FUNCTION_CALL, remaining_calls * multiplier)
 
     def _estimate_for_iterations_from_header(self, header: str) -> int:
+        """Iterations of a for-loop header, or DEFAULT_LOOP_ITERATIONS when unresolved."""
+        iterations = self._resolve_for_header(header)
+        return self.default_loop_iterations if iterations is None else iterations
+
+    def _resolve_for_header(self, header: str) -> Optional[int]:
         """
-        Parse a for-loop header like 'int i = 0; i < 100; i++' and estimate iterations.
-        Tries multiple patterns for accuracy.
+        Parse a for-loop header like 'int i = 0; i < 100; i++' and resolve iterations.
+        Tries multiple patterns for accuracy; None when the bound is not a constant.
         """
         # Pattern: i = START; i < END (or <=, >, >=)
         match = re.search(r'(\w+)\s*=\s*(\d+)\s*;\s*\1\s*([<>]=?)\s*(\d+)', header)
@@ -1207,13 +4174,19 @@ class RegexAnalyzer(LanguageAnalyzer):
                 return max(0, (end_val - start_val + step - 1) // step)
 
         # Java enhanced for-each: for(Type var : collection) — can't know size
-        if ':' in header:
-            return DEFAULT_LOOP_ITERATIONS
-
-        return DEFAULT_LOOP_ITERATIONS
+        return None
 
     def _estimate_while_iterations_from_condition(self, condition: str) -> int:
         """Estimate while-loop iterations from the condition string."""
+        iterations = self._resolve_while_condition(condition)
+        if iterations is not None:
+            return iterations
+        if self._is_halving_condition(condition):
+            return 20  # ~log2(1_000_000)
+        return self.default_loop_iterations
+
+    def _resolve_while_condition(self, condition: str) -> Optional[int]:
+        """Resolve while-loop iterations from a counter condition, or None."""
         # Pattern: var < N or var > 0
         match = re.search(r'(\w+)\s*([<>]=?)\s*(\d+)', condition)
         if match:
@@ -1225,21 +4198,81 @@ class RegexAnalyzer(LanguageAnalyzer):
                 # Try to find initial value
                 if var in self._variable_constants:
                     return max(1, abs(end_val - self._variable_constants[var]))
-                return end_val if end_val > 0 else DEFAULT_LOOP_ITERATIONS
+                return end_val if end_val > 0 else None
 
             if op in ('>', '>='):
                 if var in self._variable_constants:
                     return max(1, self._variable_constants[var] - end_val)
 
-        # Pattern: var != null or similar — short-lived loop
-        if '!=' in condition or 'null' in condition:
-            return DEFAULT_LOOP_ITERATIONS
+        return None
 
-        # Binary search pattern: low <= high
-        if '<=' in condition:
-            return 20  # ~log2(1_000_000)
+    @staticmethod
+    def _is_halving_condition(condition: str) -> bool:
+        """Binary search pattern: low <= high (but not var != null and the like)."""
+        return '<=' in condition and '!=' not in condition and 'null' not in condition
+
+    # Halving / doubling loop updates: i /= 2, i >>= 1, i *= 2, n = n / 2
+    HALVING_STEP = re.compile(r'(\w+)\s*(?:(?:/|>>|\*|<<)=|=\s*\1\s*(?:/|>>|\*|<<))')
+    # Standard-library sorts: O(n log n)
+    SORT_CALL = re.compile(r'\b(?:qsort|sort|stable_sort|sorted|toSorted)\s*\(')
+
+    def _loop_complexity(self, kind: str, text: str) -> Complexity:
+        """Complexity class of one loop from its header / condition text."""
+        if kind == "for":
+            if self._resolve_for_header(text) is not None:
+                return COMPLEXITY_CONSTANT
+            if ';' in text and self.HALVING_STEP.search(text.rsplit(';', 1)[1]):
+                return COMPLEXITY_LOGARITHMIC
+        elif kind == "while":
+            if self._resolve_while_condition(text) is not None:
+                return COMPLEXITY_CONSTANT
+            if self._is_halving_condition(text):
+                return COMPLEXITY_LOGARITHMIC
+        return COMPLEXITY_LINEAR
+
+    def _estimate_complexity(self, code: str) -> Complexity:
+        """
+        Complexity class of a function body, using the same brace tracking as
+        _analyze_code_by_depth: each line's class is the product of the classes
+        of its enclosing loops (resolved bound O(1), halving O(log n), else O(n)).
+        """
+        worst = COMPLEXITY_CONSTANT
+        loop_stack: List[Complexity] = []
+        brace_depth_at_loop: List[int] = []
+        brace_depth = 0
+
+        for line in code.split('\n'):
+            stripped = line.strip()
+            if not stripped:
+                continue
+
+            for_match = re.match(r'\bfor\s*\((.+)\)', stripped)
+            while_match = re.match(r'\bwhile\s*\((.+)\)', stripped)
+            if for_match:
+                loop_stack.append(self._loop_complexity("for", for_match.group(1)))
+                brace_depth_at_loop.append(brace_depth)
+            elif while_match:
+                loop_stack.append(self._loop_complexity("while", while_match.group(1)))
+                brace_depth_at_loop.append(brace_depth)
+            elif stripped.startswith('do') and (stripped == 'do' or stripped.startswith(('do {', 'do{'))):
+                loop_stack.append(COMPLEXITY_LINEAR)
+                brace_depth_at_loop.append(brace_depth)
+
+            brace_depth += stripped.count('{')
+
+            current = COMPLEXITY_CONSTANT
+            for factor in loop_stack:
+                current = current * factor
+            if self.SORT_CALL.search(stripped):
+                current = current * Complexity(degree=1, log_power=1)
+            worst = max(worst, current)
+
+            brace_depth -= stripped.count('}')
+            while brace_depth_at_loop and brace_depth <= brace_depth_at_loop[-1]:
+                loop_stack.pop()
+                brace_depth_at_loop.pop()
 
-        return DEFAULT_LOOP_ITERATIONS
+        return worst
 
     def _get_max_loop_nesting(self, code: str) -> int:
         """Estimate maximum loop nesting depth."""
@@ -1257,162 +4290,3767 @@ class RegexAnalyzer(LanguageAnalyzer):
 
 
 # =============================================================================
-# ANALYZER FACTORY
+# TREE-SITTER ANALYZER (for Java, C, C++, JavaScript)
 # =============================================================================
 
-def get_analyzer(language: str) -> LanguageAnalyzer:
-    """Factory: return the appropriate analyzer for the language."""
-    if language == "python":
-        return PythonAnalyzer()
-    elif language in ("java", "c", "cpp", "javascript"):
-        return RegexAnalyzer(language)
+# Tree-sitter grammar names for the C-family languages
+TREE_SITTER_GRAMMARS: Dict[str, str] = {
+    "java": "java",
+    "c": "c",
+    "cpp": "cpp",
+    "javascript": "javascript",
+}
+
+# Directory holding locally vendored grammars (tree-sitter-<name>.so / <name>.so)
+TREE_SITTER_GRAMMAR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "parsers")
+
+# Call-site queries; @name captures the simple callee name
+TREE_SITTER_CALL_QUERIES: Dict[str, str] = {
+    "java": "(method_invocation name: (identifier) @name) @call",
+    "c": "(call_expression function: (identifier) @name) @call",
+    "cpp": """
+        (call_expression function: (identifier) @name) @call
+        (call_expression function: (field_expression field: (field_identifier) @name)) @call
+        (call_expression function: (qualified_identifier name: (identifier) @name)) @call
+    """,
+    "javascript": """
+        (call_expression function: (identifier) @name) @call
+        (call_expression function: (member_expression property: (property_identifier) @name)) @call
+    """,
+}
+
+# Parsers, languages and compiled queries are reused across files
+_ts_languages: Dict[str, object] = {}
+_ts_parsers: Dict[str, object] = {}
+_ts_queries: Dict[Tuple[str, str], object] = {}
+
+
+def _load_tree_sitter_language(grammar: str):
+    """Load a grammar from an installed tree_sitter_<name> package or the vendored grammar dir."""
+    if grammar in _ts_languages:
+        return _ts_languages[grammar]
+
+    language = None
+    try:
+        import importlib
+        module = importlib.import_module(f"tree_sitter_{grammar}")
+        language = tree_sitter.Language(module.language())
+    except (ImportError, AttributeError, TypeError, ValueError):
+        for candidate in (f"tree-sitter-{grammar}.so", f"{grammar}.so", "languages.so"):
+            lib_path = os.path.join(TREE_SITTER_GRAMMAR_DIR, candidate)
+            if os.path.exists(lib_path):
+                try:
+                    language = tree_sitter.Language(lib_path, grammar)  # tree_sitter < 0.22
+                    break
+                except (OSError, TypeError, AttributeError):
+                    continue
+
+    _ts_languages[grammar] = language
+    return language
+
+
+def get_tree_sitter_parser(grammar: str):
+    """Return a cached tree-sitter parser for the grammar, or None if unavailable."""
+    if tree_sitter is None:
+        return None
+    if grammar in _ts_parsers:
+        return _ts_parsers[grammar]
+
+    parser = None
+    language = _load_tree_sitter_language(grammar)
+    if language is not None:
+        try:
+            parser = tree_sitter.Parser(language)
+        except TypeError:
+            parser = tree_sitter.Parser()
+            parser.set_language(language)
+
+    _ts_parsers[grammar] = parser
+    return parser
+
+
+def _get_tree_sitter_query(grammar: str, source: str):
+    """Return a cached compiled query for the grammar."""
+    key = (grammar, source)
+    if key not in _ts_queries:
+        language = _load_tree_sitter_language(grammar)
+        if language is None:
+            _ts_queries[key] = None
+        elif hasattr(tree_sitter, "Query"):
+            _ts_queries[key] = tree_sitter.Query(language, source)
+        else:
+            _ts_queries[key] = language.query(source)
+    return _ts_queries[key]
+
+
+def _tree_sitter_captures(query, node) -> Dict[str, list]:
+    """Run a query and return {capture_name: [nodes]} across tree_sitter versions."""
+    if hasattr(tree_sitter, "QueryCursor"):
+        captures = tree_sitter.QueryCursor(query).captures(node)
     else:
-        return RegexAnalyzer(language)
+        captures = query.captures(node)
+    if isinstance(captures, dict):
+        return captures
+    grouped: Dict[str, list] = {}
+    for captured, name in captures:
+        grouped.setdefault(name, []).append(captured)
+    return grouped
 
 
-# =============================================================================
-# MAIN ESTIMATOR API
-# =============================================================================
+def is_tree_sitter_available(language: str) -> bool:
+    """True if tree_sitter and a grammar for the language can be loaded."""
+    grammar = TREE_SITTER_GRAMMARS.get(language)
+    return grammar is not None and get_tree_sitter_parser(grammar) is not None
 
-def estimate_carbon_footprint(
-    code: Optional[str] = None,
-    file_path: Optional[str] = None,
-    language: Optional[str] = None,
-) -> AnalysisResult:
-    """
-    Main entry point: estimate the carbon footprint of source code.
 
-    Args:
-        code: Source code as a string (provide this OR file_path).
-        file_path: Path to a source code file.
-        language: Programming language ('python', 'java', 'c', 'cpp', 'javascript').
-                  If None, auto-detected from file extension or code content.
+class TreeSitterAnalyzer(LanguageAnalyzer):
+    """
+    Analyzes Java, C, C++ and JavaScript using a tree-sitter syntax tree.
+    Python port of carbonFootprint/cFamilyTreeSitterAnalyzer.ts.
 
-    Returns:
-        AnalysisResult with operations, energy, carbon, and per-function breakdown.
+    KEY DESIGN: Same as PythonAnalyzer — one parse, then a structural walk
+    where each statement in a loop body is analyzed with the product of all
+    enclosing loop iteration counts. Unlike RegexAnalyzer this is not
+    confused by brace-less loop bodies, multi-line for headers or lambdas.
     """
-    if code is None and file_path:
-        with open(file_path, "r", encoding="utf-8", errors="replace") as f:
-            code = f.read()
-    elif code is None:
-        raise ValueError("Must provide either 'code' or 'file_path'.")
 
-    if language is None:
-        language = detect_language(file_path=file_path, code=code)
+    FUNCTION_TYPES = (
+        "function_definition",              # C, C++
+        "function_declaration",             # JavaScript
+        "generator_function_declaration",   # JavaScript
+        "method_declaration",               # Java
+        "constructor_declaration",          # Java
+        "method_definition",                # JavaScript class methods
+    )
+    CLASS_TYPES = ("class_declaration", "class_specifier", "struct_specifier", "class")
+    CLASS_BODY_TYPES = ("class_body", "declaration_list", "field_declaration_list")
+    BLOCK_TYPES = (
+        "compound_statement", "statement_block", "block",
+        "class_body", "switch_body", "switch_block",
+    )
+    DECLARATION_TYPES = (
+        "variable_declaration", "lexical_declaration",
+        "local_variable_declaration", "declaration",
+    )
+    LOOP_TYPES = (
+        "for_statement", "while_statement", "do_statement",
+        "enhanced_for_statement", "for_in_statement", "for_range_loop",
+    )
+    NUMBER_TYPES = (
+        "number", "number_literal", "decimal_integer_literal", "integer_literal",
+        "hex_integer_literal", "octal_integer_literal", "binary_integer_literal",
+        "decimal_floating_point_literal", "float_literal",
+    )
+    CALL_TYPES = ("call_expression", "method_invocation")
+    LEAF_TYPES = NUMBER_TYPES + (
+        "string", "string_literal", "character_literal", "template_literal",
+        "true", "false", "null", "null_literal", "undefined", "this", "super",
+        "identifier", "property_identifier", "shorthand_property_identifier",
+        "type_identifier", "field_identifier", "comment", "line_comment", "block_comment",
+    )
 
-    analyzer = get_analyzer(language)
-    result = analyzer.analyze(code, file_path=file_path)
+    IO_FUNCTIONS = {
+        "java": {"println", "printf", "print", "read", "write", "readLine"},
+        "c": {"printf", "scanf", "fprintf", "fscanf", "fopen", "fclose",
+              "fread", "fwrite", "puts", "gets", "getchar", "putchar", "fgets", "fputs"},
+        "cpp": {"cout", "cin", "cerr", "clog", "printf", "scanf", "getline"},
+        "javascript": {"log", "error", "warn", "info", "debug", "trace", "alert", "prompt",
+                       "confirm", "readFile", "writeFile", "readFileSync", "writeFileSync"},
+    }
+    IO_CALL_SUBSTRINGS = {
+        "java": ["System.out", "System.err", "System.in", "Scanner", "BufferedReader",
+                 "FileReader", "FileWriter", "PrintWriter"],
+        "javascript": ["console.", "document.write", "fs.", "process.stdout",
+                       "process.stderr", "process.stdin"],
+    }
+    NETWORK_FUNCTIONS = {
+        "java": {"HttpURLConnection", "URL", "Socket", "ServerSocket",
+                 "HttpClient", "HttpRequest", "RestTemplate", "WebClient"},
+        "c": {"socket", "connect", "send", "recv", "bind", "listen", "accept"},
+        "cpp": {"socket", "connect", "send", "recv"},
+        "javascript": {"fetch", "axios", "XMLHttpRequest", "WebSocket"},
+    }
+    NETWORK_CALL_SUBSTRINGS = {
+        "cpp": ["boost::asio", "curl_", "httplib"],
+        "javascript": ["http.request", "https.request", "net.connect"],
+    }
+    ALLOC_FUNCTIONS = {
+        "c": {"malloc", "calloc", "realloc", "free", "alloca"},
+        "cpp": {"malloc", "calloc", "make_shared", "make_unique"},
+    }
 
-    return result
+    def __init__(self, language: str, track_lines: bool = False,
+                 energy_profile: Optional[EnergyProfile] = None):
+        super().__init__(track_lines=track_lines, energy_profile=energy_profile)
+        self.language = language
+        self.grammar = TREE_SITTER_GRAMMARS[language]
+        self.io_functions = self.IO_FUNCTIONS.get(language, set())
+        self.io_call_substrings = self.IO_CALL_SUBSTRINGS.get(language, [])
+        self.network_functions = self.NETWORK_FUNCTIONS.get(language, set())
+        self.network_call_substrings = self.NETWORK_CALL_SUBSTRINGS.get(language, [])
+        self.alloc_functions = self.ALLOC_FUNCTIONS.get(language, set())
 
+    def analyze(self, code: str, file_path: Optional[str] = None) -> AnalysisResult:
+        parser = get_tree_sitter_parser(self.grammar)
+        if parser is None:
+            raise RuntimeError(f"tree-sitter grammar for '{self.language}' is not available")
 
-def save_result_json(result: AnalysisResult, output_path: str = OUTPUT_JSON_PATH):
-    """Save the analysis result to a JSON file."""
-    data = result.to_dict()
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-    return output_path
+        tree = parser.parse(code.encode("utf-8"))
+        root = tree.root_node
 
+        self.result = AnalysisResult(language=self.language, file_path=file_path)
+        self._init_line_costs(code)
+        self._attributed_total = 0
+        self.result.assumptions.append(
+            f"Tree-sitter AST-based analysis for {self.language}"
+        )
+        self.result.assumptions.append(
+            f"Energy per operation: {ENERGY_PER_OPERATION_JOULES} J"
+        )
+        self.result.assumptions.append(
+            f"Carbon intensity: {CARBON_INTENSITY_G_PER_KWH} gCO2/kWh (global average)"
+        )
 
-# =============================================================================
-# CLI ENTRY POINT
-# =============================================================================
+        self._variable_constants: Dict[str, int] = {}
+        self._extract_constants(root)
 
-def main():
-    """
-    CLI entry point.
+        # One query pass over the whole file collects every call site
+        self._call_sites: List[Tuple[object, str]] = []
+        query = _get_tree_sitter_query(self.grammar, TREE_SITTER_CALL_QUERIES[self.language])
+        if query is not None:
+            captures = _tree_sitter_captures(query, root)
+            self._call_sites = [(n.parent, self._text(n)) for n in captures.get("name", [])]
 
-    Modes:
-    1. --file <path>     : analyze a source code file
-    2. (no args)         : read code from stdin (paste & press Ctrl+D / Ctrl+Z)
-    3. --code "<string>" : pass code as a command-line string
+        for child in root.named_children:
+            self._analyze_top_level(child)
 
-    Output is always saved to carbon_footprint_result.json
-    """
-    import argparse
+        self.result.line_costs = self._line_costs_to_map()
+        self.result.stack_costs = self._stack_costs
+        return self.result
 
-    parser = argparse.ArgumentParser(
-        description="Estimate carbon footprint of source code via static analysis.",
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""
-Examples:
-  python carbon_footprint_estimator.py --file mycode.py
-  python carbon_footprint_estimator.py --file Main.java --language java
-  python carbon_footprint_estimator.py --code "for i in range(100): print(i)"
-  python carbon_footprint_estimator.py                   # interactive input
-  python carbon_footprint_estimator.py --output result.json
-        """,
-    )
-    parser.add_argument("--file", "-f", help="Path to source code file to analyze")
-    parser.add_argument("--code", "-c", help="Source code as a string")
-    parser.add_argument(
-        "--language", "-l",
-        choices=["python", "java", "c", "cpp", "javascript"],
-        help="Programming language (auto-detected if omitted)",
-    )
-    parser.add_argument(
-        "--output", "-o",
-        default=OUTPUT_JSON_PATH,
-        help=f"Output JSON file path (default: {OUTPUT_JSON_PATH})",
-    )
+    def _analyze_top_level(self, node, class_name: Optional[str] = None):
+        if node.type in self.FUNCTION_TYPES:
+            self.result.functions.append(self._analyze_function(node, class_name))
+        elif node.type in self.CLASS_TYPES:
+            self._analyze_class(node)
+        elif node.type in ("export_statement", "template_declaration", "namespace_definition",
+                           "linkage_specification", "program", "translation_unit"):
+            for child in node.named_children:
+                self._analyze_top_level(child, class_name)
+        elif self._declared_function(node) is not None:
+            # const f = (x) => { ... } / const f = function () { ... }
+            name, func_node = self._declared_function(node)
+            self.result.functions.append(self._analyze_function(func_node, class_name, name=name))
+        else:
+            self.result.global_operations.merge(self._analyze_node(node, 1))
 
-    args = parser.parse_args()
+    def _analyze_class(self, node):
+        name_node = node.child_by_field_name("name")
+        class_name = self._text(name_node) if name_node else "UnknownClass"
+        body = node.child_by_field_name("body") or next(
+            (c for c in node.named_children if c.type in self.CLASS_BODY_TYPES), None
+        )
+        if body is None:
+            return
+        for item in body.named_children:
+            if item.type in self.FUNCTION_TYPES:
+                self.result.functions.append(self._analyze_function(item, class_name))
+            elif item.type in self.CLASS_TYPES:
+                self._analyze_class(item)
+
+    def _declared_function(self, node) -> Optional[Tuple[str, object]]:
+        """Match JS `const name = (...) => {...}` / `= function () {...}` declarations."""
+        if node.type not in ("lexical_declaration", "variable_declaration"):
+            return None
+        for declarator in node.named_children:
+            value = declarator.child_by_field_name("value")
+            name = declarator.child_by_field_name("name")
+            if value is not None and name is not None and value.type in (
+                "arrow_function", "function_expression", "function",
+            ):
+                return self._text(name), value
+        return None
 
-    code = None
-    file_path = None
+    # ----- Constants -------------------------------------------------------
 
-    if args.file:
-        file_path = args.file
-    elif args.code:
-        code = args.code
-    else:
-        # Interactive: read from stdin
-        print("=" * 60)
-        print("  CARBON FOOTPRINT ESTIMATOR — Interactive Mode")
-        print("=" * 60)
-        print()
-        print("Paste your source code below.")
-        print("When done, press Enter then Ctrl+Z (Windows) or Ctrl+D (Unix).")
-        print("-" * 60)
+    def _extract_constants(self, node):
+        """
+        Record the numeric constants of one scope for loop bound resolution:
+        names given a value exactly once, by a declarator or a plain `=`.
+        Nested function bodies are separate scopes and are not entered;
+        names assigned more than once, compound-assigned or ++/--'d are
+        forgotten (they may shadow an outer constant).
+        """
+        assigned: Dict[str, list] = {}
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            t = current.type
+            if current is not node and t in self.NESTED_DEFINITION_TYPES and t not in self.CLASS_TYPES:
+                continue
+            if t in self.DECLARATION_TYPES:
+                for child in current.named_children:
+                    name_node = child.child_by_field_name("name") or child.child_by_field_name("declarator")
+                    value_node = child.child_by_field_name("value")
+                    name = self._declarator_name(name_node) if name_node is not None else None
+                    if name and value_node is not None:
+                        assigned.setdefault(name, []).append(value_node)
+            elif t == "assignment_expression":
+                left = current.child_by_field_name("left")
+                if left is not None and left.type == "identifier":
+                    # `n /= 2` is an assignment_expression too in C and Java
+                    value = current.child_by_field_name("right") if self._operator(current) == "=" else None
+                    assigned.setdefault(self._text(left), []).append(value)
+            elif t in ("augmented_assignment_expression", "compound_assignment_expr", "update_expression"):
+                target = current.child_by_field_name("left") or current.child_by_field_name("argument") or (
+                    current.named_children[0] if current.named_children else None)
+                if target is not None and target.type == "identifier":
+                    assigned.setdefault(self._text(target), []).append(None)
+            stack.extend(current.named_children)
+
+        # Resolve in source order so `m = n * 2` sees `n = 10` above it
+        for name in list(assigned):
+            if len(assigned[name]) != 1 or assigned[name][0] is None:
+                self._variable_constants.pop(name, None)
+                del assigned[name]
+        for name, (value_node,) in sorted(assigned.items(), key=lambda item: item[1][0].start_byte):
+            value = self._resolve_constant_expr(value_node)
+            if value is None:
+                self._variable_constants.pop(name, None)
+            else:
+                self._variable_constants[name] = value
+
+    def _parameter_names(self, node) -> Set[str]:
+        """Identifiers declared in a function's parameter list (everything outside its body and name)."""
+        names = set()
+        stack = [c for c in node.named_children if c != node.child_by_field_name("body")]
+        while stack:
+            current = stack.pop()
+            if current.type == "identifier":
+                names.add(self._text(current))
+            elif current.type not in self.NESTED_DEFINITION_TYPES:
+                stack.extend(current.named_children)
+        names.discard(self._function_name(node))
+        return names
+
+    def _declarator_name(self, node) -> Optional[str]:
+        if node.type == "identifier":
+            return self._text(node)
+        if node.type in ("variable_declarator", "init_declarator", "pointer_declarator"):
+            inner = node.child_by_field_name("name") or node.child_by_field_name("declarator")
+            return self._declarator_name(inner) if inner is not None else None
+        return None
+
+    def _resolve_constant_expr(self, node) -> Optional[int]:
+        if node is None:
+            return None
+        if node.type in self.NUMBER_TYPES:
+            return self._parse_number(self._text(node))
+        if node.type == "identifier":
+            return self._variable_constants.get(self._text(node))
+        if node.type == "parenthesized_expression" and node.named_children:
+            return self._resolve_constant_expr(node.named_children[0])
+        if node.type == "binary_expression":
+            left = self._resolve_constant_expr(node.child_by_field_name("left"))
+            right = self._resolve_constant_expr(node.child_by_field_name("right"))
+            if left is not None and right is not None:
+                op = self._operator(node)
+                if op == "+": return left + right
+                if op == "-": return left - right
+                if op == "*": return left * right
+                if op == "/" and right != 0: return left // right
+                if op == "%" and right != 0: return left % right
+        if node.type == "unary_expression" and node.named_children:
+            val = self._resolve_constant_expr(node.named_children[0])
+            if val is not None and self._operator(node) == "-":
+                return -val
+        return None
+
+    @staticmethod
+    def _parse_number(text: str) -> Optional[int]:
+        cleaned = text.replace("_", "").rstrip("lLfFdDuU")
         try:
-            code = sys.stdin.read()
-        except KeyboardInterrupt:
-            print("\nAborted.")
-            sys.exit(0)
+            return int(cleaned, 0)
+        except ValueError:
+            try:
+                return int(float(cleaned))
+            except ValueError:
+                return None
+
+    # ----- Functions -------------------------------------------------------
+
+    def _analyze_function(self, node, class_name: Optional[str] = None,
+                          name: Optional[str] = None) -> FunctionAnalysis:
+        func_name = name or self._function_name(node)
+        qualified = f"{class_name}.{func_name}" if class_name else func_name
+        func = FunctionAnalysis(name=qualified, line_number=node.start_point[0] + 1)
+        frame_depth = len(self._frames)
+        self._frames.extend(qualified.split("."))
 
-        if not code or not code.strip():
-            print("Error: No code provided.")
-            sys.exit(1)
+        saved_vars = dict(self._variable_constants)
+        # Parameters shadow outer constants of the same name
+        for param in self._parameter_names(node):
+            self._variable_constants.pop(param, None)
+        self._extract_constants(node)
+
+        start, end = node.start_byte, node.end_byte
+        self_calls = []
+        for call, callee in self._call_sites:
+            if start <= call.start_byte and call.end_byte <= end:
+                func.calls.append(callee)
+                if callee == func_name:
+                    self_calls.append(call)
+        func.is_recursive = bool(self_calls)
+
+        body = node.child_by_field_name("body")
+        if body is not None:
+            if body.type in self.BLOCK_TYPES:
+                for stmt in body.named_children:
+                    func.operations.merge(self._analyze_node(stmt, 1))
+            else:
+                # Expression-bodied arrow function
+                func.operations.merge(self._analyze_expression(body, 1))
 
-    # Run analysis
-    result = estimate_carbon_footprint(code=code, file_path=file_path, language=args.language)
+        if func.is_recursive:
+            func.recursion = self._analyze_recursion(node, self_calls)
+            activations = func.recursion.activations
+            func.operations = func.operations.scale(activations)
+            self.result.assumptions.append(
+                f"Function '{qualified}' is recursive ({func.recursion.growth}, "
+                f"{func.recursion.calls_per_activation} self-call(s) per activation, "
+                f"{func.recursion.shrink.value} argument) — assumed {activations} activations"
+            )
+            if self._line_costs is not None:
+                self._scale_line_costs(node.start_point[0] + 1, node.end_point[0] + 1, activations)
 
-    # Save to JSON
-    out_path = save_result_json(result, args.output)
+        func.complexity = self._estimate_complexity(body) if body is not None else COMPLEXITY_CONSTANT
+        if func.recursion is not None:
+            func.complexity = recursive_complexity(func.recursion, func.complexity)
+        func.max_nesting = self._get_max_loop_depth(node)
+        self._variable_constants = saved_vars
+        del self._frames[frame_depth:]
+        return func
 
-    # Also print a brief summary to console
-    print()
-    print("=" * 60)
-    print("  CARBON FOOTPRINT RESULT")
-    print("=" * 60)
-    print(f"  Language            : {result.language.upper()}")
-    print(f"  Functions analyzed  : {len(result.functions)}")
-    print(f"  Total weighted ops  : {result.total_weighted_ops:,}")
-    print(f"  Energy (Joules)     : {result.energy_joules:.6e}")
-    print(f"  Energy (kWh)        : {result.energy_kwh:.6e}")
-    print(f"  Carbon (gCO2)       : {result.carbon_grams:.6e}")
-    print(f"  Carbon (mgCO2)      : {result.carbon_grams * 1000:.6e}")
+    def _function_name(self, node) -> str:
+        name_node = node.child_by_field_name("name") or node.child_by_field_name("declarator")
+        while name_node is not None:
+            if name_node.type in ("identifier", "property_identifier", "field_identifier"):
+                return self._text(name_node)
+            if name_node.type in ("qualified_identifier", "destructor_name", "operator_name"):
+                inner = name_node.child_by_field_name("name")
+                return self._text(inner if inner is not None else name_node)
+            name_node = name_node.child_by_field_name("declarator")
+        return "unknown"
+
+    def _analyze_recursion(self, node, self_calls: list) -> RecursionProfile:
+        """
+        Self-calls inside separate return statements are alternative exits
+        (only one runs per activation); all other self-calls add up.
+        """
+        halved_names = find_halved_names(self._text(node))
+        sequential = 0
+        per_return: Dict[int, int] = {}
+        shrinks = set()
+        for call in self_calls:
+            ret = call.parent
+            while ret is not None and ret.type != "return_statement" and ret.start_byte >= node.start_byte:
+                ret = ret.parent
+            if ret is not None and ret.type == "return_statement":
+                per_return[ret.start_byte] = per_return.get(ret.start_byte, 0) + 1
+            else:
+                sequential += 1
+            args = call.child_by_field_name("arguments")
+            shrinks.add(classify_shrink_text(self._text(args) if args else "", halved_names))
+        calls = sequential + max(per_return.values(), default=0)
+        return estimate_recursion(max(1, calls), dominant_shrink(shrinks), self.default_recursion_depth)
 
-    if result.hotspots:
-        print()
-        print("  Top hotspot functions:")
-        for i, f in enumerate(result.hotspots, 1):
-            pct = (f.weighted_ops / result.total_weighted_ops * 100) if result.total_weighted_ops > 0 else 0
-            print(f"    {i}. {f.name} — {f.weighted_ops:,} ops ({pct:.1f}%)")
+    # ----- Statements ------------------------------------------------------
 
-    print()
-    print(f"  Full results saved to: {out_path}")
-    print("=" * 60)
+    def _analyze_body(self, body, multiplier: int) -> OperationCount:
+        """Analyze a loop/branch body that may be a block or a single statement."""
+        ops = OperationCount()
+        if body is None:
+            return ops
+        if body.type in self.BLOCK_TYPES:
+            for stmt in body.named_children:
+                ops.merge(self._analyze_node(stmt, multiplier))
+        else:
+            ops.merge(self._analyze_node(body, multiplier))
+        return ops
+
+    def _analyze_node(self, node, loop_multiplier: int = 1) -> OperationCount:
+        """
+        Recursively analyze a statement node. Loop multipliers cascade into
+        loop bodies exactly as in PythonAnalyzer._analyze_node.
+        """
+        ops = OperationCount()
+        if node is None:
+            return ops
+
+        t = node.type
+
+        loop_frame = False
+        if self._line_costs is not None:
+            attributed_before = self._attributed_total
+            loop_frame = t in self.LOOP_TYPES
+            if loop_frame:
+                kind = "while" if "while" in t else "do" if t.startswith("do") else "for"
+                self._frames.append(f"{kind}@{node.start_point[0] + 1}")
+
+        if t in self.DECLARATION_TYPES:
+            for child in node.named_children:
+                if child.type in ("variable_declarator", "init_declarator"):
+                    ops.add(OpType.ASSIGNMENT, loop_multiplier)
+                    ops.merge(self._analyze_expression(child.child_by_field_name("value"), loop_multiplier))
+
+        elif t == "expression_statement":
+            for child in node.named_children:
+                ops.merge(self._analyze_expression(child, loop_multiplier))
+
+        elif t == "for_statement":
+            iterations = self._estimate_for_iterations(node)
+            inner_multiplier = saturating_mul(loop_multiplier, iterations)
+            self._record_loop_assumption(node, "for-loop", iterations)
+            ops.add(OpType.COMPARISON, inner_multiplier)
+            init = node.child_by_field_name("initializer") or node.child_by_field_name("init")
+            if init is not None:
+                if init.type in self.DECLARATION_TYPES:
+                    ops.merge(self._analyze_node(init, loop_multiplier))
+                else:
+                    ops.merge(self._analyze_expression(init, loop_multiplier))
+            ops.merge(self._analyze_expression(node.child_by_field_name("condition"), loop_multiplier))
+            ops.merge(self._analyze_expression(node.child_by_field_name("update"), inner_multiplier))
+            ops.merge(self._analyze_body(node.child_by_field_name("body"), inner_multiplier))
+
+        elif t in ("enhanced_for_statement", "for_in_statement", "for_range_loop"):
+            iterations = self._estimate_foreach_iterations(node)
+            inner_multiplier = saturating_mul(loop_multiplier, iterations)
+            self._record_loop_assumption(node, "for-each loop", iterations)
+            ops.add(OpType.COMPARISON, inner_multiplier)
+            ops.merge(self._analyze_body(node.child_by_field_name("body"), inner_multiplier))
+
+        elif t == "while_statement":
+            iterations = self._estimate_while_iterations(node)
+            inner_multiplier = saturating_mul(loop_multiplier, iterations)
+            self._record_loop_assumption(node, "while-loop", iterations)
+            ops.add(OpType.COMPARISON, inner_multiplier)
+            ops.merge(self._analyze_expression(node.child_by_field_name("condition"), loop_multiplier))
+            ops.merge(self._analyze_body(node.child_by_field_name("body"), inner_multiplier))
+
+        elif t == "do_statement":
+            iterations = self.default_loop_iterations
+            inner_multiplier = saturating_mul(loop_multiplier, iterations)
+            self._record_loop_assumption(node, "do-while loop", iterations)
+            ops.add(OpType.COMPARISON, inner_multiplier)
+            ops.merge(self._analyze_body(node.child_by_field_name("body"), inner_multiplier))
+
+        elif t == "if_statement":
+            ops.add(OpType.CONDITIONAL, loop_multiplier)
+            ops.merge(self._analyze_expression(node.child_by_field_name("condition"), loop_multiplier))
+            ops.merge(self._analyze_body(node.child_by_field_name("consequence"), loop_multiplier))
+            alternative = node.child_by_field_name("alternative")
+            if alternative is not None:
+                if alternative.type == "else_clause":
+                    for child in alternative.named_children:
+                        ops.merge(self._analyze_body(child, loop_multiplier))
+                else:
+                    ops.merge(self._analyze_body(alternative, loop_multiplier))
+
+        elif t in ("switch_statement", "switch_expression"):
+            ops.add(OpType.CONDITIONAL, loop_multiplier)
+            ops.merge(self._analyze_expression(node.child_by_field_name("condition"), loop_multiplier))
+            body = node.child_by_field_name("body")
+            if body is not None:
+                for case in body.named_children:
+                    for stmt in case.named_children:
+                        if stmt.type.endswith("statement") or stmt.type in self.DECLARATION_TYPES:
+                            ops.merge(self._analyze_node(stmt, loop_multiplier))
+
+        elif t in ("return_statement", "yield_statement"):
+            for child in node.named_children:
+                ops.merge(self._analyze_expression(child, loop_multiplier))
+
+        elif t in ("try_statement", "try_with_resources_statement"):
+            for child in node.named_children:
+                if child.type in self.BLOCK_TYPES:
+                    ops.merge(self._analyze_body(child, loop_multiplier))
+                elif child.type in ("catch_clause", "finally_clause", "except_clause"):
+                    ops.merge(self._analyze_body(
+                        child.child_by_field_name("body")
+                        or next((c for c in child.named_children if c.type in self.BLOCK_TYPES), None),
+                        loop_multiplier,
+                    ))
+
+        elif t == "throw_statement":
+            ops.add(OpType.FUNCTION_CALL, loop_multiplier)
+
+        elif t in ("break_statement", "continue_statement", "empty_statement", "comment",
+                   "line_comment", "block_comment") or t in self.FUNCTION_TYPES or t in self.CLASS_TYPES:
+            pass
+
+        elif t in self.BLOCK_TYPES:
+            for stmt in node.named_children:
+                ops.merge(self._analyze_node(stmt, loop_multiplier))
+
+        else:
+            for child in node.named_children:
+                ops.merge(self._analyze_node(child, loop_multiplier))
+
+        if self._line_costs is not None:
+            own = max(0, ops.total_weighted - (self._attributed_total - attributed_before))
+            self._add_line_cost(node.start_point[0] + 1, own)
+            self._attributed_total += own
+            if loop_frame:
+                self._frames.pop()
+
+        return ops
+
+    def _record_loop_assumption(self, node, kind: str, iterations: int):
+        self.result.assumptions.append(
+            f"Line {node.start_point[0] + 1}: {kind} estimated {iterations} iterations"
+        )
+
+    # ----- Expressions -----------------------------------------------------
+
+    def _analyze_expression(self, node, multiplier: int = 1) -> OperationCount:
+        """Analyze an expression node for operations."""
+        ops = OperationCount()
+        if node is None:
+            return ops
+
+        t = node.type
+
+        if t == "binary_expression":
+            op = self._operator(node)
+            if op == "+":
+                ops.add(OpType.ADDITION, multiplier)
+            elif op == "-":
+                ops.add(OpType.SUBTRACTION, multiplier)
+            elif op == "*":
+                ops.add(OpType.MULTIPLICATION, multiplier)
+            elif op in ("/", "%"):
+                ops.add(OpType.DIVISION, multiplier)
+            elif op in ("<", ">", "<=", ">=", "==", "!=", "===", "!==", "instanceof", "&&", "||"):
+                ops.add(OpType.COMPARISON, multiplier)
+            else:
+                ops.add(OpType.ADDITION, multiplier)  # bitwise ops ~ addition cost
+            ops.merge(self._analyze_expression(node.child_by_field_name("left"), multiplier))
+            ops.merge(self._analyze_expression(node.child_by_field_name("right"), multiplier))
+
+        elif t == "unary_expression":
+            ops.add(OpType.ADDITION, multiplier)
+            for child in node.named_children:
+                ops.merge(self._analyze_expression(child, multiplier))
+
+        elif t == "update_expression":
+            if "--" in self._text(node):
+                ops.add(OpType.SUBTRACTION, multiplier)
+            else:
+                ops.add(OpType.ADDITION, multiplier)
+            ops.add(OpType.ASSIGNMENT, multiplier)
+
+        elif t == "assignment_expression":
+            ops.add(OpType.ASSIGNMENT, multiplier)
+            ops.merge(self._analyze_expression(node.child_by_field_name("right"), multiplier))
+
+        elif t in ("augmented_assignment_expression", "compound_assignment_expr"):
+            ops.add(OpType.ASSIGNMENT, multiplier)
+            op = self._operator(node)
+            if op == "+=":
+                ops.add(OpType.ADDITION, multiplier)
+            elif op == "-=":
+                ops.add(OpType.SUBTRACTION, multiplier)
+            elif op == "*=":
+                ops.add(OpType.MULTIPLICATION, multiplier)
+            elif op in ("/=", "%="):
+                ops.add(OpType.DIVISION, multiplier)
+            ops.merge(self._analyze_expression(node.child_by_field_name("right"), multiplier))
+
+        elif t in self.CALL_TYPES:
+            ops.add(self._classify_call(node), multiplier)
+            args = node.child_by_field_name("arguments")
+            if args is not None:
+                for arg in args.named_children:
+                    ops.merge(self._analyze_expression(arg, multiplier))
+            receiver = node.child_by_field_name("object") or node.child_by_field_name("function")
+            if receiver is not None and receiver.type not in self.LEAF_TYPES:
+                ops.merge(self._analyze_expression(receiver, multiplier))
+
+        elif t in ("new_expression", "object_creation_expression", "array_creation_expression"):
+            ops.add(OpType.MEMORY_ALLOC, multiplier)
+            args = node.child_by_field_name("arguments")
+            if args is not None:
+                for arg in args.named_children:
+                    ops.merge(self._analyze_expression(arg, multiplier))
+
+        elif t in ("subscript_expression", "array_access"):
+            ops.add(OpType.ARRAY_ACCESS, multiplier)
+            for child in node.named_children:
+                ops.merge(self._analyze_expression(child, multiplier))
+
+        elif t in ("member_expression", "field_access", "field_expression"):
+            obj = node.child_by_field_name("object") or node.child_by_field_name("argument")
+            ops.merge(self._analyze_expression(obj, multiplier))
+
+        elif t in ("ternary_expression", "conditional_expression"):
+            ops.add(OpType.CONDITIONAL, multiplier)
+            for child in node.named_children:
+                ops.merge(self._analyze_expression(child, multiplier))
+
+        elif t in ("array", "array_initializer", "initializer_list"):
+            if node.named_child_count > 0:
+                ops.add(OpType.MEMORY_ALLOC, multiplier)
+                ops.add(OpType.ASSIGNMENT, multiplier * node.named_child_count)
+            for elt in node.named_children:
+                ops.merge(self._analyze_expression(elt, multiplier))
+
+        elif t == "object":
+            props = [c for c in node.named_children if c.type in ("pair", "shorthand_property_identifier",
+                                                                  "spread_element", "method_definition")]
+            if props:
+                ops.add(OpType.MEMORY_ALLOC, multiplier)
+                ops.add(OpType.ASSIGNMENT, multiplier * len(props))
+            for prop in props:
+                ops.merge(self._analyze_expression(prop.child_by_field_name("value"), multiplier))
+
+        elif t == "template_string":
+            for child in node.named_children:
+                if child.type == "template_substitution":
+                    for expr in child.named_children:
+                        ops.merge(self._analyze_expression(expr, multiplier))
+                    ops.add(OpType.FUNCTION_CALL, multiplier)  # formatting cost
+
+        elif t in ("cast_expression", "sizeof_expression"):
+            ops.add(OpType.FUNCTION_CALL, multiplier)
+            ops.merge(self._analyze_expression(node.child_by_field_name("value"), multiplier))
+
+        elif t in ("delete_expression",):
+            ops.add(OpType.MEMORY_ALLOC, multiplier)
+
+        elif t in ("arrow_function", "function_expression", "function", "lambda_expression"):
+            # Inline callbacks are assumed to run once per evaluation of the
+            # enclosing expression (same as the TypeScript analyzer)
+            ops.add(OpType.FUNCTION_CALL, multiplier)
+            body = node.child_by_field_name("body")
+            if body is not None and body.type in self.BLOCK_TYPES:
+                ops.merge(self._analyze_body(body, multiplier))
+            else:
+                ops.merge(self._analyze_expression(body, multiplier))
+
+        elif t in self.LEAF_TYPES:
+            pass
+
+        else:
+            for child in node.named_children:
+                ops.merge(self._analyze_expression(child, multiplier))
+
+        return ops
+
+    def _classify_call(self, node) -> OpType:
+        name_node = node.child_by_field_name("name") or node.child_by_field_name("function")
+        call_name = self._call_name(name_node)
+        full_call = self._text(node.child_by_field_name("function") or node).split("(")[0]
+        if node.type == "method_invocation":
+            obj = node.child_by_field_name("object")
+            full_call = f"{self._text(obj)}.{call_name}" if obj is not None else call_name or ""
+        if call_name is None:
+            return OpType.FUNCTION_CALL
+        if call_name in self.io_functions or any(io in full_call for io in self.io_call_substrings):
+            return OpType.IO_OPERATION
+        if call_name in self.network_functions or any(n in full_call for n in self.network_call_substrings):
+            return OpType.NETWORK_OP
+        if call_name in self.alloc_functions:
+            return OpType.MEMORY_ALLOC
+        return OpType.FUNCTION_CALL
+
+    def _call_name(self, node) -> Optional[str]:
+        if node is None:
+            return None
+        if node.type in ("identifier", "property_identifier", "field_identifier"):
+            return self._text(node)
+        inner = (node.child_by_field_name("property") or node.child_by_field_name("field")
+                 or node.child_by_field_name("name"))
+        return self._text(inner) if inner is not None else None
+
+    # ----- Loop estimation -------------------------------------------------
+
+    def _estimate_for_iterations(self, node) -> int:
+        """Estimate iterations for `for (init; i < N; step)` loops."""
+        iterations = self._resolve_for_iterations(node)
+        return self.default_loop_iterations if iterations is None else iterations
+
+    def _resolve_for_iterations(self, node) -> Optional[int]:
+        """Resolve iterations of a `for (init; i < N; step)` loop, or None."""
+        condition = node.child_by_field_name("condition")
+        if condition is None or condition.type != "binary_expression":
+            return None
+
+        init = node.child_by_field_name("initializer") or node.child_by_field_name("init")
+        start = self._extract_init_value(init) if init is not None else 0
+        end = self._resolve_constant_expr(condition.child_by_field_name("right"))
+        if start is None or end is None:
+            return None
+
+        step = self._extract_step(node.child_by_field_name("update"))
+        op = self._operator(condition)
+        if op == "<":
+            span = end - start
+        elif op == "<=":
+            span = end - start + 1
+        elif op == ">":
+            span = start - end
+        elif op == ">=":
+            span = start - end + 1
+        else:
+            return None
+        return max(0, -(-span // step))
+
+    def _extract_init_value(self, init) -> Optional[int]:
+        if init.type == "assignment_expression":
+            return self._resolve_constant_expr(init.child_by_field_name("right"))
+        for child in init.named_children:
+            value = child.child_by_field_name("value")
+            if value is not None:
+                return self._resolve_constant_expr(value)
+        return None
+
+    def _extract_step(self, update) -> int:
+        if update is None:
+            return 1
+        nodes = [update] + list(update.named_children)
+        for n in nodes:
+            if n.type in ("augmented_assignment_expression", "compound_assignment_expr"):
+                step = self._resolve_constant_expr(n.child_by_field_name("right"))
+                return step if step and step > 0 else 1
+        return 1
+
+    def _estimate_foreach_iterations(self, node) -> int:
+        """for (x : [1, 2, 3]) / for (x of [..]) over a literal, else the default."""
+        iterations = self._resolve_foreach_iterations(node)
+        return self.default_loop_iterations if iterations is None else iterations
+
+    def _resolve_foreach_iterations(self, node) -> Optional[int]:
+        for child in node.named_children:
+            if child.type in ("array", "array_initializer", "initializer_list"):
+                return child.named_child_count
+        return None
+
+    def _estimate_while_iterations(self, node) -> int:
+        iterations = self._resolve_while_iterations(node)
+        if iterations is not None:
+            return iterations
+        if self._is_halving_loop(node):
+            return 20  # binary search pattern, ~log2(1_000_000)
+        return self.default_loop_iterations
+
+    def _resolve_while_iterations(self, node) -> Optional[int]:
+        condition = self._while_condition(node)
+        if condition is None:
+            return None
+
+        left = condition.child_by_field_name("left")
+        right = condition.child_by_field_name("right")
+        op = self._operator(condition)
+        bound = self._resolve_constant_expr(right)
+        if left is not None and left.type == "identifier" and bound is not None:
+            start = self._variable_constants.get(self._text(left))
+            if op in ("<", "<="):
+                if start is not None:
+                    return max(1, abs(bound - start))
+                return bound if bound > 0 else None
+            if op in (">", ">=") and start is not None:
+                return max(1, start - bound)
+        return None
+
+    def _is_halving_loop(self, node) -> bool:
+        """while (low <= high): binary search."""
+        condition = self._while_condition(node)
+        return condition is not None and self._operator(condition) == "<="
+
+    @staticmethod
+    def _while_condition(node):
+        """The binary_expression of a while condition, unwrapping parentheses."""
+        condition = node.child_by_field_name("condition")
+        while condition is not None and condition.type == "parenthesized_expression" and condition.named_children:
+            condition = condition.named_children[0]
+        if condition is None or condition.type != "binary_expression":
+            return None
+        return condition
+
+    def _get_max_loop_depth(self, node, current_depth: int = 0) -> int:
+        max_depth = current_depth
+        for child in node.named_children:
+            if child.type in self.LOOP_TYPES:
+                max_depth = max(max_depth, self._get_max_loop_depth(child, current_depth + 1))
+            else:
+                max_depth = max(max_depth, self._get_max_loop_depth(child, current_depth))
+        return max_depth
+
+    # ----- Complexity class ------------------------------------------------
+
+    # Nested definitions whose bodies do not run as part of the enclosing function
+    NESTED_DEFINITION_TYPES = FUNCTION_TYPES + CLASS_TYPES + (
+        "arrow_function", "function_expression", "function", "lambda_expression",
+    )
+    SORTING_CALLS = {"sort", "qsort", "stable_sort", "sorted", "toSorted"}
+
+    def _loop_complexity(self, node) -> Complexity:
+        """Resolved bound O(1), binary-search while O(log n), anything else O(n)."""
+        t = node.type
+        if t == "for_statement":
+            resolved = self._resolve_for_iterations(node)
+            update = node.child_by_field_name("update") or node.child_by_field_name("increment")
+            if resolved is None and self._is_halving_update(update):
+                return COMPLEXITY_LOGARITHMIC
+        elif t == "while_statement":
+            resolved = self._resolve_while_iterations(node)
+            if resolved is None and self._is_halving_loop(node):
+                return COMPLEXITY_LOGARITHMIC
+        elif t == "do_statement":
+            resolved = None
+        else:
+            resolved = self._resolve_foreach_iterations(node)
+        return COMPLEXITY_LINEAR if resolved is None else COMPLEXITY_CONSTANT
+
+    def _is_halving_update(self, update) -> bool:
+        """for-loop update that divides or multiplies the counter: i /= 2, i >>= 1, i *= 2."""
+        if update is None:
+            return False
+        for n in [update] + list(update.named_children):
+            if n.type in ("augmented_assignment_expression", "compound_assignment_expr",
+                          "assignment_expression"):
+                return self._operator(n) in ("/=", ">>=", "*=", "<<=")
+        return False
+
+    def _estimate_complexity(self, node) -> Complexity:
+        """Complexity class of the code under node (structural walk, like _get_max_loop_depth)."""
+        complexity = COMPLEXITY_CONSTANT
+        for child in node.named_children:
+            if child.type in self.NESTED_DEFINITION_TYPES:
+                continue
+            inner = self._estimate_complexity(child)
+            if child.type in self.LOOP_TYPES:
+                inner = self._loop_complexity(child) * inner
+            elif child.type in self.CALL_TYPES and self._call_name(
+                    child.child_by_field_name("name") or child.child_by_field_name("function")
+            ) in self.SORTING_CALLS:
+                inner = max(inner, Complexity(degree=1, log_power=1))
+            complexity = max(complexity, inner)
+        return complexity
+
+    # ----- Helpers ---------------------------------------------------------
+
+    @staticmethod
+    def _text(node) -> str:
+        return node.text.decode("utf-8", errors="replace") if node is not None else ""
+
+    @staticmethod
+    def _operator(node) -> str:
+        op = node.child_by_field_name("operator")
+        if op is not None:
+            return op.type
+        for child in node.children:
+            if not child.is_named:
+                return child.type
+        return ""
+
+
+# =============================================================================
+# NOTEBOOK SUPPORT (.ipynb)
+# =============================================================================
+
+# Cell magics whose body is still Python (the magic line itself is dropped)
+PYTHON_CELL_MAGICS = {"time", "timeit", "capture", "prun", "debug", "python", "python3"}
+
+# `files = !ls`, `t = %timeit -o f()`: assignments from shell escapes or magics
+_MAGIC_ASSIGNMENT_RE = re.compile(r"^[\w.,\s\[\]()*]+=\s*[!%]")
+
+
+class _JsonStream:
+    """
+    Minimal pull parser over a JSON text stream. Values the caller asks for
+    are decoded; everything else (notebook outputs, attachments) is skipped
+    chunk by chunk without ever being held in memory as a whole.
+    """
+
+    _STRING_SPECIAL = re.compile(r'["\\]')
+    _STRUCTURAL = re.compile(r'[\[\]{}"]')
+    _SCALAR_END = re.compile(r'[,\]}\s]')
+
+    def __init__(self, f, chunk_size: int = 1 << 16):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._buf = ""
+        self._pos = 0
+        # Text of the value being decoded that has already left the buffer
+        self._captured: Optional[List[str]] = None
+        self._mark = 0
+        # Values consumed so far; tells iter_object whether the caller read a value
+        self._values = 0
+
+    def _fill(self) -> bool:
+        data = self._f.read(self._chunk_size)
+        if not data:
+            return False
+        if self._captured is not None:
+            self._captured.append(self._buf[self._mark:self._pos])
+            self._mark = 0
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            while self._pos < len(self._buf):
+                ch = self._buf[self._pos]
+                if ch not in " \t\r\n":
+                    return ch
+                self._pos += 1
+            if not self._fill():
+                raise ValueError("unexpected end of JSON")
+
+    def _search(self, pattern):
+        """Next match of pattern, reading more input as needed."""
+        while True:
+            match = pattern.search(self._buf, self._pos)
+            if match is not None:
+                return match
+            self._pos = len(self._buf)
+            if not self._fill():
+                return None
+
+    def _skip_string(self):
+        self._pos += 1
+        while True:
+            match = self._search(self._STRING_SPECIAL)
+            if match is None:
+                raise ValueError("unterminated JSON string")
+            if match.group() == '"':
+                self._pos = match.end()
+                return
+            if match.end() < len(self._buf):
+                self._pos = match.end() + 1   # the escaped character
+            else:
+                self._pos = match.start()     # escape split across chunks
+                if not self._fill():
+                    raise ValueError("unterminated JSON string")
+
+    def skip_value(self):
+        ch = self._peek()
+        if ch == '"':
+            self._skip_string()
+        elif ch in "[{":
+            depth = 0
+            while True:
+                match = self._search(self._STRUCTURAL)
+                if match is None:
+                    raise ValueError("unexpected end of JSON")
+                if match.group() == '"':
+                    self._pos = match.start()
+                    self._skip_string()
+                    continue
+                self._pos = match.end()
+                depth += 1 if match.group() in "[{" else -1
+                if depth == 0:
+                    break
+        else:
+            match = self._search(self._SCALAR_END)
+            self._pos = match.start() if match is not None else len(self._buf)
+        self._values += 1
+
+    def read_value(self):
+        """Decode the next value."""
+        self._peek()
+        self._captured, self._mark = [], self._pos
+        try:
+            self.skip_value()
+            self._captured.append(self._buf[self._mark:self._pos])
+            text = "".join(self._captured)
+        finally:
+            self._captured = None
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"invalid JSON value ({exc})")
+
+    def _items(self, opening: str, closing: str):
+        if self._peek() != opening:
+            raise ValueError(f"expected {opening!r} in JSON")
+        self._pos += 1
+        if self._peek() == closing:
+            self._pos += 1
+            self._values += 1
+            return
+        while True:
+            key = None
+            if opening == "{":
+                key = self.read_value()
+                if not isinstance(key, str) or self._peek() != ":":
+                    raise ValueError("malformed JSON object")
+                self._pos += 1
+            consumed = self._values
+            yield key
+            if self._values == consumed:
+                self.skip_value()
+            ch = self._peek()
+            self._pos += 1
+            if ch == closing:
+                break
+            if ch != ",":
+                raise ValueError(f"unexpected {ch!r} in JSON")
+        self._values += 1
+
+    def iter_object(self):
+        """Yield the keys of the next object; a value the caller does not read is skipped."""
+        return self._items("{", "}")
+
+    def iter_array(self):
+        """Yield once per element of the next array; an element the caller does not read is skipped."""
+        return self._items("[", "]")
+
+
+@dataclass
+class NotebookSource:
+    """Code cells of a notebook concatenated into one analyzable module."""
+    code: str
+    cells: List[NotebookCell]
+
+
+def _notebook_cell_lines(source: str, cell: NotebookCell) -> List[str]:
+    """
+    Lines of one code cell with IPython syntax neutralized: magics, shell
+    escapes and help queries become `pass` (keeping blocks valid and the
+    line count intact); a non-Python cell magic or a cell that does not
+    parse is commented out and marked skipped.
+    """
+    lines = source.split("\n")
+    first = next((line.strip() for line in lines if line.strip()), "")
+    if first.startswith("%%"):
+        magic = first[2:].split(None, 1)[0] if len(first) > 2 else ""
+        if magic not in PYTHON_CELL_MAGICS:
+            cell.skipped = f"%%{magic} cell magic"
+            return ["# " + line for line in lines]
+
+    cleaned = []
+    for line in lines:
+        stripped = line.lstrip()
+        if (stripped.startswith(("%", "!", "?")) or _MAGIC_ASSIGNMENT_RE.match(stripped)
+                or (stripped.endswith("?") and not stripped.startswith("#"))):
+            cleaned.append(line[:len(line) - len(stripped)] + "pass")
+        else:
+            cleaned.append(line)
+    try:
+        ast.parse("\n".join(cleaned))
+    except SyntaxError as exc:
+        cell.skipped = f"SyntaxError: {exc.msg}"
+        return ["# " + line for line in lines]
+    return cleaned
+
+
+def read_notebook(source) -> NotebookSource:
+    """
+    Stream-parse a Jupyter notebook (a path or a text file object) and
+    concatenate its code cells in notebook order, keeping each cell's line
+    range. Only cell sources and kernel metadata are decoded; outputs and
+    attachments are skipped without being loaded. nbformat 4 and the
+    worksheet layout of nbformat 3 are supported.
+    """
+    if isinstance(source, str):
+        with open(source, "r", encoding="utf-8") as f:
+            return read_notebook(f)
+
+    stream = _JsonStream(source)
+    cells: List[NotebookCell] = []
+    parts: List[str] = []
+    next_line = 1
+    position = 0   # index among all cells, markdown included
+    language = None
+
+    def read_cells():
+        nonlocal next_line, position
+        for _ in stream.iter_array():
+            cell_type = code = execution_count = None
+            for key in stream.iter_object():
+                if key == "cell_type":
+                    cell_type = stream.read_value()
+                elif key in ("source", "input"):
+                    code = stream.read_value()
+                elif key in ("execution_count", "prompt_number"):
+                    execution_count = stream.read_value()
+            index, position = position, position + 1
+            if cell_type != "code":
+                continue
+            if isinstance(code, list):
+                code = "".join(code)
+            code = (code or "").rstrip("\n")
+            cell = NotebookCell(index=index, first_line=next_line, line_count=0,
+                                execution_count=execution_count if isinstance(execution_count, int) else None)
+            lines = _notebook_cell_lines(code, cell) if code.strip() else []
+            cell.line_count = len(lines)
+            parts.extend(lines)
+            next_line += len(lines)
+            cells.append(cell)
+
+    for key in stream.iter_object():
+        if key == "cells":
+            read_cells()
+        elif key == "worksheets":
+            for _ in stream.iter_array():
+                for sheet_key in stream.iter_object():
+                    if sheet_key == "cells":
+                        read_cells()
+        elif key == "metadata":
+            for meta_key in stream.iter_object():
+                if meta_key in ("kernelspec", "language_info"):
+                    info = stream.read_value()
+                    name = info.get("language" if meta_key == "kernelspec" else "name") if isinstance(info, dict) else None
+                    language = language or (name.lower() if isinstance(name, str) else None)
+
+    if language and language != "python":
+        raise ValueError(f"{language} notebooks are not supported (Python kernels only)")
+    return NotebookSource(code="\n".join(parts), cells=cells)
+
+
+def attribute_notebook_cells(result: AnalysisResult, cells: List[NotebookCell]):
+    """Set each cell's weighted ops from result.line_costs and attach the cells to result."""
+    import bisect
+    starts = [cell.first_line for cell in cells if cell.line_count]
+    counted = [cell for cell in cells if cell.line_count]
+    for cell in cells:
+        cell.weighted_ops = 0
+    for line, cost in (result.line_costs or {}).items():
+        i = bisect.bisect_right(starts, line) - 1
+        if i >= 0 and line < counted[i].first_line + counted[i].line_count:
+            counted[i].weighted_ops += cost
+    result.cells = cells
+
+
+# =============================================================================
+# ANALYZER FACTORY
+# =============================================================================
+
+def get_analyzer(language: str, track_lines: bool = False,
+                 cost_database: Optional[CostDatabase] = None,
+                 energy_profile: Optional[EnergyProfile] = None,
+                 constant_index: Optional[ProjectConstantIndex] = None,
+                 profile_index: Optional[ProfileIndex] = None) -> LanguageAnalyzer:
+    """Factory: return the appropriate analyzer for the language."""
+    if language == "python":
+        return PythonAnalyzer(track_lines=track_lines, cost_database=cost_database,
+                              energy_profile=energy_profile, constant_index=constant_index,
+                              profile_index=profile_index)
+    elif language in ("java", "c", "cpp", "javascript"):
+        # Prefer the tree-sitter analyzer when the bindings and grammar are present
+        if is_tree_sitter_available(language):
+            return TreeSitterAnalyzer(language, track_lines=track_lines, energy_profile=energy_profile)
+        return RegexAnalyzer(language, track_lines=track_lines, energy_profile=energy_profile)
+    else:
+        return RegexAnalyzer(language, track_lines=track_lines, energy_profile=energy_profile)
+
+
+# =============================================================================
+# MAIN ESTIMATOR API
+# =============================================================================
+
+def estimate_carbon_footprint(
+    code: Optional[str] = None,
+    file_path: Optional[str] = None,
+    language: Optional[str] = None,
+    track_lines: bool = False,
+    cost_database: Optional[Union[str, CostDatabase]] = None,
+    energy_profiles: Optional[Union[str, Dict[str, EnergyProfile], List[EnergyProfile]]] = None,
+    project_root: Optional[str] = None,
+    profile_data: Optional[Union[str, List[str], ProfileIndex]] = None,
+) -> AnalysisResult:
+    """
+    Main entry point: estimate the carbon footprint of source code.
+
+    Args:
+        code: Source code as a string (provide this OR file_path).
+        file_path: Path to a source code file.
+        language: Programming language ('python', 'java', 'c', 'cpp', 'javascript').
+                  If None, auto-detected from file extension or code content.
+        track_lines: Also build a sparse line -> weighted ops map (result.line_costs).
+        cost_database: CostDatabase (or path to a JSON cost file merged over the
+                       built-in entries) used to cost known library calls.
+        energy_profiles: Extra energy models to report (a TOML/JSON profile file,
+                         a name -> EnergyProfile dict, or a list). Op counts are
+                         computed once per distinct loop/recursion heuristic and
+                         every profile is applied to them at report time.
+        project_root: Root of the project the file belongs to; module-level
+                      constants imported from other files below it are used
+                      to resolve loop bounds (see ProjectConstantIndex).
+        profile_data: cProfile stats / coverage files of a real workload (or a
+                      ProfileIndex built from them); observed counts replace
+                      heuristic loop bounds and recursion depths (Python only).
+
+    Returns:
+        AnalysisResult with operations, energy, carbon, and per-function breakdown.
+    """
+    notebook = None
+    if file_path and os.path.splitext(file_path)[1].lower() == ".ipynb":
+        notebook = read_notebook(io.StringIO(code) if code is not None else file_path)
+        code = notebook.code
+    elif code is None and file_path:
+        with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+            code = f.read()
+    elif code is None:
+        raise ValueError("Must provide either 'code' or 'file_path'.")
+
+    if language is None:
+        language = detect_language(file_path=file_path, code=code)
+
+    if isinstance(cost_database, str):
+        cost_database = CostDatabase.load(cost_database)
+    if profile_data is not None and not isinstance(profile_data, ProfileIndex):
+        profile_data = ProfileIndex.load(profile_data)
+
+    constant_index = get_project_constant_index(project_root) if project_root else None
+    # Per-cell costs come from the line map
+    analyzer = get_analyzer(language, track_lines=track_lines or notebook is not None,
+                            cost_database=cost_database, constant_index=constant_index,
+                            profile_index=profile_data)
+    result = analyzer.analyze(code, file_path=file_path)
+    if notebook is not None:
+        attribute_notebook_cells(result, notebook.cells)
+        result.assumptions.append(
+            f"Notebook: {len(notebook.cells)} code cell(s) analyzed as one module in notebook order; "
+            f"IPython magics and shell escapes ignored"
+        )
+        result.assumptions.extend(
+            f"Cell {cell.index} skipped ({cell.skipped})" for cell in notebook.cells if cell.skipped
+        )
+        if not track_lines:
+            result.line_costs = result.stack_costs = None
+    if result.unbounded:
+        result.assumptions.append(
+            f"Operation counts saturated at {MAX_OPERATION_COUNT:,}; "
+            f"the estimate is a lower bound (effectively unbounded)"
+        )
+
+    if energy_profiles:
+        if isinstance(energy_profiles, str):
+            energy_profiles = load_energy_profiles(energy_profiles)
+        elif not isinstance(energy_profiles, dict):
+            energy_profiles = {profile.name: profile for profile in energy_profiles}
+        result.energy_profiles = dict(energy_profiles)
+        # Re-analyze only once per heuristic setting the default run does not cover
+        by_heuristics: Dict[Tuple[int, int], Optional[OperationCount]] = {DEFAULT_ENERGY_PROFILE.heuristics: None}
+        for name, profile in energy_profiles.items():
+            if profile.heuristics not in by_heuristics:
+                variant = get_analyzer(language, cost_database=cost_database, energy_profile=profile,
+                                       constant_index=constant_index, profile_index=profile_data)
+                by_heuristics[profile.heuristics] = variant.analyze(code, file_path=file_path).total_operations
+            if by_heuristics[profile.heuristics] is not None:
+                result.profile_operations[name] = by_heuristics[profile.heuristics]
+
+    return result
+
+
+def save_result_json(result: AnalysisResult, output_path: str = OUTPUT_JSON_PATH):
+    """Save the analysis result to a JSON file."""
+    data = result.to_dict()
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    return output_path
+
+
+# =============================================================================
+# ASYNC API
+# =============================================================================
+
+def _estimate_in_worker(options: dict) -> AnalysisResult:
+    """Process-pool entry point (must be a picklable top-level function)."""
+    return estimate_carbon_footprint(**options)
+
+
+@dataclass
+class AsyncBatchResult:
+    """One completed item of an async batch: either a result or the error raised."""
+    index: int
+    request: Union[str, dict]
+    result: Optional[AnalysisResult] = None
+    error: Optional[BaseException] = None
+
+
+class AsyncEstimator:
+    """
+    Runs estimate_carbon_footprint in a managed process pool so that callers
+    on an asyncio event loop are never blocked by parsing/analysis.
+
+    - max_workers:   size of the process pool (default: os.cpu_count())
+    - max_in_flight: cap on analyses submitted at once across all callers
+                     on an event loop; further requests wait on a semaphore
+                     instead of queueing unbounded work in the pool
+
+    Cancelling an awaiting task (or hitting its timeout) cancels the pool
+    job if it has not started yet; a job that is already running finishes
+    in the background, keeping its max_in_flight slot until then, and its
+    result is discarded.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_in_flight: Optional[int] = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or self.max_workers * 2
+        self._pool = None
+        # One semaphore per event loop: a semaphore binds to the loop it is
+        # first awaited on, and callers may asyncio.run() more than once
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = \
+            weakref.WeakKeyDictionary()
+
+    def _get_pool(self):
+        if self._pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_in_flight)
+        return semaphore
+
+    async def estimate(
+        self,
+        code: Optional[str] = None,
+        file_path: Optional[str] = None,
+        language: Optional[str] = None,
+        timeout: Optional[float] = None,
+        **options,
+    ) -> AnalysisResult:
+        """Async equivalent of estimate_carbon_footprint; raises asyncio.TimeoutError on timeout."""
+        if code is None and not file_path:
+            raise ValueError("Must provide either 'code' or 'file_path'.")
+        options.update(code=code, file_path=file_path, language=language)
+
+        semaphore = self._get_semaphore()
+        await semaphore.acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            job = self._get_pool().submit(_estimate_in_worker, options)
+        except BaseException:
+            semaphore.release()
+            raise
+        # The slot is held until the pool job itself ends, not just this await:
+        # a job that outlives its timeout still occupies a worker
+        job.add_done_callback(lambda _: self._release(loop, semaphore))
+        return await asyncio.wait_for(asyncio.wrap_future(job), timeout)
+
+    @staticmethod
+    def _release(loop: asyncio.AbstractEventLoop, semaphore: asyncio.Semaphore):
+        """Release a slot from whichever thread finished the job."""
+        try:
+            loop.call_soon_threadsafe(semaphore.release)
+        except RuntimeError:
+            pass   # the loop has closed, and its semaphore with it
+
+    async def estimate_batch(self, requests, timeout: Optional[float] = None):
+        """
+        Analyze many requests concurrently, yielding AsyncBatchResult items
+        as they complete (not in input order). Each request is a file path
+        or a dict of estimate_carbon_footprint keyword arguments; timeout
+        applies per request. Requests are pulled from the iterable lazily,
+        so at most max_in_flight of them are pending at any time.
+        """
+        pending = set()
+        iterator = iter(enumerate(requests))
+        exhausted = False
+
+        async def run(index: int, request):
+            kwargs = {"file_path": request} if isinstance(request, str) else dict(request)
+            try:
+                result = await self.estimate(timeout=timeout, **kwargs)
+                return AsyncBatchResult(index=index, request=request, result=result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                return AsyncBatchResult(index=index, request=request, error=e)
+
+        try:
+            while True:
+                while not exhausted and len(pending) < self.max_in_flight:
+                    try:
+                        index, request = next(iterator)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.add(asyncio.ensure_future(run(index, request)))
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            # Consumer stopped early or was cancelled: drop outstanding work
+            for task in pending:
+                task.cancel()
+
+    def close(self, wait: bool = True):
+        """Shut down the process pool."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+
+    async def __aenter__(self) -> "AsyncEstimator":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close(wait=False)
+
+
+_default_async_estimator: Optional[AsyncEstimator] = None
+
+
+def _get_default_async_estimator() -> AsyncEstimator:
+    global _default_async_estimator
+    if _default_async_estimator is None:
+        _default_async_estimator = AsyncEstimator()
+    return _default_async_estimator
+
+
+async def estimate_carbon_footprint_async(
+    code: Optional[str] = None,
+    file_path: Optional[str] = None,
+    language: Optional[str] = None,
+    timeout: Optional[float] = None,
+    **options,
+) -> AnalysisResult:
+    """
+    Non-blocking estimate_carbon_footprint for asyncio applications.
+    Work runs in a shared process pool (see AsyncEstimator for limits);
+    call shutdown_async_estimator() when the application stops.
+    """
+    return await _get_default_async_estimator().estimate(
+        code=code, file_path=file_path, language=language, timeout=timeout, **options,
+    )
+
+
+def estimate_carbon_footprint_batch_async(requests, timeout: Optional[float] = None):
+    """Async iterator of AsyncBatchResult for many requests, using the shared pool."""
+    return _get_default_async_estimator().estimate_batch(requests, timeout=timeout)
+
+
+def shutdown_async_estimator(wait: bool = True):
+    """Shut down the shared process pool used by the async API."""
+    global _default_async_estimator
+    if _default_async_estimator is not None:
+        _default_async_estimator.close(wait=wait)
+        _default_async_estimator = None
+
+
+# =============================================================================
+# WATCH MODE
+# =============================================================================
+
+# Directories never descended into when scanning a source tree
+IGNORED_DIRECTORIES = {
+    ".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv",
+    ".tox", ".nox", ".mypy_cache", ".pytest_cache", "out", "build", "dist",
+}
+
+
+def iter_source_files(root: str):
+    """Yield paths of all analyzable source files below root, sorted per directory."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(
+            d for d in dirnames if d not in IGNORED_DIRECTORIES and not d.startswith(".")
+        )
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1].lower() in LANGUAGE_EXTENSIONS:
+                yield os.path.join(dirpath, name)
+
+
+class _InotifyWatcher:
+    """Recursive directory watcher on Linux inotify (via ctypes, no dependencies)."""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM  = 0x00000040
+    IN_MOVED_TO    = 0x00000080
+    IN_CREATE      = 0x00000100
+    IN_DELETE      = 0x00000200
+    IN_ISDIR       = 0x40000000
+    IN_NONBLOCK    = 0x00000800
+    WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, root: str):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self._fd = libc.inotify_init1(self.IN_NONBLOCK)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs: Dict[int, str] = {}
+        self._watch_tree(root)
+
+    def _watch_tree(self, root: str):
+        for dirpath, dirnames, _ in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d not in IGNORED_DIRECTORIES and not d.startswith(".")]
+            wd = self._add_watch(self._fd, os.fsencode(dirpath), self.WATCH_MASK)
+            if wd >= 0:
+                self._dirs[wd] = dirpath
+
+    def _unwatch_tree(self, root: str):
+        # A watch follows its directory's inode, so one moved out of the
+        # tree would keep reporting events under its old path
+        prefix = os.path.join(root, "")
+        for wd, path in list(self._dirs.items()):
+            if path == root or path.startswith(prefix):
+                del self._dirs[wd]
+                self._rm_watch(self._fd, wd)
+
+    def wait_for_changes(self, timeout: float) -> set:
+        """
+        Block up to timeout seconds; return the set of changed file paths,
+        plus the paths of directories deleted or moved away.
+        """
+        import select
+        import struct
+        changed = set()
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return changed
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset + 16 <= len(data):
+            wd, mask, _cookie, length = struct.unpack_from("iIII", data, offset)
+            name = data[offset + 16:offset + 16 + length].rstrip(b"\0").decode(errors="replace")
+            offset += 16 + length
+            directory = self._dirs.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                    self._unwatch_tree(path)
+                    changed.add(path)
+                elif mask & (self.IN_CREATE | self.IN_MOVED_TO) and name not in IGNORED_DIRECTORIES:
+                    self._watch_tree(path)
+                    changed.update(iter_source_files(path))
+            elif os.path.splitext(name)[1].lower() in LANGUAGE_EXTENSIONS:
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+class _PollingWatcher:
+    """Portable fallback watcher comparing file mtimes between scans."""
+
+    def __init__(self, root: str, interval: float = 1.0):
+        self.root = root
+        self.interval = interval
+        self._mtimes = self._scan()
+
+    def _scan(self) -> Dict[str, int]:
+        mtimes = {}
+        for path in iter_source_files(self.root):
+            try:
+                mtimes[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                pass
+        return mtimes
+
+    def wait_for_changes(self, timeout: float) -> set:
+        import time
+        time.sleep(min(timeout, self.interval))
+        current = self._scan()
+        changed = {p for p, m in current.items() if self._mtimes.get(p) != m}
+        changed.update(p for p in self._mtimes if p not in current)
+        self._mtimes = current
+        return changed
+
+    def close(self):
+        pass
+
+
+class WatchSession:
+    """
+    In-memory state for watch mode: the latest result per file, running
+    totals, and a serialized JSON fragment per file so that a change only
+    re-analyzes and re-serializes the files that changed.
+    """
+
+    def __init__(self, root: str, output_path: str = OUTPUT_JSON_PATH, **analysis_options):
+        self.root = root
+        self.output_path = output_path
+        # Resolve loop bounds through constants defined anywhere in the tree
+        analysis_options.setdefault("project_root", root)
+        self.analysis_options = analysis_options
+        self.results: Dict[str, AnalysisResult] = {}
+        self.errors: Dict[str, str] = {}
+        self.total_weighted_ops = 0
+        self._fragments: Dict[str, str] = {}
+        self._weighted: Dict[str, int] = {}
+
+    def update(self, paths) -> List[str]:
+        """
+        Re-analyze the given files (dropping deleted ones, and every file
+        below a deleted directory); return those that changed.
+        """
+        updated = []
+        paths = sorted(self._expand_removed(paths))
+        project_root = self.analysis_options.get("project_root")
+        if project_root:
+            index = get_project_constant_index(project_root)
+            for path in paths:
+                index.invalidate(path)
+        for path in paths:
+            if not os.path.isfile(path):
+                if path in self.results or path in self.errors:
+                    self._drop(path)
+                    updated.append(path)
+                continue
+            try:
+                result = estimate_carbon_footprint(file_path=path, **self.analysis_options)
+            except Exception as e:
+                # Any analyzer failure stays with its file: keep the last good
+                # result (e.g. while a file is half-saved) and keep watching
+                self.errors[path] = f"{type(e).__name__}: {e}"
+                previous = self.results.get(path)
+                self._fragments[path] = json.dumps(
+                    {**(previous.to_dict() if previous is not None else {}), "error": self.errors[path]},
+                    ensure_ascii=False,
+                )
+                updated.append(path)
+                continue
+            self.errors.pop(path, None)
+            weighted = result.total_weighted_ops
+            self.total_weighted_ops += weighted - self._weighted.get(path, 0)
+            self._weighted[path] = weighted
+            self.results[path] = result
+            self._fragments[path] = json.dumps(result.to_dict(), ensure_ascii=False)
+            updated.append(path)
+        return updated
+
+    def _expand_removed(self, paths) -> set:
+        """Replace paths of removed directories by the cached files below them."""
+        expanded = set()
+        for path in paths:
+            expanded.add(path)
+            if path in self.results or path in self.errors or os.path.isfile(path):
+                continue
+            prefix = os.path.join(path, "")
+            expanded.update(p for p in self.results if p.startswith(prefix))
+            expanded.update(p for p in self.errors if p.startswith(prefix))
+        return expanded
+
+    def _drop(self, path: str):
+        self.total_weighted_ops -= self._weighted.pop(path, 0)
+        self.results.pop(path, None)
+        self._fragments.pop(path, None)
+        self.errors.pop(path, None)
+
+    def write_report(self) -> str:
+        """Assemble the aggregated report from cached per-file JSON fragments."""
+        energy_joules = self.total_weighted_ops * ENERGY_PER_OPERATION_JOULES
+        energy_kwh = energy_joules / JOULES_PER_KWH
+        header = {
+            "root": self.root,
+            "files_analyzed": len(self.results),
+            "total_weighted_operations": self.total_weighted_ops,
+            "energy_joules": energy_joules,
+            "energy_kWh": energy_kwh,
+            "carbon_grams_CO2": energy_kwh * CARBON_INTENSITY_G_PER_KWH,
+            "errors": self.errors,
+        }
+        parts = [json.dumps(header, indent=2, ensure_ascii=False)[:-2], ',\n  "files": {\n']
+        parts.append(",\n".join(
+            f"    {json.dumps(path, ensure_ascii=False)}: {self._fragments[path]}"
+            for path in sorted(self._fragments)
+        ))
+        parts.append("\n  }\n}\n")
+
+        tmp_path = f"{self.output_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("".join(parts))
+        os.replace(tmp_path, self.output_path)
+        return self.output_path
+
+
+def watch_directory(
+    root: str,
+    output_path: str = OUTPUT_JSON_PATH,
+    debounce: float = 0.3,
+    poll_interval: float = 1.0,
+    use_polling: bool = False,
+    on_update=None,
+    **analysis_options,
+):
+    """
+    Analyze every source file below root, then keep re-analyzing changed
+    files until interrupted. Bursts of saves are coalesced: a refresh runs
+    once no further change has arrived for `debounce` seconds.
+
+    Uses inotify where available and falls back to mtime polling.
+    on_update(session, changed_paths) is called after each refresh.
+    """
+    session = WatchSession(root, output_path, **analysis_options)
+    session.update(iter_source_files(root))
+    session.write_report()
+    if on_update:
+        on_update(session, sorted(session.results))
+
+    watcher = None
+    if not use_polling and sys.platform.startswith("linux"):
+        try:
+            watcher = _InotifyWatcher(root)
+        except (OSError, AttributeError):
+            watcher = None
+    if watcher is None:
+        watcher = _PollingWatcher(root, interval=poll_interval)
+
+    try:
+        while True:
+            pending = watcher.wait_for_changes(timeout=poll_interval)
+            if not pending:
+                continue
+            # Debounce: keep collecting until the tree has been quiet
+            while True:
+                more = watcher.wait_for_changes(timeout=debounce)
+                if not more:
+                    break
+                pending |= more
+            changed = session.update(pending)
+            if changed:
+                session.write_report()
+                if on_update:
+                    on_update(session, changed)
+    finally:
+        watcher.close()
+
+
+# =============================================================================
+# SAMPLING MODE
+# =============================================================================
+
+# File-size bucket upper bounds (bytes) used to stratify a repository sample
+SAMPLING_SIZE_BUCKETS = (2_048, 8_192, 32_768, 131_072)
+
+
+@dataclass
+class _Stratum:
+    """Files of one (language, size bucket) and the weighted ops sampled so far."""
+    key: Tuple[str, int]
+    files: List[str]
+    values: List[int] = field(default_factory=list)
+
+    @property
+    def population(self) -> int:
+        return len(self.files)
+
+    @property
+    def sampled(self) -> int:
+        return len(self.values)
+
+    def estimate(self) -> Tuple[float, float]:
+        """(estimated stratum total, variance of that estimate)."""
+        n, N = self.sampled, self.population
+        if n == 0:
+            return 0.0, 0.0
+        mean = sum(self.values) / n
+        if n == N:
+            return float(sum(self.values)), 0.0
+        if n == 1:
+            variance = mean ** 2   # no spread observed yet: assume CV = 1
+        else:
+            variance = sum((v - mean) ** 2 for v in self.values) / (n - 1)
+        return N * mean, N * N * (1 - n / N) * variance / n
+
+
+@dataclass
+class SamplingEstimate:
+    """Repository-level totals extrapolated from a stratified sample."""
+    files_total: int
+    files_analyzed: int
+    total_weighted_ops: float
+    ci_low: float
+    ci_high: float
+    confidence: float
+    errors: int = 0
+    by_language: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def is_exact(self) -> bool:
+        return self.files_analyzed == self.files_total
+
+    @staticmethod
+    def _carbon(weighted_ops: float) -> float:
+        return weighted_ops * ENERGY_PER_OPERATION_JOULES / JOULES_PER_KWH * CARBON_INTENSITY_G_PER_KWH
+
+    @property
+    def carbon_grams(self) -> float:
+        return self._carbon(self.total_weighted_ops)
+
+    def to_dict(self) -> dict:
+        energy_joules = self.total_weighted_ops * ENERGY_PER_OPERATION_JOULES
+        return {
+            "files_total": self.files_total,
+            "files_analyzed": self.files_analyzed,
+            "sampled_fraction": round(self.files_analyzed / self.files_total, 4) if self.files_total else 0,
+            "exact": self.is_exact,
+            "confidence": self.confidence,
+            "total_weighted_operations": round(self.total_weighted_ops),
+            "total_weighted_operations_ci": [round(self.ci_low), round(self.ci_high)],
+            "energy_joules": energy_joules,
+            "energy_kWh": energy_joules / JOULES_PER_KWH,
+            "carbon_grams_CO2": self.carbon_grams,
+            "carbon_grams_CO2_ci": [self._carbon(self.ci_low), self._carbon(self.ci_high)],
+            "weighted_operations_by_language": {k: round(v) for k, v in sorted(self.by_language.items())},
+            "errors": self.errors,
+        }
+
+
+def _size_bucket(path: str) -> int:
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return 0
+    for bucket, upper in enumerate(SAMPLING_SIZE_BUCKETS):
+        if size < upper:
+            return bucket
+    return len(SAMPLING_SIZE_BUCKETS)
+
+
+def sample_repository(
+    root: str,
+    fraction: float = 0.1,
+    confidence: float = 0.95,
+    seed: Optional[int] = None,
+    report_every: Optional[int] = None,
+    **analysis_options,
+):
+    """
+    Estimate repository totals from a stratified random sample of files.
+
+    Files are stratified by (language, size bucket) and drawn so every
+    stratum is represented early and sampling stays proportional afterwards.
+    This is a generator: it yields a progressively refined SamplingEstimate
+    every `report_every` files and a final one once `fraction` of the files
+    (1.0 = full scan, exact result) has been analyzed. Nothing is yielded
+    until every stratum has been sampled, since an unsampled stratum says
+    nothing about its total or its spread.
+
+    Each stratum total is N_h * mean_h with the usual finite-population
+    variance N_h^2 (1 - n_h/N_h) s_h^2 / n_h; the interval is normal-approximate.
+    """
+    import heapq
+    import random
+    from statistics import NormalDist
+
+    rng = random.Random(seed)
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    analysis_options.setdefault("project_root", root)
+
+    strata: Dict[Tuple[str, int], _Stratum] = {}
+    for path in iter_source_files(root):
+        key = (detect_language(file_path=path), _size_bucket(path))
+        strata.setdefault(key, _Stratum(key=key, files=[])).files.append(path)
+    for stratum in strata.values():
+        rng.shuffle(stratum.files)
+
+    files_total = sum(s.population for s in strata.values())
+    target = min(files_total, max(len(strata), math.ceil(files_total * max(0.0, min(fraction, 1.0)))))
+    report_every = report_every or max(1, target // 20)
+
+    # Next draw comes from the stratum with the lowest sampled share
+    heap = [(0.0, key) for key in sorted(strata)]
+    heapq.heapify(heap)
+    errors = 0
+
+    def snapshot(analyzed: int) -> SamplingEstimate:
+        total, variance = 0.0, 0.0
+        by_language: Dict[str, float] = {}
+        for stratum in strata.values():
+            t, v = stratum.estimate()
+            total += t
+            variance += v
+            by_language[stratum.key[0]] = by_language.get(stratum.key[0], 0.0) + t
+        margin = z * math.sqrt(variance)
+        return SamplingEstimate(
+            files_total=files_total,
+            files_analyzed=analyzed,
+            total_weighted_ops=total,
+            ci_low=max(0.0, total - margin),
+            ci_high=total + margin,
+            confidence=confidence,
+            errors=errors,
+            by_language=by_language,
+        )
+
+    for analyzed in range(1, target + 1):
+        _, key = heapq.heappop(heap)
+        stratum = strata[key]
+        path = stratum.files[stratum.sampled]
+        try:
+            value = estimate_carbon_footprint(file_path=path, **analysis_options).total_weighted_ops
+        except (SyntaxError, ValueError, OSError, RecursionError):
+            value = 0   # matches a full scan, which contributes nothing for unparsable files
+            errors += 1
+        stratum.values.append(value)
+        if stratum.sampled < stratum.population:
+            heapq.heappush(heap, (stratum.sampled / stratum.population, key))
+
+        if analyzed == target or (analyzed % report_every == 0 and analyzed >= len(strata)):
+            yield snapshot(analyzed)
+
+    if target == 0:
+        yield snapshot(0)
+
+
+# =============================================================================
+# RUNTIME CALIBRATION
+# =============================================================================
+
+# Registered with sys.monitoring while calibrating (PEP 669)
+CALIBRATION_TOOL_NAME = "carbon-footprint-calibration"
+
+
+class RuntimeProfiler:
+    """
+    Counts line executions and calls of the code in a set of Python files
+    while a workload runs:
+
+        with RuntimeProfiler(["pkg/mod.py"]) as profiler:
+            run_entry_point("-m pytest -q tests")
+        profiler.line_counts[(os.path.realpath("pkg/mod.py"), 12)]
+
+    Uses sys.monitoring (Python 3.12+), which stops delivering events for
+    code outside the target files after the first hit; older interpreters
+    fall back to sys.settrace. Only the calling thread is instrumented under
+    sys.settrace. Generator resumptions count as calls in both backends.
+    """
+
+    def __init__(self, paths):
+        self.paths = {os.path.realpath(p) for p in paths}
+        self.backend = "sys.monitoring" if hasattr(sys, "monitoring") else "sys.settrace"
+        self.line_counts: Dict[Tuple[str, int], int] = {}
+        # (file, qualified name) -> all calls / calls not nested inside another
+        # activation of the same function (i.e. external invocations)
+        self.calls: Dict[Tuple[str, str], int] = {}
+        self.outer_calls: Dict[Tuple[str, str], int] = {}
+        self._active: Dict[Tuple[str, str], int] = {}
+        self._targets: Dict[str, Optional[str]] = {}
+        self._tool_id: Optional[int] = None
+        self._previous_trace = None
+
+    def __enter__(self) -> "RuntimeProfiler":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _target(self, filename: str) -> Optional[str]:
+        """Real path of filename if it is a calibration target, else None (cached)."""
+        try:
+            return self._targets[filename]
+        except KeyError:
+            path = os.path.realpath(filename)
+            self._targets[filename] = path if path in self.paths else None
+            return self._targets[filename]
+
+    def _enter(self, key: Tuple[str, str]):
+        depth = self._active.get(key, 0)
+        self._active[key] = depth + 1
+        self.calls[key] = self.calls.get(key, 0) + 1
+        if depth == 0:
+            self.outer_calls[key] = self.outer_calls.get(key, 0) + 1
+
+    def _exit(self, key: Tuple[str, str]):
+        if self._active.get(key):
+            self._active[key] -= 1
+
+    @staticmethod
+    def _qualname(code) -> str:
+        return getattr(code, "co_qualname", code.co_name)
+
+    def start(self):
+        if self.backend == "sys.settrace":
+            self._previous_trace = sys.gettrace()
+            sys.settrace(self._trace_call)
+            return
+
+        monitoring = sys.monitoring
+        free = [i for i in (monitoring.PROFILER_ID, *range(6)) if monitoring.get_tool(i) is None]
+        if not free:
+            raise RuntimeError("No free sys.monitoring tool id for runtime calibration")
+        self._tool_id = free[0]
+        monitoring.use_tool_id(self._tool_id, CALIBRATION_TOOL_NAME)
+        events = monitoring.events
+        monitoring.register_callback(self._tool_id, events.LINE, self._on_line)
+        for event in (events.PY_START, events.PY_RESUME):
+            monitoring.register_callback(self._tool_id, event, self._on_enter)
+        for event in (events.PY_RETURN, events.PY_YIELD):
+            monitoring.register_callback(self._tool_id, event, self._on_exit)
+        monitoring.register_callback(self._tool_id, events.PY_UNWIND, self._on_unwind)
+        monitoring.restart_events()
+        monitoring.set_events(self._tool_id, events.LINE | events.PY_START | events.PY_RESUME
+                              | events.PY_RETURN | events.PY_YIELD | events.PY_UNWIND)
+
+    def stop(self):
+        if self.backend == "sys.settrace":
+            sys.settrace(self._previous_trace)
+            return
+        if self._tool_id is None:
+            return
+        monitoring = sys.monitoring
+        monitoring.set_events(self._tool_id, 0)
+        events = monitoring.events
+        for event in (events.LINE, events.PY_START, events.PY_RESUME,
+                      events.PY_RETURN, events.PY_YIELD, events.PY_UNWIND):
+            monitoring.register_callback(self._tool_id, event, None)
+        monitoring.free_tool_id(self._tool_id)
+        self._tool_id = None
+
+    # ----- sys.monitoring callbacks ----------------------------------------
+
+    def _on_line(self, code, line_number):
+        path = self._target(code.co_filename)
+        if path is None:
+            return sys.monitoring.DISABLE
+        key = (path, line_number)
+        self.line_counts[key] = self.line_counts.get(key, 0) + 1
+
+    def _on_enter(self, code, instruction_offset):
+        path = self._target(code.co_filename)
+        if path is None:
+            return sys.monitoring.DISABLE
+        self._enter((path, self._qualname(code)))
+
+    def _on_exit(self, code, instruction_offset, value):
+        path = self._target(code.co_filename)
+        if path is None:
+            return sys.monitoring.DISABLE
+        self._exit((path, self._qualname(code)))
+
+    def _on_unwind(self, code, instruction_offset, exception):
+        # PY_UNWIND cannot be disabled per location
+        path = self._target(code.co_filename)
+        if path is not None:
+            self._exit((path, self._qualname(code)))
+
+    # ----- sys.settrace fallback -------------------------------------------
+
+    def _trace_call(self, frame, event, arg):
+        if event != "call" or self._target(frame.f_code.co_filename) is None:
+            return None
+        self._enter((self._target(frame.f_code.co_filename), self._qualname(frame.f_code)))
+        return self._trace_local
+
+    def _trace_local(self, frame, event, arg):
+        path = self._target(frame.f_code.co_filename)
+        if event == "line":
+            key = (path, frame.f_lineno)
+            self.line_counts[key] = self.line_counts.get(key, 0) + 1
+        elif event == "return":
+            self._exit((path, self._qualname(frame.f_code)))
+        return self._trace_local
+
+
+def run_entry_point(entry: str) -> int:
+    """
+    Run a calibration workload in this process and return its exit status:
+
+        "package.module:function"   call function() with no arguments
+        "-m module [args...]"       like `python -m module args` (e.g. "-m pytest -q tests")
+        "script.py [args...]"       like `python script.py args`
+    """
+    import importlib
+    import runpy
+    import shlex
+
+    argv = shlex.split(entry)
+    if not argv or argv == ["-m"]:
+        raise ValueError(f"Invalid calibration entry point: {entry!r}")
+
+    saved_argv, saved_path = sys.argv[:], sys.path[:]
+    try:
+        if argv[0] == "-m":
+            sys.argv = argv[1:]
+            sys.path.insert(0, os.getcwd())
+            runpy.run_module(argv[1], run_name="__main__", alter_sys=True)
+        elif len(argv) == 1 and ":" in argv[0] and not argv[0].endswith(".py"):
+            module_name, _, attr = argv[0].partition(":")
+            sys.path.insert(0, os.getcwd())
+            target = importlib.import_module(module_name)
+            for part in attr.split("."):
+                target = getattr(target, part)
+            target()
+        else:
+            sys.argv = argv
+            sys.path.insert(0, os.path.dirname(os.path.abspath(argv[0])))
+            runpy.run_path(argv[0], run_name="__main__")
+    except SystemExit as exc:
+        if exc.code is None or isinstance(exc.code, int):
+            return exc.code or 0
+        return 1
+    finally:
+        sys.argv = saved_argv
+        sys.path[:] = saved_path
+    return 0
+
+
+@dataclass
+class LoopCalibration:
+    """Static vs. measured iterations of one loop."""
+    line: int
+    static_iterations: int
+    defaulted: bool              # static bound is the DEFAULT_LOOP_ITERATIONS heuristic
+    entries: int
+    measured_iterations: float   # mean iterations per entry
+
+    def to_dict(self) -> dict:
+        return {
+            "line": self.line,
+            "static_iterations": self.static_iterations,
+            "defaulted": self.defaulted,
+            "entries": self.entries,
+            "measured_iterations": round(self.measured_iterations, 2),
+        }
+
+
+@dataclass
+class FunctionCalibration:
+    """
+    Static estimate vs. measured execution of one function. measured_weighted_ops
+    prices each executed line at its static per-execution cost, per external call.
+    """
+    file_path: str
+    name: str
+    line_number: int
+    static_weighted_ops: int
+    calls: int
+    outer_calls: int
+    line_executions: int
+    measured_weighted_ops: float
+    loops: List[LoopCalibration] = field(default_factory=list)
+    # Depth bound implied by the measured activations of a recursive function
+    recursion_depth: Optional[float] = None
+
+    @property
+    def ratio(self) -> Optional[float]:
+        """static / measured: above 1 the static estimate is too high."""
+        if self.measured_weighted_ops <= 0:
+            return None
+        return self.static_weighted_ops / self.measured_weighted_ops
+
+    def to_dict(self) -> dict:
+        return {
+            "file_path": self.file_path,
+            "name": self.name,
+            "line": self.line_number,
+            "static_weighted_ops": self.static_weighted_ops,
+            "measured_weighted_ops": round(self.measured_weighted_ops, 2),
+            "static_to_measured": round(self.ratio, 4) if self.ratio is not None else None,
+            "calls": self.calls,
+            "outer_calls": self.outer_calls,
+            "line_executions": self.line_executions,
+            **({"recursion_depth": round(self.recursion_depth, 2)}
+               if self.recursion_depth is not None else {}),
+            "loops": [loop.to_dict() for loop in self.loops],
+        }
+
+
+@dataclass
+class CalibrationReport:
+    """Runtime calibration of the static model over one workload."""
+    entry_point: str
+    backend: str
+    exit_status: int
+    functions: List[FunctionCalibration] = field(default_factory=list)
+    unexecuted: List[str] = field(default_factory=list)
+    fitted_loop_iterations: Optional[int] = None
+    fitted_recursion_depth: Optional[int] = None
+    errors: Dict[str, str] = field(default_factory=dict)
+
+    def energy_profile(self, name: str = "calibrated") -> EnergyProfile:
+        """Default energy model with the fitted heuristics (unfitted ones keep their defaults)."""
+        return EnergyProfile(
+            name=name,
+            default_loop_iterations=self.fitted_loop_iterations or DEFAULT_LOOP_ITERATIONS,
+            default_recursion_depth=self.fitted_recursion_depth or DEFAULT_RECURSION_DEPTH,
+        )
+
+    def to_dict(self) -> dict:
+        profile = self.energy_profile()
+        return {
+            "entry_point": self.entry_point,
+            "backend": self.backend,
+            "exit_status": self.exit_status,
+            "fitted_defaults": {
+                "default_loop_iterations": self.fitted_loop_iterations,
+                "default_recursion_depth": self.fitted_recursion_depth,
+            },
+            # Loadable with --energy-profiles
+            "profiles": {profile.name: {
+                "default_loop_iterations": profile.default_loop_iterations,
+                "default_recursion_depth": profile.default_recursion_depth,
+            }},
+            "functions": [f.to_dict() for f in self.functions],
+            "unexecuted_functions": self.unexecuted,
+            "errors": self.errors,
+        }
+
+
+def _calibrate_file(path: str, profiler: RuntimeProfiler, report: CalibrationReport,
+                    constant_index: Optional[ProjectConstantIndex]) -> Tuple[List[float], List[float]]:
+    """Compare one file's static analysis with the profile; returns (loop, depth) samples."""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        code = f.read()
+    analyzer = PythonAnalyzer(track_lines=True, constant_index=constant_index)
+    result = analyzer.analyze(code, file_path=path)
+    tree = analyzer.parse_cache.parse(code)
+
+    nodes = {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            nodes[node.name] = node
+        elif isinstance(node, ast.ClassDef):
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    nodes[f"{node.name}.{item.name}"] = item
+
+    real_path = os.path.realpath(path)
+
+    def count(line: int) -> int:
+        return profiler.line_counts.get((real_path, line), 0)
+
+    def iterations(loop) -> int:
+        """Measured iterations: executions of the first body statement, or the
+        entries of a loop nested there (whose header also runs per iteration)."""
+        first = loop.body[0]
+        if isinstance(first, (ast.For, ast.AsyncFor, ast.While)):
+            return count(first.lineno) - iterations(first)
+        return count(first.lineno)
+
+    loop_samples: List[float] = []
+    depth_samples: List[float] = []
+
+    for func in result.functions:
+        node = nodes.get(func.name)
+        key = (real_path, func.name)
+        outer = profiler.outer_calls.get(key, 0)
+        if node is None or outer == 0:
+            report.unexecuted.append(f"{path}:{func.name}")
+            continue
+
+        lines = range(node.lineno, (node.end_lineno or node.lineno) + 1)
+        scale = func.recursion.activations if func.recursion else 1
+        measured = 0.0
+        for line in lines:
+            cost = (result.line_costs or {}).get(line, 0)
+            if cost:
+                # A loop header's own cost is its per-iteration condition check
+                per_run = analyzer._loop_bounds.get(line, (1, False))[0] or 1
+                unit = cost / (analyzer._line_multipliers.get(line, 1) * per_run * scale)
+                measured += count(line) * unit
+
+        calibration = FunctionCalibration(
+            file_path=path,
+            name=func.name,
+            line_number=func.line_number,
+            static_weighted_ops=func.weighted_ops,
+            calls=profiler.calls.get(key, 0),
+            outer_calls=outer,
+            line_executions=sum(count(line) for line in lines),
+            measured_weighted_ops=measured / outer,
+        )
+
+        # A loop header runs once per entry plus once per iteration
+        for loop in ast.walk(node):
+            if not isinstance(loop, (ast.For, ast.AsyncFor, ast.While)) or loop.lineno not in analyzer._loop_bounds:
+                continue
+            if loop.body[0].lineno == loop.lineno:
+                continue   # single-line loop: header and body are indistinguishable
+            runs = iterations(loop)
+            entries = count(loop.lineno) - runs
+            if entries <= 0:
+                continue
+            static_iterations, defaulted = analyzer._loop_bounds[loop.lineno]
+            calibration.loops.append(LoopCalibration(
+                line=loop.lineno, static_iterations=static_iterations, defaulted=defaulted,
+                entries=entries, measured_iterations=runs / entries,
+            ))
+            if defaulted:
+                loop_samples.append(runs / entries)
+
+        if func.recursion is not None:
+            calibration.recursion_depth = infer_recursion_depth(func.recursion, calibration.calls / outer)
+            depth_samples.append(calibration.recursion_depth)
+
+        report.functions.append(calibration)
+
+    return loop_samples, depth_samples
+
+
+def calibrate(entry_point: str, targets: List[str], project_root: Optional[str] = None) -> CalibrationReport:
+    """
+    Run entry_point (see run_entry_point) under RuntimeProfiler instrumentation
+    of the Python files in targets (files or directories), compare measured
+    line executions, calls and loop iterations with PythonAnalyzer's static
+    estimates, and fit project defaults for the two analysis heuristics:
+
+    - default_loop_iterations: median measured iterations per entry of the
+      loops whose static bound was the default heuristic
+    - default_recursion_depth: median depth bound implied by the measured
+      activations of recursive functions (inverse of estimate_recursion)
+    """
+    import statistics
+
+    files = []
+    for target in targets:
+        paths = iter_source_files(target) if os.path.isdir(target) else [target]
+        files.extend(p for p in paths if detect_language(file_path=p) == "python")
+    if not files:
+        raise ValueError("Runtime calibration needs at least one Python source file")
+
+    profiler = RuntimeProfiler(files)
+    report = CalibrationReport(entry_point=entry_point, backend=profiler.backend, exit_status=0)
+    with profiler:
+        try:
+            report.exit_status = run_entry_point(entry_point)
+        except Exception as exc:   # keep the partial profile of a failing workload
+            report.exit_status = 1
+            report.errors[entry_point] = f"{type(exc).__name__}: {exc}"
+
+    constant_index = get_project_constant_index(project_root) if project_root else None
+    loop_samples: List[float] = []
+    depth_samples: List[float] = []
+    for path in files:
+        try:
+            loops, depths = _calibrate_file(path, profiler, report, constant_index)
+        except (SyntaxError, ValueError, OSError, RecursionError) as exc:
+            report.errors[path] = f"{type(exc).__name__}: {exc}"
+            continue
+        loop_samples.extend(loops)
+        depth_samples.extend(depths)
+
+    if loop_samples:
+        report.fitted_loop_iterations = max(1, round(statistics.median(loop_samples)))
+    if depth_samples:
+        report.fitted_recursion_depth = max(1, round(statistics.median(depth_samples)))
+    return report
+
+
+# =============================================================================
+# PARALLEL SCAN (SHARED-MEMORY AGGREGATION)
+# =============================================================================
+
+# Each row of the shared aggregation buffer is SCAN_ROW_WIDTH int64 values:
+# the function's line number followed by one count per OpType (SCAN_OP_TYPES order)
+SCAN_OP_TYPES = tuple(OpType)
+SCAN_ROW_WIDTH = 1 + len(SCAN_OP_TYPES)
+# Counts above this are clamped to fit an int64 cell
+SCAN_COUNT_MAX = MAX_OPERATION_COUNT
+
+# Marker of scan reports that `merge` accepts (written by --scan --jobs / --shard)
+SCAN_REPORT_FORMAT = "carbon-scan/1"
+
+# Worker-side state, set once per process by _init_scan_worker
+_scan_shm = None
+_scan_rows = None
+_scan_next_row = None
+_scan_capacity = 0
+_scan_options: dict = {}
+
+
+def shard_of(relative_path: str, count: int) -> int:
+    """
+    Deterministic 0-based shard of a file among count shards, from a hash of
+    its root-relative path, so every machine splits a checkout the same way.
+    """
+    import hashlib
+    key = relative_path.replace(os.sep, "/").encode("utf-8", "surrogatepass")
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big") % count
+
+
+def parse_shard(text: str) -> Tuple[int, int]:
+    """Parse a 1-based 'i/N' shard spec into (0-based index, count)."""
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d+)\s*', text)
+    if not match:
+        raise ValueError(f"invalid shard {text!r} (expected i/N, e.g. 2/8)")
+    index, count = int(match.group(1)), int(match.group(2))
+    if not 1 <= index <= count:
+        raise ValueError(f"invalid shard {text!r}: i must be between 1 and N")
+    return index - 1, count
+
+
+def iter_shard_files(root: str, shard: Optional[Tuple[int, int]] = None):
+    """iter_source_files restricted to one (index, count) shard."""
+    for path in iter_source_files(root):
+        if shard is None or shard_of(os.path.relpath(path, root), shard[1]) == shard[0]:
+            yield path
+
+
+def assumption_kind(text: str) -> str:
+    """Assumption text with numbers and quoted names masked, so counts add up across files."""
+    return re.sub(r"(?<![\w.^])\d+(?:\.\d+)?(?:e[-+]?\d+)?(?!\^)", "N", re.sub(r"'[^']*'", "'*'", text))
+
+
+def _count_assumptions(assumptions: List[str], counts: Dict[str, int]):
+    for text in assumptions:
+        kind = assumption_kind(text)
+        counts[kind] = counts.get(kind, 0) + 1
+
+
+def _init_scan_worker(shm_name: str, capacity: int, next_row, options: dict):
+    """Process-pool initializer: attach to the parent's shared row buffer."""
+    from multiprocessing import shared_memory
+    global _scan_shm, _scan_rows, _scan_next_row, _scan_capacity, _scan_options
+    _scan_shm = shared_memory.SharedMemory(name=shm_name)
+    _scan_rows = _scan_shm.buf.cast("q")
+    _scan_next_row = next_row
+    _scan_capacity = capacity
+    _scan_options = options
+
+
+def _scan_worker(path: str) -> tuple:
+    """
+    Analyze one file and write its op-count rows into shared memory.
+
+    Returns only metadata: (path, language, first_row, names, spilled,
+    assumption_counts, error).
+    Row 0 of a file holds its global (module-level) operations and has an
+    empty name. If the shared buffer is full the rows come back packed in
+    `spilled` instead, which is still a flat bytes object rather than a
+    pickled object graph.
+    """
+    from array import array
+    try:
+        result = estimate_carbon_footprint(file_path=path, **_scan_options)
+    except (SyntaxError, ValueError, OSError, RecursionError) as e:
+        return path, None, -1, [], b"", {}, f"{type(e).__name__}: {e}"
+
+    names = [""]
+    values = array("q", [0])
+    values.extend(min(result.global_operations.counts.get(op, 0), SCAN_COUNT_MAX) for op in SCAN_OP_TYPES)
+    for func in result.functions:
+        names.append(func.name)
+        values.append(func.line_number)
+        values.extend(min(func.operations.counts.get(op, 0), SCAN_COUNT_MAX) for op in SCAN_OP_TYPES)
+
+    assumptions: Dict[str, int] = {}
+    _count_assumptions(result.assumptions, assumptions)
+
+    with _scan_next_row.get_lock():
+        start = _scan_next_row.value
+        if start + len(names) <= _scan_capacity:
+            _scan_next_row.value = start + len(names)
+    if start + len(names) > _scan_capacity:
+        return path, result.language, -1, names, values.tobytes(), assumptions, None
+    _scan_rows[start * SCAN_ROW_WIDTH:(start + len(names)) * SCAN_ROW_WIDTH] = values
+    return path, result.language, start, names, b"", assumptions, None
+
+
+@dataclass
+class ScanHotspot:
+    """One function row of a parallel scan."""
+    file: str
+    name: str
+    line_number: int
+    weighted_ops: int
+
+
+@dataclass
+class ScanAggregate:
+    """
+    Totals and hotspots of a parallel or sharded scan.
+
+    Its JSON form (to_dict) is also the partial report of one shard:
+    from_dict() reads it back and merge() combines disjoint shards, so
+    partial reports merge in any order and grouping. Each report keeps its
+    top-k hotspots, which is enough for an exact global top-k.
+    """
+    root: str
+    operations: OperationCount = field(default_factory=OperationCount)
+    file_weighted_ops: Dict[str, int] = field(default_factory=dict)
+    languages: Dict[str, str] = field(default_factory=dict)
+    functions: List[ScanHotspot] = field(default_factory=list)
+    errors: Dict[str, str] = field(default_factory=dict)
+    # Assumption kind (see assumption_kind) -> number of occurrences
+    assumption_counts: Dict[str, int] = field(default_factory=dict)
+    # 0-based shards this aggregate covers, out of shard_count
+    shards: List[int] = field(default_factory=lambda: [0])
+    shard_count: int = 1
+
+    @property
+    def total_weighted_ops(self) -> int:
+        return self.operations.total_weighted
+
+    @property
+    def carbon_grams(self) -> float:
+        return self.total_weighted_ops * ENERGY_PER_OPERATION_JOULES / JOULES_PER_KWH * CARBON_INTENSITY_G_PER_KWH
+
+    def hotspots(self, limit: int = 10) -> List[ScanHotspot]:
+        # Ties broken by location so merged reports list the same functions
+        return sorted(self.functions, key=lambda f: (-f.weighted_ops, f.file, f.line_number, f.name))[:limit]
+
+    def add_result(self, file: str, result: AnalysisResult):
+        """Fold one file's full analysis into the aggregate (serial scans)."""
+        self.operations.merge(result.total_operations)
+        self.file_weighted_ops[file] = result.total_weighted_ops
+        self.languages[file] = result.language
+        self.functions.extend(
+            ScanHotspot(file, func.name, func.line_number, func.weighted_ops) for func in result.functions
+        )
+        _count_assumptions(result.assumptions, self.assumption_counts)
+
+    def merge(self, other: "ScanAggregate"):
+        """Add another shard's aggregate to this one; shards must not overlap."""
+        if other.shard_count != self.shard_count:
+            raise ValueError(f"cannot merge a {other.shard_count}-shard report into a {self.shard_count}-shard one")
+        overlap = set(self.shards) & set(other.shards)
+        if overlap:
+            raise ValueError(f"shard(s) {', '.join(str(i + 1) for i in sorted(overlap))} reported twice")
+        duplicates = (set(self.file_weighted_ops) | set(self.errors)) & (set(other.file_weighted_ops) | set(other.errors))
+        if duplicates:
+            raise ValueError(f"{len(duplicates)} file(s) appear in both reports, e.g. {min(duplicates)}")
+        self.operations.merge(other.operations)
+        self.file_weighted_ops.update(other.file_weighted_ops)
+        self.languages.update(other.languages)
+        self.functions.extend(other.functions)
+        self.errors.update(other.errors)
+        for kind, count in other.assumption_counts.items():
+            self.assumption_counts[kind] = self.assumption_counts.get(kind, 0) + count
+        self.shards = sorted(set(self.shards) | set(other.shards))
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ScanAggregate":
+        """Rebuild an aggregate from its to_dict() form (a partial or merged report)."""
+        if data.get("format") != SCAN_REPORT_FORMAT:
+            raise ValueError(f"not a scan report (expected format {SCAN_REPORT_FORMAT!r})")
+        aggregate = cls(root=data["root"])
+        for name, count in data["total_operations"].items():
+            aggregate.operations.add(OpType(name), count)
+        aggregate.operations.saturated = bool(data.get("unbounded"))
+        for file, info in data["files"].items():
+            aggregate.file_weighted_ops[file] = info["weighted_ops"]
+            aggregate.languages[file] = info["language"]
+        aggregate.functions = [
+            ScanHotspot(f["file"], f["name"], f["line"], f["weighted_ops"]) for f in data["hotspot_functions"]
+        ]
+        aggregate.errors = dict(data["errors"])
+        aggregate.assumption_counts = dict(data.get("assumption_counts", {}))
+        shard = data.get("shard", {})
+        aggregate.shards = [i - 1 for i in shard.get("indices", [1])]
+        aggregate.shard_count = shard.get("count", 1)
+        return aggregate
+
+    def cost_rows(self) -> Dict[str, List[Tuple[str, int]]]:
+        """Per-file (name, weighted ops) rows, module total first, for BaselineStore."""
+        rows: Dict[str, List[Tuple[str, int]]] = {
+            file: [(MODULE_ROW_NAME, ops)] for file, ops in self.file_weighted_ops.items()
+        }
+        for func in self.functions:
+            rows[func.file].append((func.name, func.weighted_ops))
+        return rows
+
+    def to_dict(self, top_k: int = 10) -> dict:
+        energy_joules = self.total_weighted_ops * ENERGY_PER_OPERATION_JOULES
+        return {
+            "format": SCAN_REPORT_FORMAT,
+            "root": self.root,
+            "shard": {"indices": [i + 1 for i in self.shards], "count": self.shard_count},
+            "files_analyzed": len(self.file_weighted_ops),
+            "total_operations": self.operations.summary_dict(),
+            "total_weighted_operations": self.total_weighted_ops,
+            **({"unbounded": True} if self.operations.unbounded else {}),
+            "energy_joules": energy_joules,
+            "energy_kWh": energy_joules / JOULES_PER_KWH,
+            "carbon_grams_CO2": self.carbon_grams,
+            "files": {
+                file: {"language": self.languages[file], "weighted_ops": ops}
+                for file, ops in sorted(self.file_weighted_ops.items())
+            },
+            "hotspot_functions": [
+                {
+                    "file": f.file,
+                    "name": f.name,
+                    "line": f.line_number,
+                    "weighted_ops": f.weighted_ops,
+                    "percentage": round(
+                        (f.weighted_ops / self.total_weighted_ops * 100)
+                        if self.total_weighted_ops > 0 else 0, 2
+                    ),
+                }
+                for f in self.hotspots(top_k)
+            ],
+            "assumption_counts": dict(sorted(self.assumption_counts.items(), key=lambda a: (-a[1], a[0]))),
+            "errors": self.errors,
+        }
+
+
+def merge_scan_reports(reports: List[dict]) -> ScanAggregate:
+    """Combine the to_dict() reports of disjoint scan shards into one aggregate."""
+    if not reports:
+        raise ValueError("no reports to merge")
+    merged = ScanAggregate.from_dict(reports[0])
+    for report in reports[1:]:
+        merged.merge(ScanAggregate.from_dict(report))
+    return merged
+
+
+def parallel_scan(root: str, max_workers: Optional[int] = None, shard: Optional[Tuple[int, int]] = None,
+                  **analysis_options) -> ScanAggregate:
+    """
+    Analyze every source file below root (or only those of one (index,
+    count) shard, see shard_of) in a process pool.
+
+    Workers write fixed-width op-count rows (see SCAN_ROW_WIDTH) into one
+    shared-memory buffer and return only names and row offsets, so the
+    parent builds totals and hotspots from raw int64 rows instead of
+    unpickling AnalysisResult objects. File keys are relative to root.
+    """
+    import multiprocessing
+    from array import array
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import shared_memory
+
+    files = list(iter_shard_files(root, shard))
+    max_workers = max_workers or os.cpu_count() or 1
+    analysis_options.setdefault("project_root", root)
+    total_bytes = 0
+    for path in files:
+        try:
+            total_bytes += os.path.getsize(path)
+        except OSError:
+            pass
+    # One global row per file plus roughly one function per 512 bytes of source;
+    # anything beyond that is spilled back through the result pipe
+    capacity = len(files) + total_bytes // 512 + 1
+    row_bytes = SCAN_ROW_WIDTH * 8
+
+    aggregate = ScanAggregate(root=root)
+    if shard is not None:
+        aggregate.shards, aggregate.shard_count = [shard[0]], shard[1]
+    shm = shared_memory.SharedMemory(create=True, size=capacity * row_bytes)
+    rows = shm.buf.cast("q")
+    try:
+        next_row = multiprocessing.Value("q", 0)
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_scan_worker,
+            initargs=(shm.name, capacity, next_row, analysis_options),
+        ) as pool:
+            chunksize = max(1, len(files) // (max_workers * 4))
+            for path, language, start, names, spilled, assumptions, error in pool.map(_scan_worker, files, chunksize=chunksize):
+                file = os.path.relpath(path, root)
+                if error is not None:
+                    aggregate.errors[file] = error
+                    continue
+                if spilled:
+                    block = array("q")
+                    block.frombytes(spilled)
+                else:
+                    block = rows[start * SCAN_ROW_WIDTH:(start + len(names)) * SCAN_ROW_WIDTH].tolist()
+                file_total = 0
+                for index, name in enumerate(names):
+                    offset = index * SCAN_ROW_WIDTH
+                    weighted = 0
+                    for op, count in zip(SCAN_OP_TYPES, block[offset + 1:offset + SCAN_ROW_WIDTH]):
+                        if count:
+                            aggregate.operations.add(op, count)
+                            weighted = min(weighted + count * OPERATION_WEIGHTS[op], MAX_OPERATION_COUNT)
+                    file_total = min(file_total + weighted, MAX_OPERATION_COUNT)
+                    if index:
+                        aggregate.functions.append(ScanHotspot(file, name, block[offset], weighted))
+                aggregate.file_weighted_ops[file] = file_total
+                aggregate.languages[file] = language
+                for kind, count in assumptions.items():
+                    aggregate.assumption_counts[kind] = aggregate.assumption_counts.get(kind, 0) + count
+    finally:
+        rows.release()
+        shm.close()
+        shm.unlink()
+    return aggregate
+
+
+# =============================================================================
+# BASELINE STORE & CARBON BUDGETS
+# =============================================================================
+
+# Default location of the SQLite baseline store
+BASELINE_DB_PATH = ".carbon_baseline.sqlite"
+
+# Module rows use this in place of a function name
+MODULE_ROW_NAME = "<module>"
+
+
+def result_cost_rows(result: Union[AnalysisResult, List[Tuple[str, int]]]) -> List[Tuple[str, int]]:
+    """(name, weighted ops) rows of one file, module total first; row lists pass through."""
+    if not isinstance(result, AnalysisResult):
+        return list(result)
+    return [(MODULE_ROW_NAME, result.total_weighted_ops)] + [
+        (func.name, func.weighted_ops) for func in result.functions
+    ]
+
+
+@dataclass
+class BudgetViolation:
+    """A function or module whose weighted ops grew past the allowed budget."""
+    file: str
+    name: str
+    baseline_ops: int
+    current_ops: int
+
+    @property
+    def growth_percent(self) -> float:
+        if self.baseline_ops == 0:
+            return float("inf")
+        return (self.current_ops - self.baseline_ops) / self.baseline_ops * 100
+
+    def to_dict(self) -> dict:
+        return {
+            "file": self.file,
+            "name": self.name,
+            "baseline_weighted_ops": self.baseline_ops,
+            "current_weighted_ops": self.current_ops,
+            "growth_percent": round(self.growth_percent, 2) if self.baseline_ops else None,
+        }
+
+
+class BaselineStore:
+    """
+    Per-commit scan results in SQLite, keyed by (scan, file, qualified name).
+
+    Module totals are stored as rows named MODULE_ROW_NAME, so functions and
+    modules share one table and one primary-key index; comparisons are
+    point lookups on that index instead of loading old JSON reports.
+
+    File keys are '/'-separated paths relative to the scan's root, which is
+    stored with the scan: a comparison maps its own keys onto the baseline's
+    root, so a single --file run checks against a --scan baseline.
+    """
+
+    def __init__(self, path: str = BASELINE_DB_PATH):
+        import sqlite3
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS scans (
+                id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                commit_id   TEXT NOT NULL,
+                created_at  TEXT NOT NULL DEFAULT (datetime('now')),
+                root        TEXT
+            );
+            CREATE INDEX IF NOT EXISTS scans_commit ON scans (commit_id);
+            CREATE TABLE IF NOT EXISTS costs (
+                scan_id      INTEGER NOT NULL REFERENCES scans (id) ON DELETE CASCADE,
+                file         TEXT NOT NULL,
+                name         TEXT NOT NULL,
+                weighted_ops INTEGER NOT NULL,
+                PRIMARY KEY (scan_id, file, name)
+            ) WITHOUT ROWID;
+        """)
+        # Stores created before scan roots were recorded
+        if "root" not in {row[1] for row in self._conn.execute("PRAGMA table_info(scans)")}:
+            self._conn.execute("ALTER TABLE scans ADD COLUMN root TEXT")
+
+    @staticmethod
+    def _file_key(file: str, root: Optional[str], base_root: Optional[str]) -> str:
+        """A result key relative to root, as a '/'-separated path relative to base_root."""
+        if root and base_root:
+            file = os.path.relpath(os.path.join(os.path.abspath(root), file), base_root)
+        return file.replace(os.sep, "/")
+
+    def record_scan(self, commit_id: str, results: Dict[str, AnalysisResult],
+                    root: Optional[str] = None) -> int:
+        """
+        Store one scan (file key relative to root -> result); returns its scan
+        id. A result may also be a list of (name, weighted ops) rows, as from
+        ScanAggregate.cost_rows().
+        """
+        root = os.path.abspath(root) if root else None
+        with self._conn:
+            scan_id = self._conn.execute(
+                "INSERT INTO scans (commit_id, root) VALUES (?, ?)", (commit_id, root)
+            ).lastrowid
+            self._conn.executemany(
+                "INSERT INTO costs (scan_id, file, name, weighted_ops) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (scan_id, file, name) DO UPDATE "
+                "SET weighted_ops = weighted_ops + excluded.weighted_ops",
+                (
+                    (scan_id, self._file_key(file, None, None), name, ops)
+                    for file, result in results.items()
+                    for name, ops in result_cost_rows(result)
+                ),
+            )
+        return scan_id
+
+    def find_scan(self, commit_id: Optional[str] = None) -> Optional[int]:
+        """Latest scan id for commit_id (or overall when None)."""
+        if commit_id is None:
+            row = self._conn.execute("SELECT MAX(id) FROM scans").fetchone()
+        else:
+            row = self._conn.execute(
+                "SELECT MAX(id) FROM scans WHERE commit_id = ?", (commit_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def compare(
+        self,
+        results: Dict[str, AnalysisResult],
+        threshold_percent: float = 10.0,
+        commit_id: Optional[str] = None,
+        root: Optional[str] = None,
+    ) -> List[BudgetViolation]:
+        """
+        Compare current results (file keys relative to root) against a
+        recorded scan. A function or module violates the budget when its
+        weighted ops grew by more than threshold_percent. Entries absent
+        from the baseline are skipped; LookupError when none is present.
+        """
+        scan_id = self.find_scan(commit_id)
+        if scan_id is None:
+            raise LookupError(
+                f"No baseline recorded{f' for commit {commit_id}' if commit_id else ''} in {self.path}"
+            )
+        base_root = self._conn.execute("SELECT root FROM scans WHERE id = ?", (scan_id,)).fetchone()[0]
+
+        violations = []
+        compared = 0
+        cursor = self._conn.cursor()
+        for file, result in results.items():
+            key = self._file_key(file, root, base_root)
+            current: Dict[str, int] = {}
+            for name, ops in result_cost_rows(result):
+                current[name] = current.get(name, 0) + ops
+            for name, ops in current.items():
+                row = cursor.execute(
+                    "SELECT weighted_ops FROM costs WHERE scan_id = ? AND file = ? AND name = ?",
+                    (scan_id, key, name),
+                ).fetchone()
+                if row is None:
+                    continue
+                compared += 1
+                baseline = row[0]
+                if ops > baseline * (1 + threshold_percent / 100):
+                    violations.append(BudgetViolation(key, name, baseline, ops))
+        if not compared:
+            raise LookupError(
+                f"None of the {len(results)} analyzed file(s) is in baseline scan {scan_id}"
+                + (f" (recorded for {base_root})" if base_root else "")
+            )
+        violations.sort(key=lambda v: v.current_ops - v.baseline_ops, reverse=True)
+        return violations
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self) -> "BaselineStore":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def current_commit_id(path: str = ".") -> str:
+    """HEAD commit of the git repository containing path, or 'working-tree'."""
+    import subprocess
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=path if os.path.isdir(path) else os.path.dirname(path) or ".",
+            capture_output=True, text=True, timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return "working-tree"
+    return out.stdout.strip() if out.returncode == 0 and out.stdout.strip() else "working-tree"
+
+
+# =============================================================================
+# COST ROLL-UP (REPOSITORY / PACKAGE / MODULE / CLASS / FUNCTION)
+# =============================================================================
+
+# Marker of the JSON written by --rollup
+ROLLUP_REPORT_FORMAT = "carbon-rollup/1"
+
+ROLLUP_KINDS = ("repository", "package", "module", "class", "function")
+
+
+@dataclass(eq=False)
+class RollupNode:
+    """
+    One node of a CostRollup, keyed by path: 'src/app' (package),
+    'src/app/billing.py' (module), 'src/app/billing.py::Invoice' (class),
+    'src/app/billing.py::Invoice.total' (function).
+
+    self_weighted_ops is the cost of the node itself (a module's top-level
+    code, a function); weighted_ops, functions and share cover the whole
+    subtree and are filled in once by CostRollup.build.
+    """
+    key: str
+    name: str
+    kind: str
+    parent: Optional["RollupNode"] = field(default=None, repr=False)
+    children: Dict[str, "RollupNode"] = field(default_factory=dict, repr=False)
+    self_weighted_ops: int = 0
+    weighted_ops: int = 0
+    functions: int = 0
+    share: float = 0.0           # fraction of the repository total
+
+    def ranked_children(self) -> List["RollupNode"]:
+        return sorted(self.children.values(), key=lambda n: (-n.weighted_ops, n.key))
+
+    def to_dict(self, max_depth: Optional[int] = None) -> dict:
+        data = {
+            "key": self.key,
+            "name": self.name,
+            "kind": self.kind,
+            "weighted_ops": self.weighted_ops,
+            "self_weighted_ops": self.self_weighted_ops,
+            "share": round(self.share, 6),
+            "functions": self.functions,
+        }
+        if self.children and (max_depth is None or max_depth > 0):
+            depth = None if max_depth is None else max_depth - 1
+            data["children"] = [child.to_dict(depth) for child in self.ranked_children()]
+        return data
+
+
+class CostRollup:
+    """
+    Weighted ops of a scan rolled up repository -> package (directory,
+    nested) -> module (file) -> class -> function.
+
+    build() creates the tree from per-file cost rows and computes every
+    subtotal, function count and share in one bottom-up pass; each kind is
+    then kept ranked, so top-k and share queries read stored values instead
+    of re-summing function records.
+    """
+
+    def __init__(self, root: str = "."):
+        self.root = RollupNode(key="", name=root, kind="repository")
+        self.nodes: Dict[str, RollupNode] = {"": self.root}
+        # Creation order puts every parent before its children
+        self._order: List[RollupNode] = [self.root]
+        self._ranked: Dict[str, List[RollupNode]] = {kind: [] for kind in ROLLUP_KINDS}
+
+    @classmethod
+    def build(cls, results: Dict[str, Union[AnalysisResult, List[Tuple[str, int]]]],
+              root: str = ".") -> "CostRollup":
+        """
+        Roll up file key -> result (or (name, weighted ops) rows with the
+        module total first, as from ScanAggregate.cost_rows()). Functions
+        named 'Class.method' go below their class; a module's cost beyond
+        its functions is its own top-level code.
+        """
+        rollup = cls(root)
+        for file, result in results.items():
+            rollup._add_file(file, result_cost_rows(result))
+
+        # Children come after their parents, so one reverse sweep sees every
+        # node complete before adding it into its parent
+        for node in reversed(rollup._order):
+            node.weighted_ops += node.self_weighted_ops
+            if node.parent is not None:
+                node.parent.weighted_ops += node.weighted_ops
+                node.parent.functions += node.functions
+        total = rollup.root.weighted_ops
+        for node in rollup._order:
+            node.share = node.weighted_ops / total if total > 0 else 0.0
+            rollup._ranked[node.kind].append(node)
+        for nodes in rollup._ranked.values():
+            nodes.sort(key=lambda n: (-n.weighted_ops, n.key))
+        return rollup
+
+    def _child(self, parent: RollupNode, key: str, name: str, kind: str) -> RollupNode:
+        node = parent.children.get(key)
+        if node is None:
+            node = parent.children[key] = self.nodes[key] = RollupNode(key, name, kind, parent)
+            self._order.append(node)
+        return node
+
+    def _add_file(self, file: str, rows):
+        parts = file.replace(os.sep, "/").split("/")
+        parent = self.root
+        for i, part in enumerate(parts[:-1]):
+            parent = self._child(parent, "/".join(parts[:i + 1]), part, "package")
+        module_key = "/".join(parts)
+        module = self._child(parent, module_key, os.path.splitext(parts[-1])[0], "module")
+
+        module_total = function_total = 0
+        for name, ops in rows:
+            if name == MODULE_ROW_NAME:
+                module_total += ops
+                continue
+            function_total += ops
+            owner, _, short = name.rpartition(".")
+            container = self._child(module, f"{module_key}::{owner}", owner, "class") if owner else module
+            func = self._child(container, f"{module_key}::{name}", short, "function")
+            func.self_weighted_ops += ops
+            func.functions += 1
+        module.self_weighted_ops += max(0, module_total - function_total)
+
+    @property
+    def total_weighted_ops(self) -> int:
+        return self.root.weighted_ops
+
+    def __getitem__(self, key: str) -> RollupNode:
+        return self.nodes[key]
+
+    def top(self, kind: str, k: int = 10) -> List[RollupNode]:
+        """The k most expensive nodes of one kind ('package', 'module', 'class', 'function')."""
+        if kind not in self._ranked:
+            raise ValueError(f"unknown roll-up level {kind!r} (expected one of {', '.join(ROLLUP_KINDS)})")
+        return self._ranked[kind][:k]
+
+    def to_dict(self, top_k: int = 10, max_depth: Optional[int] = None) -> dict:
+        energy_joules = self.total_weighted_ops * ENERGY_PER_OPERATION_JOULES
+        return {
+            "format": ROLLUP_REPORT_FORMAT,
+            "root": self.root.name,
+            "total_weighted_operations": self.total_weighted_ops,
+            "energy_joules": energy_joules,
+            "energy_kWh": energy_joules / JOULES_PER_KWH,
+            "carbon_grams_CO2": energy_joules / JOULES_PER_KWH * CARBON_INTENSITY_G_PER_KWH,
+            "counts": {kind: len(self._ranked[kind]) for kind in ROLLUP_KINDS[1:]},
+            "top": {
+                kind: [
+                    {"key": n.key, "weighted_ops": n.weighted_ops, "share": round(n.share, 6)}
+                    for n in self.top(kind, top_k)
+                ]
+                for kind in ROLLUP_KINDS[1:]
+            },
+            "tree": self.root.to_dict(max_depth),
+        }
+
+
+# =============================================================================
+# COST PROFILE EXPORT (FLAMEGRAPH / CHROME TRACE)
+# =============================================================================
+
+# Frame names of loops recorded by the analyzers, e.g. 'for@12'
+_LOOP_FRAME_RE = re.compile(r'^(?:for|while|do)@\d+$')
+
+
+def _result_stacks(results: Dict[str, AnalysisResult]) -> List[Tuple[Tuple[str, ...], int]]:
+    """(module, class, function, loop@line, ...) stacks with their own weighted ops."""
+    stacks = []
+    for module, result in results.items():
+        if result.stack_costs is None:
+            raise ValueError(f"{module}: no frame costs recorded (analyze with track_lines=True)")
+        for stack, cost in result.stack_costs.items():
+            stacks.append(((module,) + stack, cost))
+    return stacks
+
+
+def export_folded_stacks(results: Dict[str, AnalysisResult]) -> str:
+    """
+    Render estimated cost in the folded-stack format read by flamegraph
+    tools (flamegraph.pl, inferno, speedscope): one 'frame;frame;... ops'
+    line per stack. results maps a module label (usually a path) to its
+    analysis.
+    """
+    lines = []
+    for stack, cost in sorted(_result_stacks(results)):
+        # ';' separates frames and whitespace ends the stack in this format
+        frames = [re.sub(r'\s+', '_', frame.replace(';', ':')) for frame in stack]
+        lines.append(f"{';'.join(frames)} {cost}")
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def export_chrome_trace(results: Dict[str, AnalysisResult]) -> dict:
+    """
+    Render estimated cost as Chrome trace-event JSON (chrome://tracing,
+    Perfetto). Each frame becomes a complete ('X') event whose duration is
+    its inclusive weighted ops, one op per microsecond; children are laid
+    out back to back from the start of their parent.
+    """
+    # Frame tree: name -> [own ops, children], in first-seen order
+    root: Dict[str, list] = {}
+    for stack, cost in _result_stacks(results):
+        level = root
+        for frame in stack[:-1]:
+            level = level.setdefault(frame, [0, {}])[1]
+        node = level.setdefault(stack[-1], [0, {}])
+        node[0] = min(node[0] + cost, MAX_OPERATION_COUNT)
+
+    function_names = {
+        (module,) + tuple(func.name.split(".")): func
+        for module, result in results.items() for func in result.functions
+    }
+    events = []
+
+    def emit(level: Dict[str, list], path: Tuple[str, ...], start: int) -> int:
+        for name, (own, children) in level.items():
+            frame_path = path + (name,)
+            end = emit(children, frame_path, start)
+            duration = min(end - start + own, MAX_OPERATION_COUNT)
+            if not path:
+                category = "module"
+            elif _LOOP_FRAME_RE.match(name):
+                category = "loop"
+            elif frame_path in function_names:
+                category = "function"
+            else:
+                category = "class"
+            args = {"weighted_ops": duration, "self_weighted_ops": own}
+            if category == "function":
+                func = function_names[frame_path]
+                args.update(line=func.line_number, complexity=str(func.complexity))
+            events.append({
+                "name": name, "cat": category, "ph": "X", "ts": start, "dur": duration,
+                "pid": 1, "tid": 1, "args": args,
+            })
+            start = min(start + duration, MAX_OPERATION_COUNT)
+        return start
+
+    emit(root, (), 0)
+    return {
+        "traceEvents": events,
+        "displayTimeUnit": "ms",
+        "otherData": {"source": "carbon_footprint_estimator", "unit": "1 us = 1 weighted op"},
+    }
+
+
+# =============================================================================
+# CLI ENTRY POINT
+# =============================================================================
+
+def main():
+    """
+    CLI entry point.
+
+    Modes:
+    1. --file <path>     : analyze a source code file
+    2. (no args)         : read code from stdin (paste & press Ctrl+D / Ctrl+Z)
+    3. --code "<string>" : pass code as a command-line string
+    4. --watch <dir>     : analyze a directory tree and re-analyze files as they change
+    5. --sample <dir>    : fast approximate repository totals from a stratified sample
+    6. --scan <dir>      : analyze every source file in a directory tree
+                           (--jobs N: in parallel, aggregated through shared memory;
+                           --shard i/N: only the i-th of N path-hash shards)
+    7. merge <report>... : combine the reports of sharded scans into one
+
+    --energy-profiles <file> reports each named energy model (TOML/JSON)
+    next to the default one.
+
+    --min-complexity <class> lists the functions whose inferred complexity
+    class is at least <class> (e.g. n^2), worst first.
+
+    --flamegraph <file> / --chrome-trace <file> export the estimated cost as
+    folded stacks or Chrome trace events (module -> class -> function -> loop).
+
+    --calibrate "<entry>" runs a Python workload (script, -m module or
+    module:function) under runtime instrumentation and compares it with the
+    static estimates of the --file / --scan targets.
+
+    --record-baseline / --compare-baseline store or check results against a
+    SQLite baseline (--baseline-db); --budget sets the allowed growth in %.
+
+    Output is always saved to carbon_footprint_result.json
+    """
+    import argparse
+
+    if sys.argv[1:2] == ["merge"]:
+        sys.exit(_merge_command(sys.argv[2:]))
+
+    def complexity_arg(text: str) -> Complexity:
+        try:
+            return Complexity.parse(text)
+        except ValueError as exc:
+            raise argparse.ArgumentTypeError(str(exc)) from None
+
+    def shard_arg(text: str) -> Tuple[int, int]:
+        try:
+            return parse_shard(text)
+        except ValueError as exc:
+            raise argparse.ArgumentTypeError(str(exc)) from None
+
+    parser = argparse.ArgumentParser(
+        description="Estimate carbon footprint of source code via static analysis.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python carbon_footprint_estimator.py --file mycode.py
+  python carbon_footprint_estimator.py --file Main.java --language java
+  python carbon_footprint_estimator.py --code "for i in range(100): print(i)"
+  python carbon_footprint_estimator.py                   # interactive input
+  python carbon_footprint_estimator.py --output result.json
+  python carbon_footprint_estimator.py --file mycode.py --line-costs
+  python carbon_footprint_estimator.py --file mycode.py --min-complexity "n^2"
+  python carbon_footprint_estimator.py --scan src/ --flamegraph cost.folded
+  python carbon_footprint_estimator.py --file mycode.py --chrome-trace trace.json
+  python carbon_footprint_estimator.py --watch src/ --output report.json
+  python carbon_footprint_estimator.py --sample . --sample-fraction 0.05
+  python carbon_footprint_estimator.py --scan src/ --record-baseline
+  python carbon_footprint_estimator.py --scan src/ --jobs 8
+  python carbon_footprint_estimator.py --scan src/ --rollup rollup.json
+  python carbon_footprint_estimator.py --scan . --shard 2/4 --output part2.json
+  python carbon_footprint_estimator.py merge part*.json --output scan.json
+  python carbon_footprint_estimator.py --scan src/ --compare-baseline --budget 5
+  python carbon_footprint_estimator.py --scan src/ --calibrate "-m pytest -q tests"
+  python carbon_footprint_estimator.py --scan src/ --profile-data run.prof --profile-data coverage.xml
+        """,
+    )
+    parser.add_argument("--file", "-f", help="Path to source code file to analyze")
+    parser.add_argument("--code", "-c", help="Source code as a string")
+    parser.add_argument(
+        "--language", "-l",
+        choices=["python", "java", "c", "cpp", "javascript"],
+        help="Programming language (auto-detected if omitted)",
+    )
+    parser.add_argument(
+        "--output", "-o",
+        default=OUTPUT_JSON_PATH,
+        help=f"Output JSON file path (default: {OUTPUT_JSON_PATH})",
+    )
+    parser.add_argument(
+        "--line-costs",
+        action="store_true",
+        help="Include a per-line weighted cost map (for heatmaps) in the output",
+    )
+    parser.add_argument(
+        "--cost-db",
+        help="JSON file of call cost formulas merged over the built-in database",
+    )
+    parser.add_argument(
+        "--watch", "-w", metavar="DIR",
+        help="Watch a directory and incrementally re-analyze changed files",
+    )
+    parser.add_argument(
+        "--debounce", type=float, default=0.3,
+        help="Seconds of quiet before re-analyzing in --watch mode (default: 0.3)",
+    )
+    parser.add_argument(
+        "--sample", metavar="DIR",
+        help="Estimate repository totals from a stratified sample of files",
+    )
+    parser.add_argument(
+        "--sample-fraction", type=float, default=0.1,
+        help="Fraction of files to analyze in --sample mode (default: 0.1)",
+    )
+    parser.add_argument(
+        "--confidence", type=float, default=0.95,
+        help="Confidence level of --sample intervals (default: 0.95)",
+    )
+    parser.add_argument("--seed", type=int, help="Random seed for --sample")
+    parser.add_argument(
+        "--scan", metavar="DIR",
+        help="Analyze every source file below a directory into one aggregated report",
+    )
+    parser.add_argument(
+        "--project-root", metavar="DIR",
+        help="Resolve loop bounds through constants defined in other modules below DIR "
+             "(implied by --scan, --watch and --sample)",
+    )
+    parser.add_argument(
+        "--energy-profiles", metavar="FILE",
+        help="TOML/JSON file of named energy-model profiles to report alongside the default",
+    )
+    parser.add_argument(
+        "--min-complexity", type=complexity_arg, metavar="CLASS",
+        help="List functions whose inferred complexity is at least CLASS, "
+             "e.g. 'n', 'n log n', 'n^2', 'exp'",
+    )
+    parser.add_argument(
+        "--flamegraph", metavar="FILE",
+        help="Write the estimated cost as folded stacks for flamegraph tools",
+    )
+    parser.add_argument(
+        "--chrome-trace", metavar="FILE",
+        help="Write the estimated cost as Chrome trace-event JSON (chrome://tracing, Perfetto)",
+    )
+    parser.add_argument(
+        "--rollup", metavar="FILE",
+        help="Write the cost rolled up by package, module, class and function (JSON)",
+    )
+    parser.add_argument(
+        "--calibrate", metavar="ENTRY",
+        help="Run a Python entry point ('script.py args', '-m module args' or 'module:function') "
+             "under runtime instrumentation and calibrate the --file/--scan estimates against it",
+    )
+    parser.add_argument(
+        "--profile-data", action="append", metavar="FILE",
+        help="cProfile stats or coverage data (.coverage, coverage xml/json, lcov) of a real "
+             "workload; observed counts replace heuristic loop bounds and recursion depths "
+             "(repeatable)",
+    )
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=1,
+        help="Worker processes for --scan; above 1 aggregates totals through shared "
+             "memory and reports per-file totals and hotspots only, without findings, "
+             "energy profiles or complexity classes (default: 1)",
+    )
+    parser.add_argument(
+        "--shard", type=shard_arg, metavar="I/N",
+        help="Scan only the I-th of N deterministic path-hash shards (1-based) and write "
+             "a partial report for 'merge'",
+    )
+    parser.add_argument(
+        "--top-k", type=int, default=10, metavar="K",
+        help="Hotspot functions kept in --jobs / --shard reports (default: 10)",
+    )
+    parser.add_argument(
+        "--baseline-db", default=BASELINE_DB_PATH,
+        help=f"SQLite baseline store (default: {BASELINE_DB_PATH})",
+    )
+    parser.add_argument(
+        "--record-baseline", nargs="?", const="", metavar="COMMIT",
+        help="Record this scan in the baseline store (default commit: git HEAD)",
+    )
+    parser.add_argument(
+        "--compare-baseline", nargs="?", const="", metavar="COMMIT",
+        help="Fail if any function or module exceeds its budget vs. the baseline "
+             "(default: latest recorded scan)",
+    )
+    parser.add_argument(
+        "--budget", type=float, default=10.0,
+        help="Allowed weighted-ops growth in percent for --compare-baseline (default: 10)",
+    )
+
+    args = parser.parse_args()
+    # Frame costs are collected alongside the per-line costs
+    track_lines = args.line_costs or bool(args.flamegraph or args.chrome_trace)
+    energy_profiles = load_energy_profiles(args.energy_profiles) if args.energy_profiles else None
+    profile_index = ProfileIndex.load(args.profile_data) if args.profile_data else None
+
+    if args.calibrate:
+        targets = [t for t in (args.file, args.scan) if t]
+        if not targets:
+            parser.error("--calibrate needs the code to calibrate via --file or --scan")
+        report = calibrate(args.calibrate, targets, project_root=args.project_root or args.scan)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report.to_dict(), f, indent=2, ensure_ascii=False)
+        print(f"  Workload            : {args.calibrate} (exit status {report.exit_status}, {report.backend})")
+        print(f"  Functions executed  : {len(report.functions)} ({len(report.unexecuted)} not executed)")
+        for func in sorted(report.functions, key=lambda f: f.static_weighted_ops, reverse=True)[:10]:
+            ratio = f"{func.ratio:.2f}x" if func.ratio is not None else "n/a"
+            print(f"    {func.name:<30} static {func.static_weighted_ops:>14,}  "
+                  f"measured {func.measured_weighted_ops:>14,.0f}  ({ratio})")
+        print(f"  Fitted loop default : {report.fitted_loop_iterations or 'n/a'} "
+              f"(current {DEFAULT_LOOP_ITERATIONS})")
+        print(f"  Fitted recursion    : {report.fitted_recursion_depth or 'n/a'} "
+              f"(current {DEFAULT_RECURSION_DEPTH})")
+        print(f"  Full results saved to: {args.output}")
+        sys.exit(report.exit_status)
+
+    if args.watch:
+        def report(session: WatchSession, changed: List[str]):
+            print(f"  Re-analyzed {len(changed)} file(s) — total weighted ops: "
+                  f"{session.total_weighted_ops:,} ({len(session.errors)} error(s)) -> {session.output_path}")
+
+        print(f"  Watching {args.watch} (Ctrl+C to stop)")
+        try:
+            watch_directory(
+                args.watch, args.output, debounce=args.debounce, on_update=report,
+                track_lines=args.line_costs, energy_profiles=energy_profiles,
+                cost_database=CostDatabase.load(args.cost_db) if args.cost_db else None,
+                profile_data=profile_index,
+            )
+        except KeyboardInterrupt:
+            print("\nStopped watching.")
+        return
+
+    if args.shard and not args.scan:
+        parser.error("--shard needs --scan")
+
+    if args.scan and (args.jobs > 1 or args.shard):
+        if args.flamegraph or args.chrome_trace:
+            parser.error("--flamegraph/--chrome-trace need per-file results; use --scan without --jobs/--shard")
+        if args.energy_profiles or args.min_complexity is not None:
+            parser.error("--energy-profiles/--min-complexity need per-file results; "
+                         "use --scan without --jobs/--shard")
+        cost_database = CostDatabase.load(args.cost_db) if args.cost_db else None
+        if args.jobs > 1:
+            aggregate = parallel_scan(
+                args.scan, max_workers=args.jobs, shard=args.shard, track_lines=args.line_costs,
+                cost_database=cost_database, profile_data=profile_index,
+            )
+        else:
+            session = WatchSession(args.scan, args.output, track_lines=args.line_costs,
+                                   cost_database=cost_database, profile_data=profile_index)
+            session.update(iter_shard_files(args.scan, args.shard))
+            aggregate = ScanAggregate(root=args.scan, shards=[args.shard[0]], shard_count=args.shard[1])
+            for path, result in session.results.items():
+                aggregate.add_result(os.path.relpath(path, args.scan), result)
+            aggregate.errors = {os.path.relpath(path, args.scan): e for path, e in session.errors.items()}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(aggregate.to_dict(args.top_k), f, indent=2, ensure_ascii=False)
+        if args.shard:
+            print(f"  Shard               : {args.shard[0] + 1}/{args.shard[1]}")
+        print(f"  Files analyzed      : {len(aggregate.file_weighted_ops)} ({len(aggregate.errors)} error(s))")
+        print(f"  Total weighted ops  : {aggregate.total_weighted_ops:,}")
+        print("  Energy findings     : not collected with --jobs/--shard (use --scan alone)")
+        print(f"  Full results saved to: {args.output}")
+        _write_rollup(args, aggregate.cost_rows(), args.scan)
+        sys.exit(_run_baseline_actions(args, aggregate.cost_rows(), args.scan))
+
+    if args.scan:
+        session = WatchSession(
+            args.scan, args.output, track_lines=track_lines, energy_profiles=energy_profiles,
+            cost_database=CostDatabase.load(args.cost_db) if args.cost_db else None,
+            profile_data=profile_index,
+        )
+        session.update(iter_source_files(args.scan))
+        session.write_report()
+        print(f"  Files analyzed      : {len(session.results)} ({len(session.errors)} error(s))")
+        print(f"  Total weighted ops  : {session.total_weighted_ops:,}")
+        print(f"  Full results saved to: {args.output}")
+        results = {os.path.relpath(path, args.scan): r for path, r in session.results.items()}
+        _print_findings(results)
+        if args.min_complexity is not None:
+            _print_complex_functions(results, args.min_complexity)
+        _write_cost_exports(args, results)
+        _write_rollup(args, results, args.scan)
+        sys.exit(_run_baseline_actions(args, results, args.scan))
+
+    if args.sample:
+        estimate = None
+        for estimate in sample_repository(
+            args.sample, fraction=args.sample_fraction, confidence=args.confidence, seed=args.seed,
+            cost_database=CostDatabase.load(args.cost_db) if args.cost_db else None,
+            profile_data=profile_index,
+        ):
+            print(f"  {estimate.files_analyzed:>6}/{estimate.files_total} files — "
+                  f"~{estimate.total_weighted_ops:,.0f} weighted ops "
+                  f"[{estimate.ci_low:,.0f} – {estimate.ci_high:,.0f}] "
+                  f"({estimate.confidence:.0%} CI)")
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(estimate.to_dict(), f, indent=2, ensure_ascii=False)
+        print(f"  Full results saved to: {args.output}")
+        return
+
+    code = None
+    file_path = None
+
+    if args.file:
+        file_path = args.file
+    elif args.code:
+        code = args.code
+    else:
+        # Interactive: read from stdin
+        print("=" * 60)
+        print("  CARBON FOOTPRINT ESTIMATOR — Interactive Mode")
+        print("=" * 60)
+        print()
+        print("Paste your source code below.")
+        print("When done, press Enter then Ctrl+Z (Windows) or Ctrl+D (Unix).")
+        print("-" * 60)
+        try:
+            code = sys.stdin.read()
+        except KeyboardInterrupt:
+            print("\nAborted.")
+            sys.exit(0)
+
+        if not code or not code.strip():
+            print("Error: No code provided.")
+            sys.exit(1)
+
+    # Run analysis
+    result = estimate_carbon_footprint(
+        code=code, file_path=file_path, language=args.language, track_lines=track_lines,
+        cost_database=args.cost_db, energy_profiles=energy_profiles, project_root=args.project_root,
+        profile_data=profile_index,
+    )
+
+    # Save to JSON
+    out_path = save_result_json(result, args.output)
+
+    # Also print a brief summary to console
+    print()
+    print("=" * 60)
+    print("  CARBON FOOTPRINT RESULT")
+    print("=" * 60)
+    print(f"  Language            : {result.language.upper()}")
+    print(f"  Functions analyzed  : {len(result.functions)}")
+    print(f"  Total weighted ops  : {result.total_weighted_ops:,}")
+    print(f"  Energy (Joules)     : {result.energy_joules:.6e}")
+    print(f"  Energy (kWh)        : {result.energy_kwh:.6e}")
+    print(f"  Carbon (gCO2)       : {result.carbon_grams:.6e}")
+    print(f"  Carbon (mgCO2)      : {result.carbon_grams * 1000:.6e}")
+    if result.memory is not None:
+        print(f"  Memory allocated    : {result.memory.allocated_bytes:,} bytes")
+        print(f"  Peak live memory    : {result.memory.peak_bytes:,} bytes")
+    if result.unbounded:
+        print("  WARNING: operation counts saturated; estimate is an unbounded lower bound")
+
+    if result.energy_profiles:
+        print()
+        print("  Energy profiles:")
+        for name, costs in result.profile_report().items():
+            print(f"    {name:<18}: {costs['carbon_grams_CO2']:.6e} gCO2 "
+                  f"({costs['total_weighted_operations']:,.0f} weighted ops)")
+
+    if result.hotspots:
+        print()
+        print("  Top hotspot functions:")
+        for i, f in enumerate(result.hotspots, 1):
+            pct = (f.weighted_ops / result.total_weighted_ops * 100) if result.total_weighted_ops > 0 else 0
+            print(f"    {i}. {f.name} — {f.weighted_ops:,} ops ({pct:.1f}%)")
+
+    if result.cells:
+        print()
+        print("  Top notebook cells:")
+        for cell in sorted(result.cells, key=lambda c: c.weighted_ops, reverse=True)[:5]:
+            pct = (cell.weighted_ops / result.total_weighted_ops * 100) if result.total_weighted_ops > 0 else 0
+            label = f"[{cell.execution_count}]" if cell.execution_count is not None else "[ ]"
+            print(f"    cell {cell.index} {label} — {cell.weighted_ops:,} ops ({pct:.1f}%)")
+
+    if result.findings:
+        _print_findings({file_path or "<code>": result})
+
+    allocating = sorted((f for f in result.functions if f.memory is not None and f.memory.allocated_bytes),
+                        key=lambda f: f.memory.allocated_bytes, reverse=True)[:5]
+    if allocating:
+        print()
+        print("  Top allocating functions:")
+        for i, f in enumerate(allocating, 1):
+            print(f"    {i}. {f.name} — {f.memory.allocated_bytes:,} bytes allocated, "
+                  f"{f.memory.peak_bytes:,} peak")
+
+    if args.min_complexity is not None:
+        _print_complex_functions({file_path or "<code>": result}, args.min_complexity)
+
+    _write_cost_exports(args, {os.path.basename(file_path) if file_path else "<code>": result})
+    _write_rollup(args, {os.path.basename(file_path) if file_path else "<code>": result}, file_path or ".")
+
+    print()
+    print(f"  Full results saved to: {out_path}")
+    print("=" * 60)
+
+    if file_path:
+        sys.exit(_run_baseline_actions(args, {os.path.basename(file_path): result},
+                                       os.path.dirname(os.path.abspath(file_path))))
+
+
+def _print_complex_functions(results: Dict[str, AnalysisResult], threshold: Complexity):
+    """Print functions whose complexity class is at least threshold, worst first."""
+    matches = [
+        (func.complexity, func.weighted_ops, name, func)
+        for name, result in results.items() for func in result.functions
+        if func.complexity >= threshold
+    ]
+    matches.sort(key=lambda m: (m[0], m[1]), reverse=True)
+    print()
+    print(f"  Functions at or above {threshold}: {len(matches)}")
+    for complexity, weighted_ops, name, func in matches:
+        print(f"    {str(complexity):<12} {name}:{func.line_number} {func.name} — {weighted_ops:,} ops")
+
+
+def _print_findings(results: Dict[str, AnalysisResult], limit: int = 10):
+    """Print the energy anti-patterns with the largest estimated savings."""
+    findings = [(name, finding) for name, result in results.items() for finding in result.findings]
+    if not findings:
+        return
+    findings.sort(key=lambda f: f[1].estimated_savings, reverse=True)
+    print()
+    print(f"  Energy anti-patterns: {len(findings)} (largest estimated savings first)")
+    for name, finding in findings[:limit]:
+        print(f"    {name}:{finding.line} {finding.message} — saves ~{finding.estimated_savings:,} ops")
+        print(f"        fix: {finding.suggestion}")
+
+
+def _merge_command(argv: List[str]) -> int:
+    """`merge` subcommand: combine sharded scan reports into one."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="carbon_footprint_estimator.py merge",
+        description="Merge the reports of sharded or parallel scans (--scan --shard i/N) into one.",
+    )
+    parser.add_argument("reports", nargs="+", metavar="REPORT", help="Scan report JSON files")
+    parser.add_argument(
+        "--output", "-o", default=OUTPUT_JSON_PATH,
+        help=f"Merged report path (default: {OUTPUT_JSON_PATH})",
+    )
+    parser.add_argument(
+        "--top-k", type=int, default=10, metavar="K",
+        help="Hotspot functions kept in the merged report (default: 10)",
+    )
+    args = parser.parse_args(argv)
+
+    reports = []
+    for path in args.reports:
+        with open(path, encoding="utf-8") as f:
+            reports.append(json.load(f))
+    try:
+        merged = merge_scan_reports(reports)
+    except (ValueError, KeyError) as exc:
+        parser.error(f"cannot merge: {exc}")
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(merged.to_dict(args.top_k), f, indent=2, ensure_ascii=False)
+
+    missing = sorted(set(range(merged.shard_count)) - set(merged.shards))
+    print(f"  Reports merged      : {len(reports)} ({len(merged.shards)}/{merged.shard_count} shards)")
+    if missing:
+        print(f"  WARNING: missing shard(s) {', '.join(str(i + 1) for i in missing)}")
+    print(f"  Files analyzed      : {len(merged.file_weighted_ops)} ({len(merged.errors)} error(s))")
+    print(f"  Total weighted ops  : {merged.total_weighted_ops:,}")
+    print(f"  Full results saved to: {args.output}")
+    return 0
+
+
+def _write_cost_exports(args, results: Dict[str, AnalysisResult]):
+    """Handle --flamegraph / --chrome-trace."""
+    if args.flamegraph:
+        with open(args.flamegraph, "w", encoding="utf-8") as f:
+            f.write(export_folded_stacks(results))
+        print(f"  Flamegraph stacks saved to: {args.flamegraph}")
+    if args.chrome_trace:
+        with open(args.chrome_trace, "w", encoding="utf-8") as f:
+            json.dump(export_chrome_trace(results), f)
+        print(f"  Chrome trace saved to: {args.chrome_trace}")
+
+
+def _write_rollup(args, results: Dict[str, Union[AnalysisResult, list]], root: str):
+    """Handle --rollup: save the hierarchy and print the most expensive packages."""
+    if not args.rollup:
+        return
+    rollup = CostRollup.build(results, root=root)
+    with open(args.rollup, "w", encoding="utf-8") as f:
+        json.dump(rollup.to_dict(args.top_k), f, indent=2, ensure_ascii=False)
+    packages = rollup.top("package", 5)
+    if packages:
+        print("  Top packages:")
+        for node in packages:
+            print(f"    {node.key:<40} {node.weighted_ops:>16,} ops ({node.share:.1%}, "
+                  f"{node.functions} functions)")
+    print(f"  Roll-up saved to: {args.rollup}")
+
+
+def _run_baseline_actions(args, results: Dict[str, Union[AnalysisResult, list]], root: str) -> int:
+    """
+    Handle --record-baseline / --compare-baseline for results keyed by paths
+    relative to the root directory; returns the process exit code.
+    """
+    if args.record_baseline is None and args.compare_baseline is None:
+        return 0
+
+    with BaselineStore(args.baseline_db) as store:
+        exit_code = 0
+        if args.compare_baseline is not None:
+            try:
+                violations = store.compare(
+                    results, threshold_percent=args.budget, commit_id=args.compare_baseline or None,
+                    root=root,
+                )
+            except LookupError as e:
+                print(f"  Error: {e}")
+                return 2
+            if violations:
+                exit_code = 1
+                print(f"  Carbon budget exceeded (> {args.budget:g}% growth):")
+                for v in violations:
+                    label = f"{v.file}" if v.name == MODULE_ROW_NAME else f"{v.file}::{v.name}"
+                    print(f"    {label}: {v.baseline_ops:,} -> {v.current_ops:,} ops "
+                          f"(+{v.growth_percent:.1f}%)")
+            else:
+                print(f"  Carbon budget OK (<= {args.budget:g}% growth vs. baseline)")
+        if args.record_baseline is not None:
+            commit_id = args.record_baseline or current_commit_id(root)
+            store.record_scan(commit_id, results, root=root)
+            print(f"  Baseline recorded for {commit_id} in {args.baseline_db}")
+    return exit_code
 
 
 if __name__ == "__main__":
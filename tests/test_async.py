@@ -0,0 +1,46 @@
+"""AsyncEstimator across event loops."""
+import asyncio
+
+from carbon_footprint_estimator import AsyncEstimator
+
+
+def test_estimator_survives_successive_event_loops():
+    estimator = AsyncEstimator(max_workers=2, max_in_flight=2)
+
+    async def batch():
+        # More requests than max_in_flight, so some wait on the semaphore
+        results = await asyncio.gather(*[
+            estimator.estimate(code=f"x = {i}", language="python") for i in range(6)
+        ])
+        return len(results)
+
+    try:
+        assert asyncio.run(batch()) == 6
+        assert asyncio.run(batch()) == 6
+    finally:
+        estimator.close()
+
+
+def test_timed_out_job_keeps_its_slot_until_it_finishes():
+    estimator = AsyncEstimator(max_workers=1, max_in_flight=1)
+    slow = "x = 1\n" * 30_000
+
+    async def run():
+        # Warm the pool up so the timeout hits a running job, not process start-up
+        await estimator.estimate(code="x = 1", language="python")
+        try:
+            await estimator.estimate(code=slow, language="python", timeout=0.01)
+        except asyncio.TimeoutError:
+            pass
+        semaphore = estimator._get_semaphore()
+        assert semaphore.locked()
+        for _ in range(600):
+            if not semaphore.locked():
+                return
+            await asyncio.sleep(0.05)
+        raise AssertionError("slot never released")
+
+    try:
+        asyncio.run(run())
+    finally:
+        estimator.close()
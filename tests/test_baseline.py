@@ -0,0 +1,27 @@
+"""BaselineStore comparisons."""
+import os
+
+import pytest
+
+from carbon_footprint_estimator import BaselineStore, MODULE_ROW_NAME
+
+
+def rows(ops):
+    return [(MODULE_ROW_NAME, ops), ("f", ops)]
+
+
+def test_file_keys_are_mapped_onto_the_baseline_root(tmp_path):
+    root = str(tmp_path)
+    with BaselineStore(str(tmp_path / "baseline.db")) as store:
+        store.record_scan("c1", {os.path.join("pkg", "a.py"): rows(100), os.path.join("other", "a.py"): rows(10)},
+                          root=root)
+        # A single-file run keys by basename relative to the file's directory
+        violations = store.compare({"a.py": rows(113)}, root=os.path.join(root, "pkg"))
+    assert [(v.file, v.name) for v in violations] == [("pkg/a.py", MODULE_ROW_NAME), ("pkg/a.py", "f")]
+
+
+def test_no_matching_rows_is_an_error(tmp_path):
+    with BaselineStore(str(tmp_path / "baseline.db")) as store:
+        store.record_scan("c1", {"a.py": rows(100)}, root=str(tmp_path))
+        with pytest.raises(LookupError):
+            store.compare({"b.py": rows(100)}, root=str(tmp_path))
@@ -0,0 +1,37 @@
+"""Call classification and the call cost database."""
+import textwrap
+
+import pytest
+
+from carbon_footprint_estimator import MAX_OPERATION_COUNT, CostDatabase, OpType, PythonAnalyzer
+
+
+def counts(code):
+    result = PythonAnalyzer().analyze(textwrap.dedent(code))
+    return {function.name: function.operations.counts for function in result.functions}
+
+
+def test_methods_on_unknown_receivers_are_not_network_calls():
+    functions = counts("""
+        import requests
+
+        def lookup(d):
+            return d.get("k")
+
+        def position(xs):
+            return xs.index(3)
+
+        def download(url):
+            return requests.get(url)
+    """)
+    assert functions["lookup"].get(OpType.NETWORK_OP, 0) == 0
+    assert functions["lookup"][OpType.ARRAY_ACCESS] == 1
+    assert functions["position"][OpType.COMPARISON] > 1
+    assert functions["download"][OpType.NETWORK_OP] == 1
+
+
+def test_formulas_reject_pow_and_clamp_counts():
+    with pytest.raises(ValueError):
+        CostDatabase({"f": {"addition": "2 ** n"}})
+    cost = CostDatabase({"f": {"addition": "n * n * n"}}).lookup("f")
+    assert cost.evaluate(10 ** 9) == [(OpType.ADDITION, MAX_OPERATION_COUNT)]
@@ -0,0 +1,50 @@
+"""Collection lengths inferred through loops (PythonAnalyzer._infer_container_lengths)."""
+import textwrap
+
+from carbon_footprint_estimator import OpType, PythonAnalyzer
+
+
+def analyze(code):
+    analyzer = PythonAnalyzer()
+    return analyzer, analyzer.analyze(textwrap.dedent(code))
+
+
+def test_loop_body_sees_mean_length_of_growing_list():
+    analyzer, result = analyze("""
+        def f():
+            xs = []
+            for i in range(1000):
+                xs.append(i)
+                t = sum(xs)
+                for y in xs:
+                    pass
+    """)
+    # The inner loop runs over about half of the final 1000 elements on average
+    iterations, _ = analyzer._loop_bounds[7]
+    assert 400 <= iterations <= 600
+    assert result.functions[0].weighted_ops > 1000 * 400
+
+
+def test_front_insert_in_loop_costs_shift_of_mean_length():
+    _, result = analyze("""
+        def g(items):
+            out = []
+            for i in items:
+                out.insert(0, i)
+            return out
+    """)
+    # list.insert shifts the elements already in the list: ~50 per call over 100 iterations
+    assignments = result.functions[0].operations.counts.get(OpType.ASSIGNMENT, 0)
+    assert assignments >= 100 * 40
+
+
+def test_length_known_after_loop_is_unchanged():
+    analyzer, _ = analyze("""
+        def h():
+            xs = []
+            for i in range(10):
+                xs.append(i)
+            for y in xs:
+                pass
+    """)
+    assert analyzer._loop_bounds[6] == (10, False)
@@ -0,0 +1,63 @@
+"""Energy anti-pattern findings (PythonAnalyzer rules)."""
+import textwrap
+
+from carbon_footprint_estimator import PythonAnalyzer
+
+
+def analyze(code):
+    return PythonAnalyzer().analyze(textwrap.dedent(code))
+
+
+def findings_by_rule(result):
+    return {finding.rule: finding for finding in result.findings}
+
+
+def test_string_concat_copies_are_counted():
+    result = analyze("""
+        def g(n):
+            out = ""
+            for i in range(n):
+                out += str(i)
+            return out
+    """)
+    finding = findings_by_rule(result)["string-concat-in-loop"]
+    assert finding.estimated_savings <= result.functions[0].weighted_ops
+    # The quadratic copying is part of the estimate, not just of the saving
+    assert result.functions[0].weighted_ops > 100 * 50
+
+
+def test_savings_capped_at_counted_ops():
+    result = analyze("""
+        def a(out, n):
+            for i in range(n):
+                out.insert(0, i)
+
+        def d(n, ys):
+            xs = list(ys)
+            t = 0
+            for i in range(n):
+                if i in xs:
+                    t += 1
+            return t
+    """)
+    costs = {function.name: function.weighted_ops for function in result.functions}
+    assert {"list-front-insert", "list-membership-in-loop"} <= set(findings_by_rule(result))
+    for finding in result.findings:
+        assert 0 < finding.estimated_savings <= costs[finding.function]
+
+
+def test_string_concat_by_reassignment_is_detected():
+    result = analyze("""
+        def g(xs):
+            s = ""
+            for x in xs:
+                s = s + str(x)
+            t = 0
+            for x in xs:
+                t = t + x
+            return s, t
+    """)
+    findings = [finding for finding in result.findings if finding.rule == "string-concat-in-loop"]
+    assert [finding.line for finding in findings] == [5]
+    assert "s = s + ..." in findings[0].message
+    assert findings[0].estimated_savings <= result.functions[0].weighted_ops
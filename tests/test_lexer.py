@@ -0,0 +1,36 @@
+"""C-family lexer (lex_c_family)."""
+from carbon_footprint_estimator import RegexAnalyzer, lex_c_family
+
+
+def clean(code, regex_literals=True):
+    return lex_c_family(code, regex_literals=regex_literals)[0]
+
+
+def test_regex_literal_with_quote_opens_no_string():
+    code = 's.replace(/"/g, ""); for (let i=0;i<9;i++) { t += i; }'
+    assert clean(code) == 's.replace("", ""); for (let i=0;i<9;i++) { t += i; }'
+
+
+def test_regex_after_keyword_and_with_slash_in_class():
+    assert clean('return /[/"]+/i.test(s); // done') == 'return "".test(s); '
+    assert clean("if (x) { y = /'/.exec(s); }") == 'if (x) { y = "".exec(s); }'
+
+
+def test_division_is_not_a_regex():
+    for code in ('x = a / b / c; y = "q"', "r = (a)/2; z = 'x'", "y = i++ / 2; z = w / 3"):
+        assert clean(code).count("/") == code.count("/")
+
+
+def test_regex_literals_only_when_enabled():
+    # C, C++ and Java have no regex literals: the quote still opens a string
+    assert clean('x = (/"/);', regex_literals=False) == 'x = (/""'
+
+
+def test_javascript_loop_after_regex_is_analyzed():
+    code = 'function f(s) {\n  s.replace(/"/g, ""); for (let i=0;i<9;i++) { t += i; }\n}\n'
+    without_loop = 'function f(s) {\n  s.replace(/"/g, "");\n}\n'
+
+    def weighted(source):
+        return RegexAnalyzer("javascript").analyze(source).total_weighted_ops
+
+    assert weighted(code) == weighted(code.replace('/"/g', "/x/g")) > weighted(without_loop)
@@ -0,0 +1,31 @@
+"""Loop bounds resolved from constant expressions."""
+import textwrap
+
+import pytest
+
+from carbon_footprint_estimator import MAX_OPERATION_COUNT, PythonAnalyzer
+
+
+def nested_loops(bound, depth=5):
+    lines = ["def f():", "    t = 0"]
+    for level in range(depth):
+        lines.append("    " * (level + 1) + f"for i{level} in range({bound}):")
+    lines.append("    " * (depth + 1) + "t += 1")
+    return "\n".join(lines) + "\n"
+
+
+@pytest.mark.parametrize("bound", ["10000", "10**4", "10 ** 10 ** 6"])
+def test_power_bounds_saturate_like_literals(bound):
+    function = PythonAnalyzer().analyze(nested_loops(bound)).functions[0]
+    assert function.operations.unbounded
+    assert function.weighted_ops == MAX_OPERATION_COUNT
+
+
+def test_power_bound_resolves():
+    analyzer = PythonAnalyzer()
+    analyzer.analyze(textwrap.dedent("""
+        def f():
+            for i in range(2 ** 5):
+                pass
+    """))
+    assert analyzer._loop_bounds[3] == (32, False)
@@ -0,0 +1,36 @@
+"""Allocated and peak live bytes (PythonAnalyzer memory model)."""
+import textwrap
+
+from carbon_footprint_estimator import PythonAnalyzer
+
+
+def memory(code):
+    result = PythonAnalyzer().analyze(textwrap.dedent(code))
+    return {function.name: function.memory for function in result.functions}
+
+
+def test_containers_appended_to_a_retained_list_stay_live():
+    functions = memory("""
+        def f():
+            out = []
+            for i in range(1000):
+                out.append([0] * 100)
+            return out
+
+        def g():
+            out = []
+            for i in range(1000):
+                out.extend([[0] * 100])
+            return out
+
+        def h():
+            out = []
+            for i in range(1000):
+                out.append(i)
+            return out
+    """)
+    # 1000 lists of 100 pointers (~856 bytes each) outlive the loop
+    for name in ("f", "g"):
+        assert 850_000 < functions[name].peak_bytes < 1_000_000
+        assert functions[name].peak_bytes <= functions[name].allocated_bytes
+    assert functions["h"].peak_bytes < 10_000
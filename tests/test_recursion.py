@@ -0,0 +1,31 @@
+"""Recursion shape inferred by PythonAnalyzer._analyze_recursion."""
+import textwrap
+
+from carbon_footprint_estimator import PythonAnalyzer
+
+
+def analyze(code):
+    result = PythonAnalyzer().analyze(textwrap.dedent(code))
+    return {function.name: function for function in result.functions}
+
+
+def test_early_return_branch_is_an_alternative_to_the_rest():
+    functions = analyze("""
+        def bs(xs, t, lo, hi):
+            if lo >= hi:
+                return -1
+            mid = (lo + hi) // 2
+            if xs[mid] < t:
+                return bs(xs, t, mid + 1, hi)
+            return bs(xs, t, lo, mid)
+
+        def fib(n):
+            if n < 2:
+                return n
+            return fib(n - 1) + fib(n - 2)
+    """)
+    assert functions["bs"].recursion.calls_per_activation == 1
+    assert functions["bs"].recursion.growth == "logarithmic"
+    assert str(functions["bs"].complexity) == "O(log n)"
+    # Both calls on one path still add up
+    assert functions["fib"].recursion.calls_per_activation == 2
@@ -0,0 +1,17 @@
+"""Stratified repository sampling (sample_repository)."""
+from carbon_footprint_estimator import sample_repository
+
+
+def test_no_estimate_before_every_stratum_is_sampled(tmp_path):
+    for i in range(3):
+        (tmp_path / f"m{i}.py").write_text(f"for i in range({10 ** i}):\n    x = i * 2\n")
+        (tmp_path / f"m{i}.js").write_text(f"for (let i = 0; i < {10 ** i}; i++) {{ x += i; }}\n")
+    snapshots = list(sample_repository(str(tmp_path), fraction=1.0, seed=1, report_every=1))
+
+    # Two strata (Python and JavaScript, one size bucket): the first estimate
+    # waits for one file of each and reports a real interval
+    first = snapshots[0]
+    assert first.files_analyzed == 2
+    assert set(first.by_language) == {"python", "javascript"}
+    assert first.ci_low < first.total_weighted_ops < first.ci_high
+    assert snapshots[-1].is_exact
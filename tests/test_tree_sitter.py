@@ -0,0 +1,34 @@
+"""TreeSitterAnalyzer (skipped when the tree-sitter grammars are not installed)."""
+import pytest
+
+from carbon_footprint_estimator import TREE_SITTER_GRAMMARS, TreeSitterAnalyzer, get_tree_sitter_parser
+
+
+def analyze(language, code):
+    if get_tree_sitter_parser(TREE_SITTER_GRAMMARS[language]) is None:
+        pytest.skip(f"tree-sitter grammar for {language} not installed")
+    result = TreeSitterAnalyzer(language).analyze(code)
+    return {function.name: function for function in result.functions}, result
+
+
+@pytest.mark.parametrize("language, code", [
+    # A compound assignment records no value
+    ("c", "int g(int n) { n /= 2; return n; }\n"
+          "int f(int n) { int s = 0; for (int i = 0; i < n; i++) { s += i; } return s; }\n"),
+    # Locals of one function do not leak into another's parameter
+    ("java", "class A { int g() { int n = 3; return n; }\n"
+             " int f(int n) { int s = 0; for (int i = 0; i < n; i++) { s += i; } return s; } }\n"),
+    ("javascript", "function g() { let n = 0; return n; }\n"
+                   "function f(n) { let s = 0; for (let i = 0; i < n; i++) { s += i; } return s; }\n"),
+])
+def test_constants_are_scoped_per_function(language, code):
+    functions, result = analyze(language, code)
+    f = next(function for name, function in functions.items() if name.endswith("f"))
+    assert str(f.complexity) == "O(n)"
+    assert "Line 2: for-loop estimated 100 iterations" in result.assumptions
+
+
+def test_constants_resolve_in_source_order():
+    _, result = analyze("c", "int h() { int m = 10; int k = m * 2; int s = 0;\n"
+                             "  for (int i = 0; i < k; i++) { s += i; } return s; }\n")
+    assert "Line 2: for-loop estimated 20 iterations" in result.assumptions
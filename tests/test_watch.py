@@ -0,0 +1,81 @@
+"""Watch mode: inotify events and the per-file results they invalidate."""
+import json
+import os
+import sys
+
+import pytest
+
+import carbon_footprint_estimator
+from carbon_footprint_estimator import WatchSession, _InotifyWatcher, iter_source_files
+
+linux_only = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux-only")
+
+
+def write(path, code="x = 1\n"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(code)
+
+
+def drain(watcher):
+    changed = set()
+    while True:
+        more = watcher.wait_for_changes(timeout=0.2)
+        if not more:
+            return changed
+        changed |= more
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "w"
+    write(str(root / "d1" / "m.py"))
+    write(str(root / "d1" / "sub" / "n.py"))
+    session = WatchSession(str(root), output_path=str(tmp_path / "report.json"))
+    session.update(iter_source_files(str(root)))
+    watcher = _InotifyWatcher(str(root))
+    yield root, session, watcher
+    watcher.close()
+
+
+@linux_only
+def test_directory_moved_out_drops_its_files(tree, tmp_path):
+    root, session, watcher = tree
+    os.rename(root / "d1", tmp_path / "elsewhere")
+    session.update(drain(watcher))
+    assert session.results == {}
+    assert session.total_weighted_ops == 0
+    # The moved directory's watches are gone, so edits there go unreported
+    assert not any(path.startswith(str(root / "d1")) for path in watcher._dirs.values())
+    write(str(tmp_path / "elsewhere" / "m.py"), "y = 2\n")
+    assert drain(watcher) == set()
+
+
+@linux_only
+def test_directory_renamed_in_tree_moves_its_files(tree):
+    root, session, watcher = tree
+    os.rename(root / "d1", root / "d2")
+    session.update(drain(watcher))
+    assert sorted(session.results) == [str(root / "d2" / "m.py"), str(root / "d2" / "sub" / "n.py")]
+    write(str(root / "d2" / "sub" / "n.py"), "y = 2\n")
+    assert drain(watcher) == {str(root / "d2" / "sub" / "n.py")}
+
+
+def test_unexpected_analyzer_error_stays_with_its_file(tmp_path, monkeypatch):
+    write(str(tmp_path / "good.py"))
+    write(str(tmp_path / "bad.py"))
+    estimate = carbon_footprint_estimator.estimate_carbon_footprint
+
+    def flaky(file_path=None, **options):
+        if file_path.endswith("bad.py"):
+            raise RuntimeError("parser crashed")
+        return estimate(file_path=file_path, **options)
+
+    monkeypatch.setattr(carbon_footprint_estimator, "estimate_carbon_footprint", flaky)
+    session = WatchSession(str(tmp_path), output_path=str(tmp_path / "report.json"))
+    session.update(iter_source_files(str(tmp_path)))
+    bad = str(tmp_path / "bad.py")
+    assert sorted(session.results) == [str(tmp_path / "good.py")]
+    assert session.errors == {bad: "RuntimeError: parser crashed"}
+    with open(session.write_report()) as f:
+        assert json.load(f)["files"][bad] == {"error": "RuntimeError: parser crashed"}